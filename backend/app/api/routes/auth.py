@@ -1,16 +1,16 @@
-from datetime import timedelta
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordRequestForm
-from app.services.auth import AuthService, UserCreate, UserLogin, Token
-from app.services.billing import billing_service
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.session import get_db
+from app.services.auth import auth_service, UserCreate, UserLogin, RefreshRequest, Token
+from app.services.billing import customer_provisioner
 
 router = APIRouter()
-auth_service = AuthService()
 
 @router.post("/register", response_model=dict)
-async def register(user: UserCreate):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     # Check if user already exists
-    existing_user = await auth_service.get_user_by_email(user.email)
+    existing_user = await auth_service.get_user_by_email(user.email, db)
     if existing_user:
         raise HTTPException(
             status_code=400,
@@ -18,24 +18,23 @@ async def register(user: UserCreate):
         )
     
     # Hash password
-    hashed_password = auth_service.get_password_hash(user.password)
+    hashed_password = await auth_service.get_password_hash(user.password)
     
     # Create user in database
-    # db_user = await create_user_in_db(user.email, hashed_password, user.name)
+    db_user = await auth_service.create_user(user.email, hashed_password, user.name, db)
     
-    # Create Stripe customer
-    stripe_result = await billing_service.create_customer(user.email, user.name)
+    # Create the Stripe customer in the background so signup doesn't wait on Stripe
+    customer_provisioner.submit(db_user.id, user.email, user.name)
     
-    # Create access token
-    access_token_expires = timedelta(minutes=30)
-    access_token = auth_service.create_access_token(
-        data={"sub": str("user_id")}, expires_delta=access_token_expires
-    )
+    # Create access and refresh tokens
+    tokens = await auth_service.issue_tokens(db_user.id, "free")
     
     return {
-        "access_token": access_token,
+        "access_token": tokens["access_token"],
+        "refresh_token": tokens["refresh_token"],
         "token_type": "bearer",
         "user": {
+            "id": db_user.id,
             "email": user.email,
             "name": user.name,
             "subscription_tier": "free"
@@ -43,23 +42,21 @@ async def register(user: UserCreate):
     }
 
 @router.post("/login", response_model=Token)
-async def login(user_credentials: UserLogin):
+async def login(user_credentials: UserLogin, db: AsyncSession = Depends(get_db)):
     # Authenticate user
-    user = await auth_service.get_user_by_email(user_credentials.email)
-    if not user or not auth_service.verify_password(user_credentials.password, user.password_hash):
+    user = await auth_service.get_user_by_email(user_credentials.email, db)
+    if not user or not await auth_service.verify_password(user_credentials.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
     
-    # Create access token
-    access_token_expires = timedelta(minutes=30)
-    access_token = auth_service.create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires
-    )
+    # Create access and refresh tokens
+    tokens = await auth_service.issue_tokens(user.id, user.subscription_tier)
     
     return {
-        "access_token": access_token,
+        "access_token": tokens["access_token"],
+        "refresh_token": tokens["refresh_token"],
         "token_type": "bearer",
         "user": {
             "id": user.id,
@@ -69,6 +66,22 @@ async def login(user_credentials: UserLogin):
         }
     }
 
+@router.post("/refresh")
+async def refresh_token(request: RefreshRequest):
+    # Re-issue tokens with the user's current entitlements
+    tokens = await auth_service.refresh_tokens(request.refresh_token)
+    return {
+        "access_token": tokens["access_token"],
+        "refresh_token": tokens["refresh_token"],
+        "token_type": "bearer"
+    }
+
+@router.post("/logout")
+async def logout(request: RefreshRequest):
+    # Revoke the session's refresh token; its access token lapses on its own
+    await auth_service.revoke_refresh_token(request.refresh_token)
+    return {"success": True}
+
 @router.get("/me")
 async def get_current_user_info(current_user = Depends(auth_service.get_current_user)):
     return {
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
 from app.services.auth import get_current_user
-from app.services.billing import billing_service, PRICING_PLANS
+from app.services.billing import billing_service, customer_provisioner, PRICING_PLANS
+from app.services.provisioning import ProvisioningError
 from app.services.usage import usage_service
 
 router = APIRouter()
@@ -20,11 +21,22 @@ async def create_checkout_session(
     if plan not in PRICING_PLANS:
         raise HTTPException(status_code=400, detail="Invalid plan")
     
+    # Signup provisions the customer in the background; wait for it or create it now
+    customer_id = current_user.stripe_customer_id
+    if not customer_id:
+        try:
+            customer_id = await customer_provisioner.ensure_customer(
+                current_user.id, current_user.email, current_user.name
+            )
+        except ProvisioningError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    
     result = await billing_service.create_checkout_session(
-        customer_id=current_user.stripe_customer_id,
+        customer_id=customer_id,
         plan=plan,
         success_url="https://yourapp.com/success",
-        cancel_url="https://yourapp.com/pricing"
+        cancel_url="https://yourapp.com/pricing",
+        user_id=current_user.id
     )
     
     if not result["success"]:
@@ -1,8 +1,45 @@
+import os
+from dotenv import load_dotenv
 
+load_dotenv()
+
+class Settings:
+    # App Settings
+    SECRET_KEY: str = os.getenv("SECRET_KEY", "change-me-in-production")
+    
+    # Database Configuration
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./contentr.db")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    # Wait for a free connection before failing the request with a 503
+    DB_POOL_TIMEOUT_SECONDS: float = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "5"))
+    # Below TiDB Cloud's idle connection cutoff
+    DB_POOL_RECYCLE_SECONDS: int = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "300"))
+    DB_STATEMENT_TIMEOUT_MS: int = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+    # CA bundle for TLS to TiDB Cloud, e.g. /etc/ssl/certs/ca-certificates.crt
+    DB_SSL_CA: str = os.getenv("DB_SSL_CA", "")
+    
+    # Redis Configuration (leave empty to keep quota counters in process)
+    REDIS_URL: str = os.getenv("REDIS_URL", "")
+    
     # Stripe Configuration
     STRIPE_SECRET_KEY: str = os.getenv("STRIPE_SECRET_KEY", "")
     STRIPE_PUBLISHABLE_KEY: str = os.getenv("STRIPE_PUBLISHABLE_KEY", "")
     STRIPE_WEBHOOK_SECRET: str = os.getenv("STRIPE_WEBHOOK_SECRET", "")
+    # Point at tools/stripe_stub.py (e.g. http://localhost:12111) to run offline
+    STRIPE_API_BASE: str = os.getenv("STRIPE_API_BASE", "https://api.stripe.com")
+    STRIPE_TIMEOUT_SECONDS: float = float(os.getenv("STRIPE_TIMEOUT_SECONDS", "10"))
+    STRIPE_MAX_RETRIES: int = int(os.getenv("STRIPE_MAX_RETRIES", "2"))
+    STRIPE_MAX_CONNECTIONS: int = int(os.getenv("STRIPE_MAX_CONNECTIONS", "20"))
+    
+    # Stripe webhook queue (SQLite file in WAL mode)
+    WEBHOOK_QUEUE_PATH: str = os.getenv("WEBHOOK_QUEUE_PATH", "./webhook_queue.db")
+    WEBHOOK_WORKERS: int = int(os.getenv("WEBHOOK_WORKERS", "2"))
+    WEBHOOK_BATCH_SIZE: int = int(os.getenv("WEBHOOK_BATCH_SIZE", "50"))
+    WEBHOOK_MAX_ATTEMPTS: int = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+    
+    # Background Stripe customer creation after signup
+    CUSTOMER_PROVISIONING_WORKERS: int = int(os.getenv("CUSTOMER_PROVISIONING_WORKERS", "4"))
     
     # Email Configuration
     SENDGRID_API_KEY: str = os.getenv("SENDGRID_API_KEY", "")
@@ -14,3 +51,56 @@
     # JWT Settings
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    # How long a worker may keep honouring an access token after its plan changes
+    ENTITLEMENT_VERSION_CACHE_TTL_SECONDS: float = float(os.getenv("ENTITLEMENT_VERSION_CACHE_TTL_SECONDS", "5"))
+    
+    # Password hashing pool
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+    PASSWORD_HASH_MAX_QUEUE: int = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+    
+    # Authenticated user cache
+    USER_CACHE_MAX_SIZE: int = int(os.getenv("USER_CACHE_MAX_SIZE", "10000"))
+    USER_CACHE_TTL_SECONDS: float = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+    
+    # Content analysis
+    EMBEDDING_DIM: int = int(os.getenv("EMBEDDING_DIM", "256"))
+    # "hashing" works offline; "openai" needs OPENAI_API_KEY
+    EMBEDDER: str = os.getenv("EMBEDDER", "hashing")
+    OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
+    EMBEDDING_STORE_PATH: str = os.getenv("EMBEDDING_STORE_PATH", "./embeddings")
+    # Most vectors kept on disk (and keys per worker); the least recently used half is dropped past it
+    EMBEDDING_STORE_MAX_ROWS: int = int(os.getenv("EMBEDDING_STORE_MAX_ROWS", "500000"))
+    # BM25 index snapshots over content_posts text, memory-mapped by every worker
+    TEXT_INDEX_PATH: str = os.getenv("TEXT_INDEX_PATH", "./text_index")
+    # Trained weights from tools/train_engagement_model.py; heuristic priors if missing
+    ENGAGEMENT_MODEL_PATH: str = os.getenv("ENGAGEMENT_MODEL_PATH", "./engagement_model.npz")
+    # "local" uses the in-process vector index, "tidb" queries VEC_COSINE_DISTANCE
+    CONTENT_GAPS_BACKEND: str = os.getenv("CONTENT_GAPS_BACKEND", "local")
+    
+    # Cached analysis results: fresh for TTL, then served stale while refreshing
+    RESULT_CACHE_TTL_SECONDS: float = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "300"))
+    RESULT_CACHE_STALE_SECONDS: float = float(os.getenv("RESULT_CACHE_STALE_SECONDS", "1800"))
+    RESULT_CACHE_MAX_SIZE: int = int(os.getenv("RESULT_CACHE_MAX_SIZE", "1024"))
+    
+    # Background analysis jobs
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", str(min(4, os.cpu_count() or 1))))
+    JOB_MAX_QUEUE: int = int(os.getenv("JOB_MAX_QUEUE", "100"))
+    JOB_TIMEOUT_SECONDS: float = float(os.getenv("JOB_TIMEOUT_SECONDS", "300"))
+    JOB_RESULT_TTL_SECONDS: int = int(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+    
+    # Post ingestion pipeline
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+    INGEST_INSERT_CHUNK: int = int(os.getenv("INGEST_INSERT_CHUNK", "2000"))
+    INGEST_QUEUE_DEPTH: int = int(os.getenv("INGEST_QUEUE_DEPTH", "8"))
+    INGEST_EMBED_WORKERS: int = int(os.getenv("INGEST_EMBED_WORKERS", "2"))
+    # Recently seen post keys kept in memory; the database's unique key catches older repeats
+    INGEST_DEDUPE_WINDOW: int = int(os.getenv("INGEST_DEDUPE_WINDOW", "200000"))
+    
+    # Usage Metering
+    USAGE_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("USAGE_FLUSH_INTERVAL_SECONDS", "5"))
+    USAGE_FLUSH_MAX_PENDING: int = int(os.getenv("USAGE_FLUSH_MAX_PENDING", "500"))
+    USAGE_RETENTION_DAYS: int = int(os.getenv("USAGE_RETENTION_DAYS", "395"))
+    USAGE_COMPACT_AFTER_DAYS: int = int(os.getenv("USAGE_COMPACT_AFTER_DAYS", "7"))
+    USAGE_MAINTENANCE_INTERVAL_HOURS: float = float(os.getenv("USAGE_MAINTENANCE_INTERVAL_HOURS", "6"))
+
+settings = Settings()
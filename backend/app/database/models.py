@@ -1,3 +1,40 @@
+import json
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, Float, ForeignKey, JSON, Index, Text, UniqueConstraint
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.sql import func
+from sqlalchemy.types import TypeDecorator
+from app.config import settings
+
+Base = declarative_base()
+
+class Vector(TypeDecorator):
+    """TiDB VECTOR(dim) column; stored as JSON text on other databases."""
+    
+    impl = Text
+    cache_ok = True
+    
+    def __init__(self, dim: int):
+        super().__init__()
+        self.dim = dim
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return json.dumps([float(x) for x in value], separators=(",", ":"))
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return json.loads(value)
+
+@compiles(Vector, "mysql")
+def _compile_vector_mysql(element, compiler, **kw):
+    return f"VECTOR({element.dim})"
+
+@compiles(Vector)
+def _compile_vector_default(element, compiler, **kw):
+    return "TEXT"
 
 # SaaS Models
 class User(Base):
@@ -9,8 +46,13 @@ class User(Base):
     name = Column(String(255), nullable=False)
     subscription_tier = Column(String(50), default="free")
     stripe_customer_id = Column(String(255))
+    # Provisioning rounds that gave up without a customer, and the last error; reconcile stops at a cap
+    stripe_provisioning_failures = Column(Integer, default=0, server_default="0", nullable=False)
+    stripe_provisioning_error = Column(String(255))
     trial_ends_at = Column(DateTime)
     is_active = Column(Boolean, default=True)
+    # Bumped with every plan change; access tokens carry the version they were issued at
+    entitlements_version = Column(Integer, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
@@ -18,6 +60,16 @@ class User(Base):
     brands = relationship("Brand", back_populates="user")
     usage_records = relationship("UsageRecord", back_populates="user")
 
+class RefreshToken(Base):
+    """One row per issued refresh token; rotating or revoking one sets revoked_at."""
+    __tablename__ = "refresh_tokens"
+    
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime)
+    created_at = Column(DateTime, default=func.now())
+
 class Brand(Base):
     __tablename__ = "brands"
     
@@ -40,15 +92,41 @@ class UsageRecord(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     feature = Column(String(100), nullable=False)  # api_calls, calendar_generations, etc.
     count = Column(Integer, default=1)
-    metadata = Column(JSON)
+    # "metadata" is reserved on declarative classes, so map it under another attribute
+    extra_metadata = Column("metadata", JSON)
     created_at = Column(DateTime, default=func.now())
     
     user = relationship("User", back_populates="usage_records")
     
+    # On MySQL/TiDB this table is range-partitioned by month (see services/usage_maintenance.py)
     __table_args__ = (
         Index('idx_user_feature_date', 'user_id', 'feature', 'created_at'),
     )
 
+class UsageMonthly(Base):
+    __tablename__ = "usage_monthly"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    feature = Column(String(100), nullable=False)
+    period = Column(Date, nullable=False)  # first day of the month
+    count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        UniqueConstraint('user_id', 'feature', 'period', name='uq_usage_monthly_user_feature_period'),
+    )
+
+class MaintenanceLease(Base):
+    """Which process runs a periodic maintenance task, and how far it has got."""
+    __tablename__ = "maintenance_leases"
+    
+    name = Column(String(50), primary_key=True)
+    holder = Column(String(64))
+    expires_at = Column(DateTime)
+    # Task-specific progress, e.g. the end of the last compacted day range
+    watermark = Column(DateTime)
+
 class Subscription(Base):
     __tablename__ = "subscriptions"
     
@@ -61,3 +139,48 @@ class Subscription(Base):
     current_period_end = Column(DateTime)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+class DashboardEventRecord(Base):
+    __tablename__ = "dashboard_events"
+    
+    # Every API worker tails this table by id to keep its dashboard rollups in step
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    brand_id = Column(Integer, ForeignKey("brands.id"), nullable=False)
+    type = Column(String(20), nullable=False)  # engagement, published, planned
+    at = Column(DateTime, nullable=False)
+    reach = Column(Float, default=0.0)
+    engagements = Column(Float, default=0.0)
+    count = Column(Integer, default=1)
+    platform = Column(String(50))
+    audience = Column(String(255))
+    created_at = Column(DateTime, default=func.now())
+    
+    __table_args__ = (
+        Index('idx_dashboard_events_at', 'at'),
+    )
+
+# Content Models
+class ContentPost(Base):
+    __tablename__ = "content_posts"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    brand_id = Column(Integer, ForeignKey("brands.id"))  # our brand, or the brand tracking a competitor post
+    is_competitor = Column(Boolean, default=False, nullable=False)
+    author = Column(String(255))
+    platform = Column(String(50))
+    niche = Column(String(100))
+    topic = Column(String(255))
+    content_text = Column(Text, nullable=False)
+    hashtags = Column(JSON)
+    engagement_rate = Column(Float, default=0.0)
+    reach = Column(Integer, default=0)
+    published_at = Column(DateTime)
+    content_embedding = Column(Vector(settings.EMBEDDING_DIM))
+    # Hash of platform and source id (or author and text) so replays don't duplicate posts
+    dedupe_key = Column(String(32), unique=True)
+    created_at = Column(DateTime, default=func.now())
+    
+    __table_args__ = (
+        Index('idx_content_posts_niche', 'niche', 'is_competitor'),
+    )
@@ -0,0 +1,112 @@
+import ssl
+from typing import Any, AsyncIterator, Dict, Optional
+from sqlalchemy import event, inspect, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from app.config import settings
+from app.database.models import Base
+
+# Plain mysql:// and tidb:// URLs get the async driver
+ASYNC_DRIVERS = {"mysql": "mysql+asyncmy", "tidb": "mysql+asyncmy", "sqlite": "sqlite+aiosqlite"}
+
+def database_url(url: str) -> str:
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+def create_database_engine(
+    url: Optional[str] = None,
+    pool_size: Optional[int] = None,
+    max_overflow: Optional[int] = None,
+    pool_timeout: Optional[float] = None,
+    statement_timeout_ms: Optional[int] = None,
+) -> AsyncEngine:
+    """Async engine with a bounded pool and a per-statement time limit.
+
+    At most ``pool_size + max_overflow`` connections are open; a request
+    that finds them all checked out waits ``pool_timeout`` seconds and
+    then fails with ``sqlalchemy.exc.TimeoutError`` rather than queueing
+    without bound. Connections are pinged on checkout and recycled before
+    TiDB's idle timeout closes them. On MySQL/TiDB each connection sets
+    ``max_execution_time``; SQLite has no statement limit, so there the
+    timeout only bounds waits on the database lock.
+    """
+    url = make_url(database_url(url or settings.DATABASE_URL))
+    pool_size = settings.DB_POOL_SIZE if pool_size is None else pool_size
+    max_overflow = settings.DB_MAX_OVERFLOW if max_overflow is None else max_overflow
+    pool_timeout = settings.DB_POOL_TIMEOUT_SECONDS if pool_timeout is None else pool_timeout
+    statement_timeout_ms = settings.DB_STATEMENT_TIMEOUT_MS if statement_timeout_ms is None else statement_timeout_ms
+
+    options: Dict[str, Any] = {"pool_pre_ping": True}
+    connect_args: Dict[str, Any] = {}
+    if url.get_backend_name() == "sqlite":
+        # In-memory databases live in a single connection, so they keep the default pool
+        if url.database not in (None, "", ":memory:"):
+            options.update(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout)
+        if statement_timeout_ms:
+            connect_args["timeout"] = statement_timeout_ms / 1000
+    else:
+        options.update(
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        )
+        if settings.DB_SSL_CA:
+            connect_args["ssl"] = ssl.create_default_context(cafile=settings.DB_SSL_CA)
+
+    engine = create_async_engine(url, connect_args=connect_args, **options)
+    if url.get_backend_name() == "mysql" and statement_timeout_ms:
+        @event.listens_for(engine.sync_engine, "connect")
+        def set_statement_timeout(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"SET SESSION max_execution_time = {int(statement_timeout_ms)}")
+            cursor.close()
+    return engine
+
+engine = create_database_engine()
+async_session = async_sessionmaker(engine, expire_on_commit=False)
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """Request-scoped session: committed after the handler returns, rolled back if it raises."""
+    async with async_session() as session:
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+
+def pool_status() -> Dict[str, Any]:
+    pool = engine.pool
+    status = {"pool": type(pool).__name__}
+    if hasattr(pool, "checkedout"):
+        status.update(size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+    return status
+
+# Columns added after their table shipped; create_all only creates missing tables
+ADDED_COLUMNS = {
+    "users": {
+        "entitlements_version": "INTEGER NOT NULL DEFAULT 0",
+        "stripe_provisioning_failures": "INTEGER NOT NULL DEFAULT 0",
+        "stripe_provisioning_error": "VARCHAR(255)",
+    },
+}
+
+def add_missing_columns(conn):
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {column["name"] for column in inspect(conn).get_columns(table)}
+        for name, ddl in columns.items():
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+async def init_models():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(add_missing_columns)
+    except DBAPIError:
+        # Another worker added the column first
+        async with engine.begin() as conn:
+            await conn.run_sync(add_missing_columns)
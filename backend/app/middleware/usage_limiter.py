@@ -1,18 +1,37 @@
 from fastapi import HTTPException, Depends
-from app.services.auth import get_current_user
+from app.services.auth import get_current_entitlements
+from app.services.entitlements import Entitlements
 from app.services.usage import usage_service
 
 class UsageLimiter:
     def __init__(self, feature: str):
         self.feature = feature
     
-    async def __call__(self, current_user = Depends(get_current_user)):
+    async def __call__(self, entitlements: Entitlements = Depends(get_current_entitlements)):
+        # Tier and limits come from the signed token, so no user lookup is needed
         await usage_service.check_usage_limit(
-            current_user.id,
-            current_user.subscription_tier,
-            self.feature
+            entitlements.user_id,
+            entitlements.tier,
+            self.feature,
+            limit=entitlements.limits.get(self.feature)
         )
-        return current_user
+        return entitlements
+
+class FeatureGate:
+    def __init__(self, feature: str):
+        self.feature = feature
+    
+    async def __call__(self, entitlements: Entitlements = Depends(get_current_entitlements)):
+        if not entitlements.has_feature(self.feature):
+            raise HTTPException(
+                status_code=403,
+                detail={
+                    "error": "Feature not available",
+                    "message": f"Your {entitlements.tier} plan doesn't include {self.feature}",
+                    "upgrade_url": "/pricing"
+                }
+            )
+        return entitlements
 
 # Usage limiters for different features
 api_call_limiter = UsageLimiter("api_calls")
@@ -1,19 +1,32 @@
+import uuid
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, List, Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from pydantic import BaseModel
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import settings
+from app.database.models import Brand, RefreshToken, User
+from app.database.session import async_session
+from app.services.cache import TTLCache
+from app.services.hashing import HashQueueFull, PasswordHasher
+from app.services.entitlements import (
+    Entitlements,
+    PLAN_VERSION,
+    build_entitlement_claims,
+    entitlement_versions,
+)
 
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 class Token(BaseModel):
     access_token: str
     token_type: str
     user: dict
+    refresh_token: Optional[str] = None
 
 class UserCreate(BaseModel):
     email: str
@@ -24,12 +37,44 @@ class UserLogin(BaseModel):
     email: str
     password: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 class AuthService:
-    def verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
+    def __init__(self):
+        # User rows keyed by id; billing invalidates entries when a plan changes
+        self.user_cache = TTLCache(
+            maxsize=settings.USER_CACHE_MAX_SIZE,
+            ttl=settings.USER_CACHE_TTL_SECONDS,
+        )
+        # (user id, brand id) -> whether the user owns that active brand; (user id, None) -> all of them
+        self.brand_cache = TTLCache(
+            maxsize=settings.USER_CACHE_MAX_SIZE,
+            ttl=settings.USER_CACHE_TTL_SECONDS,
+        )
+        self.hasher = PasswordHasher(
+            max_workers=settings.PASSWORD_HASH_WORKERS,
+            max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+        )
     
-    def get_password_hash(self, password: str) -> str:
-        return pwd_context.hash(password)
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        try:
+            return await self.hasher.verify(plain_password, hashed_password)
+        except HashQueueFull:
+            raise self._overloaded_exception()
+    
+    async def get_password_hash(self, password: str) -> str:
+        try:
+            return await self.hasher.hash(password)
+        except HashQueueFull:
+            raise self._overloaded_exception()
+    
+    def _overloaded_exception(self) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
     
     def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None):
         to_encode = data.copy()
@@ -41,35 +86,205 @@ class AuthService:
         encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm="HS256")
         return encoded_jwt
     
-    async def get_current_user(self, credentials: HTTPAuthorizationCredentials = Depends(security)):
-        credentials_exception = HTTPException(
+    async def create_refresh_token(self, user_id: int) -> str:
+        """Refresh token backed by a refresh_tokens row, so it can be rotated and revoked."""
+        token_id = uuid.uuid4().hex
+        now = datetime.utcnow()
+        expires_at = now + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+        async with async_session() as db:
+            # Expired rows are no longer needed to detect reuse
+            await db.execute(delete(RefreshToken).where(RefreshToken.user_id == user_id, RefreshToken.expires_at < now))
+            db.add(RefreshToken(id=token_id, user_id=user_id, expires_at=expires_at))
+            await db.commit()
+        return self.create_access_token(
+            data={"sub": str(user_id), "type": "refresh", "jti": token_id},
+            expires_delta=expires_at - now,
+        )
+    
+    async def issue_tokens(self, user_id: int, subscription_tier: str) -> Dict[str, str]:
+        # Snapshot the plan into the access token so the hot path can skip the database
+        version = await entitlement_versions.get(user_id)
+        access_token = self.create_access_token(
+            data={
+                "sub": str(user_id),
+                "type": "access",
+                "ent": build_entitlement_claims(subscription_tier, version),
+            },
+            expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
+        )
+        return {
+            "access_token": access_token,
+            "refresh_token": await self.create_refresh_token(user_id),
+        }
+    
+    async def refresh_tokens(self, refresh_token: str) -> Dict[str, str]:
+        """Rotate a refresh token: it is revoked and a new pair issued.
+
+        Presenting a token that was already rotated means it leaked, so every
+        session of that user is revoked and their access tokens retired.
+        """
+        payload = self._decode_token(refresh_token, "refresh")
+        user_id = payload["sub"]
+        if not await self._revoke_refresh_token(user_id, payload.get("jti")):
+            if payload.get("jti") is not None:
+                await self.revoke_all_sessions(user_id)
+            raise self._credentials_exception()
+        user = await self._load_user(user_id)
+        return await self.issue_tokens(user.id, user.subscription_tier)
+    
+    async def _revoke_refresh_token(self, user_id: int, token_id: Optional[str]) -> bool:
+        # Tokens from before rotation have no row to revoke and are refused
+        if token_id is None:
+            return False
+        async with async_session() as db:
+            result = await db.execute(
+                update(RefreshToken)
+                .where(RefreshToken.id == token_id, RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+                .values(revoked_at=datetime.utcnow())
+            )
+            await db.commit()
+        return result.rowcount == 1
+    
+    async def revoke_refresh_token(self, refresh_token: str):
+        """Log out one session."""
+        payload = self._decode_token(refresh_token, "refresh")
+        await self._revoke_refresh_token(payload["sub"], payload.get("jti"))
+    
+    async def revoke_all_sessions(self, user_id: int):
+        async with async_session() as db:
+            await db.execute(
+                update(RefreshToken)
+                .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+                .values(revoked_at=datetime.utcnow())
+            )
+            await db.commit()
+        await entitlement_versions.bump(user_id)
+    
+    def _credentials_exception(self, detail: str = "Could not validate credentials") -> HTTPException:
+        return HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
+            detail=detail,
             headers={"WWW-Authenticate": "Bearer"},
         )
+    
+    def _decode_token(self, token: str, token_type: str) -> dict:
         try:
-            payload = jwt.decode(credentials.credentials, settings.SECRET_KEY, algorithms=["HS256"])
-            user_id: str = payload.get("sub")
-            if user_id is None:
-                raise credentials_exception
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
         except JWTError:
-            raise credentials_exception
+            raise self._credentials_exception()
         
-        # Get user from database
-        user = await self.get_user_by_id(int(user_id))
-        if user is None:
-            raise credentials_exception
+        # Tokens issued before typing was added are access tokens
+        if payload.get("sub") is None or payload.get("type", "access") != token_type:
+            raise self._credentials_exception()
+        # The subject is the user id; some old tokens carry other strings there
+        try:
+            payload["sub"] = int(payload["sub"])
+        except (TypeError, ValueError):
+            raise self._credentials_exception()
+        return payload
+    
+    async def _load_user(self, user_id: int):
+        # Get user from cache, falling back to the database. A plan change on another
+        # worker bumps the version, so a cached row older than it is reloaded
+        user = self.user_cache.get(user_id)
+        if user is None or user.entitlements_version != await entitlement_versions.get(user_id):
+            user = await self.get_user_by_id(user_id)
+            if user is None:
+                raise self._credentials_exception()
+            self.user_cache.set(user_id, user)
         return user
     
-    async def get_user_by_id(self, user_id: int):
-        # Implement database query
-        pass
+    async def get_current_user(self, credentials: HTTPAuthorizationCredentials = Depends(security)):
+        payload = self._decode_token(credentials.credentials, "access")
+        return await self._load_user(payload["sub"])
+    
+    async def get_current_entitlements(self, credentials: HTTPAuthorizationCredentials = Depends(security)) -> Entitlements:
+        payload = self._decode_token(credentials.credentials, "access")
+        user_id = payload["sub"]
+        claims = payload.get("ent")
+        
+        if claims is None:
+            # Token predates entitlement claims; fall back to the user row
+            user = await self._load_user(user_id)
+            claims = build_entitlement_claims(user.subscription_tier, await entitlement_versions.get(user_id))
+        elif (
+            claims.get("plan_ver") != PLAN_VERSION
+            or claims.get("ver") != await entitlement_versions.get(user_id)
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Entitlements changed, refresh your access token",
+                headers={"WWW-Authenticate": 'Bearer error="invalid_token", error_description="stale_entitlements"'},
+            )
+        
+        return Entitlements(
+            user_id=user_id,
+            tier=claims["tier"],
+            limits=claims["limits"],
+            features=claims["features"],
+        )
     
-    async def get_user_by_email(self, email: str):
-        # Implement database query
-        pass
+    async def invalidate_user(self, user_id: int):
+        # The plan change already bumped the user's version; stop serving the cached one
+        self.user_cache.invalidate(user_id)
+        entitlement_versions.invalidate(user_id)
+    
+    async def create_user(self, email: str, password_hash: str, name: str, db: Optional[AsyncSession] = None):
+        if db is None:
+            async with async_session() as db:
+                return await self.create_user(email, password_hash, name, db)
+        user = User(email=email, password_hash=password_hash, name=name)
+        db.add(user)
+        # Committed here rather than with the request, so background provisioning can see the row
+        try:
+            await db.commit()
+        except IntegrityError:
+            # A concurrent signup with the same email got there first
+            await db.rollback()
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
+        return user
+    
+    async def require_brand(self, user_id: int, brand_id: int):
+        """Raise 404 unless the user owns the active brand."""
+        owned = self.brand_cache.get((user_id, brand_id))
+        if owned is None:
+            async with async_session() as db:
+                owned = await db.scalar(
+                    select(Brand.id).where(Brand.id == brand_id, Brand.user_id == user_id, Brand.is_active.is_(True))
+                ) is not None
+            self.brand_cache.set((user_id, brand_id), owned)
+        if not owned:
+            # Same answer for someone else's brand as for a missing one
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Brand not found")
+    
+    async def brand_ids(self, user_id: int) -> List[int]:
+        """Ids of the user's active brands."""
+        owned = self.brand_cache.get((user_id, None))
+        if owned is None:
+            async with async_session() as db:
+                owned = list(await db.scalars(
+                    select(Brand.id).where(Brand.user_id == user_id, Brand.is_active.is_(True))
+                ))
+            self.brand_cache.set((user_id, None), owned)
+        return owned
+    
+    async def get_user_by_id(self, user_id: int, db: Optional[AsyncSession] = None):
+        if db is None:
+            async with async_session() as db:
+                return await self.get_user_by_id(user_id, db)
+        return await db.get(User, user_id)
+    
+    async def get_user_by_email(self, email: str, db: Optional[AsyncSession] = None):
+        if db is None:
+            async with async_session() as db:
+                return await self.get_user_by_email(email, db)
+        result = await db.execute(select(User).where(User.email == email))
+        return result.scalar_one_or_none()
 
 auth_service = AuthService()
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    return auth_service.get_current_user(credentials)
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await auth_service.get_current_user(credentials)
+
+async def get_current_entitlements(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await auth_service.get_current_entitlements(credentials)
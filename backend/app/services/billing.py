@@ -1,61 +1,56 @@
+import hashlib
+import json
 import stripe
-from enum import Enum
-from typing import Dict, Any
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+from sqlalchemy import select, update
 from app.config import settings
+from app.database.models import Subscription, User
+from app.database.session import async_session
+from app.services.auth import auth_service
+from app.services.provisioning import CustomerProvisioner
+from app.services.plans import PRICING_PLANS, USAGE_LIMITS, SubscriptionTier
+from app.services.stripe_client import StripeClient, StripeError
+from app.services.webhook_queue import WebhookQueue
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
-
-class SubscriptionTier(Enum):
-    FREE = "free"
-    STARTER = "starter"  # $29/month
-    PRO = "professional"  # $99/month
-    AGENCY = "agency"    # $299/month
-
-PRICING_PLANS = {
-    "starter": {
-        "stripe_price_id": "price_starter_monthly",
-        "amount": 29,
-        "currency": "usd",
-        "brands_limit": 3,
-        "api_calls_limit": 1000,
-        "features": ["basic_automation", "content_calendar", "analytics"]
-    },
-    "professional": {
-        "stripe_price_id": "price_pro_monthly",
-        "amount": 99,
-        "currency": "usd", 
-        "brands_limit": 10,
-        "api_calls_limit": 10000,
-        "features": ["advanced_ai", "competitor_analysis", "white_label", "api_access"]
-    },
-    "agency": {
-        "stripe_price_id": "price_agency_monthly",
-        "amount": 299,
-        "currency": "usd",
-        "brands_limit": 50,
-        "api_calls_limit": 100000,
-        "features": ["client_management", "custom_workflows", "priority_support"]
-    }
-}
+webhook_queue = WebhookQueue(
+    settings.WEBHOOK_QUEUE_PATH,
+    batch_size=settings.WEBHOOK_BATCH_SIZE,
+    max_attempts=settings.WEBHOOK_MAX_ATTEMPTS,
+)
 
 class BillingService:
     def __init__(self):
+        # Webhook signatures are verified locally with the SDK; API calls go through the async client
         self.stripe = stripe
+        self.client = StripeClient(
+            api_key=settings.STRIPE_SECRET_KEY,
+            base_url=settings.STRIPE_API_BASE,
+            timeout=settings.STRIPE_TIMEOUT_SECONDS,
+            max_retries=settings.STRIPE_MAX_RETRIES,
+            max_connections=settings.STRIPE_MAX_CONNECTIONS,
+        )
     
-    async def create_customer(self, email: str, name: str) -> Dict[str, Any]:
+    async def create_customer(self, user_id: int, email: str, name: str) -> Dict[str, Any]:
         try:
-            customer = self.stripe.Customer.create(
+            # Retries for the same user and details reuse the key, so they can't create a second
+            # customer; a different user, or changed details, gets a fresh one
+            params = hashlib.sha256(json.dumps([email.lower(), name]).encode()).hexdigest()[:16]
+            customer = await self.client.create_customer(
                 email=email,
-                name=name
+                name=name,
+                idempotency_key=f"customer-{user_id}-{params}",
             )
-            return {"success": True, "customer_id": customer.id}
-        except stripe.error.StripeError as e:
+            return {"success": True, "customer_id": customer["id"]}
+        except StripeError as e:
             return {"success": False, "error": str(e)}
     
-    async def create_checkout_session(self, customer_id: str, plan: str, success_url: str, cancel_url: str):
+    async def create_checkout_session(self, customer_id: str, plan: str, success_url: str, cancel_url: str, user_id: Optional[int] = None):
         try:
-            session = self.stripe.checkout.Session.create(
+            session = await self.client.create_checkout_session(
                 customer=customer_id,
+                client_reference_id=str(user_id) if user_id is not None else None,
+                metadata={"plan": plan},
                 payment_method_types=['card'],
                 line_items=[{
                     'price': PRICING_PLANS[plan]["stripe_price_id"],
@@ -64,41 +59,125 @@ class BillingService:
                 mode='subscription',
                 success_url=success_url,
                 cancel_url=cancel_url,
-                trial_period_days=14,
+                subscription_data={'trial_period_days': 14},
             )
-            return {"success": True, "checkout_url": session.url}
-        except stripe.error.StripeError as e:
+            return {"success": True, "checkout_url": session["url"]}
+        except StripeError as e:
             return {"success": False, "error": str(e)}
     
     async def handle_webhook(self, payload: str, sig_header: str):
         try:
-            event = self.stripe.Webhook.construct_event(
+            self.stripe.Webhook.construct_event(
                 payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
             )
-            
-            if event['type'] == 'checkout.session.completed':
-                await self._handle_successful_subscription(event['data']['object'])
-            elif event['type'] == 'invoice.payment_failed':
-                await self._handle_failed_payment(event['data']['object'])
-            elif event['type'] == 'customer.subscription.deleted':
-                await self._handle_cancelled_subscription(event['data']['object'])
-                
-            return {"success": True}
+            # The signature covers the raw body, so queue that rather than the SDK object
+            event = json.loads(payload)
         except ValueError as e:
             return {"success": False, "error": "Invalid payload"}
         except stripe.error.SignatureVerificationError as e:
             return {"success": False, "error": "Invalid signature"}
+        
+        # Persist and acknowledge; the queue workers apply the event later
+        queued = await webhook_queue.enqueue(event)
+        return {"success": True, "duplicate": not queued}
+    
+    async def process_webhook_events(self, events: List[Dict[str, Any]]) -> Dict[str, str]:
+        """Apply a batch oldest first in one transaction, each event in its own savepoint.
+
+        An event that raises is rolled back alone and reported in the
+        returned {event_id: error}, so the rest of the batch still commits.
+        """
+        touched_users = set()
+        errors = {}
+        async with async_session() as db:
+            for event in sorted(events, key=lambda e: e.get("created", 0)):
+                try:
+                    async with db.begin_nested():
+                        user_id = await self._apply_event(db, event)
+                except Exception as e:
+                    errors[event["id"]] = repr(e)
+                    continue
+                if user_id is not None:
+                    touched_users.add(user_id)
+            await db.commit()
+        
+        # Drop cached users and versions so the retired tokens are refused here at once
+        for user_id in touched_users:
+            await auth_service.invalidate_user(user_id)
+        return errors
     
-    async def _handle_successful_subscription(self, session):
-        # Update user subscription in database
-        pass
+    async def _apply_event(self, db, event: Dict[str, Any]) -> Optional[int]:
+        obj = event['data']['object']
+        if event['type'] == 'checkout.session.completed':
+            return await self._handle_successful_subscription(db, obj)
+        if event['type'] == 'invoice.payment_failed':
+            return await self._handle_failed_payment(db, obj)
+        if event['type'] == 'customer.subscription.deleted':
+            return await self._handle_cancelled_subscription(db, obj)
+        return None
     
-    async def _handle_failed_payment(self, invoice):
+    async def _handle_successful_subscription(self, db, session) -> Optional[int]:
+        user_id = await self._resolve_user_id(db, session.get("client_reference_id"), session.get("customer"))
+        plan = (session.get("metadata") or {}).get("plan")
+        if user_id is None or plan not in PRICING_PLANS:
+            return None
+        
+        await db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(
+                subscription_tier=plan,
+                stripe_customer_id=session.get("customer"),
+                entitlements_version=User.entitlements_version + 1,
+            )
+        )
+        db.add(Subscription(
+            user_id=user_id,
+            stripe_subscription_id=session.get("subscription"),
+            plan=plan,
+            status="active",
+            current_period_start=datetime.utcnow(),
+        ))
+        return user_id
+    
+    async def _handle_failed_payment(self, db, invoice) -> Optional[int]:
         # Handle failed payment (email user, suspend account, etc.)
-        pass
+        return None
+    
+    async def _handle_cancelled_subscription(self, db, subscription) -> Optional[int]:
+        # Flush so a subscription added earlier in this batch is visible
+        await db.flush()
+        result = await db.execute(
+            select(Subscription.user_id).where(Subscription.stripe_subscription_id == subscription.get("id"))
+        )
+        user_id = result.scalars().first()
+        if user_id is None:
+            user_id = await self._resolve_user_id(db, None, subscription.get("customer"))
+        if user_id is None:
+            return None
+        
+        await db.execute(
+            update(Subscription)
+            .where(Subscription.stripe_subscription_id == subscription.get("id"))
+            .values(status="canceled")
+        )
+        await db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(subscription_tier="free", entitlements_version=User.entitlements_version + 1)
+        )
+        return user_id
     
-    async def _handle_cancelled_subscription(self, subscription):
-        # Handle subscription cancellation
-        pass
+    async def _resolve_user_id(self, db, client_reference_id: Optional[str], customer_id: Optional[str]) -> Optional[int]:
+        if client_reference_id:
+            return int(client_reference_id)
+        if not customer_id:
+            return None
+        result = await db.execute(select(User.id).where(User.stripe_customer_id == customer_id))
+        return result.scalars().first()
 
 billing_service = BillingService()
+customer_provisioner = CustomerProvisioner(
+    billing_service.create_customer,
+    workers=settings.CUSTOMER_PROVISIONING_WORKERS,
+)
@@ -0,0 +1,406 @@
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from app.services.engagement_model import (
+    CONTENT_TYPES, PLATFORM_PRIORS, SLOT_BUCKETS, SLOTS, audience_bucket, engagement_model, platform_index,
+)
+from app.services.near_duplicates import DUPLICATE_THRESHOLD, group_near_duplicates
+
+CONTENT_MIX = {"educational": 0.6, "promotional": 0.2, "engaging": 0.2}
+
+# Share of a topic's rank lost when it nearly duplicates recent content
+RECENT_PENALTY = 0.5
+
+# Platforms we plan for and their weekly caps, from the engagement model's platform table
+PLATFORMS = {
+    name: {"weekly_cap": config["weekly_cap"]} for name, config in PLATFORM_PRIORS.items() if config["weekly_cap"]
+}
+
+# Gap topics are planned as this content type, for the niche's practitioners
+GAP_CONTENT_TYPE = "educational"
+
+def niche_audience(niche: str) -> str:
+    return f"{niche} practitioners"
+
+@dataclass
+class TopicOption:
+    topic: str
+    content_type: str
+    engagement: float
+    target_audience: str
+    content_brief: str
+    hashtags: List[str] = field(default_factory=list)
+    # Relative fit per platform; platforms not listed get 1.0
+    platform_fit: Dict[str, float] = field(default_factory=dict)
+
+def apportion(total: int, ratios: np.ndarray, rotation: int = 0) -> np.ndarray:
+    """Split ``total`` posts by ``ratios`` with largest remainders; ties rotate with ``rotation``."""
+    shares = total * ratios / ratios.sum()
+    counts = np.floor(shares).astype(np.int64)
+    remainders = shares - counts
+    tie_break = (np.arange(ratios.size) + rotation) % ratios.size
+    order = np.lexsort((tie_break, -np.round(remainders, 9)))
+    counts[order[: total - counts.sum()]] += 1
+    return counts
+
+class CalendarPlan:
+    """Assigns topics to days, platforms and posting slots.
+
+    Every (weekday, topic, platform, slot) is scored up front in one batched
+    call to the engagement model, and since slots don't interact with any
+    constraint, each (weekday, topic, platform) only keeps its best slot.
+    Days are then filled greedily against these constraints:
+
+    - a platform gets at most one post per day and ``weekly_cap`` per week
+    - each week's posts split across content types by their ``mix`` share
+    - a topic, or any near-duplicate of it, isn't repeated within
+      ``min_topic_gap`` days
+
+    All constraints are local to a day's week or its neighbourhood, so
+    ``replan_day`` can clear and refill one day against the rest of the
+    calendar. ``optimize`` sweeps that over every day until nothing improves,
+    which mostly pays off after days were re-planned or had to relax.
+
+    ``timing`` is an optional (platforms, audience buckets, 168) table of
+    observed hour-of-week lift, as built by ``PostingTimes.lift_table``.
+    Slots, the timing table and each entry's ``optimal_time`` are all in
+    the brand's local wall-clock time.
+    ``recent_similarity`` maps topic names to their closest match among the
+    brand's recent posts and briefs; topics at or above the duplicate
+    threshold are ranked lower but still predicted at full engagement.
+    """
+
+    def __init__(
+        self,
+        topics: List[TopicOption],
+        start: date,
+        days: int,
+        posts_per_day: int = 1,
+        min_topic_gap: int = 3,
+        mix: Optional[Dict[str, float]] = None,
+        platforms: Optional[Dict[str, Dict[str, Any]]] = None,
+        timing: Optional[np.ndarray] = None,
+        recent_similarity: Optional[Dict[str, float]] = None,
+    ):
+        self.topics = topics
+        self.start = start
+        self.days = days
+        self.mix = mix or CONTENT_MIX
+        self.platforms = platforms or PLATFORMS
+        self.platform_names = list(self.platforms)
+        self.posts_per_day = min(posts_per_day, len(self.platform_names))
+        self.min_topic_gap = max(1, min_topic_gap)
+        self.content_types = list(self.mix)
+
+        self.topic_type = np.array([self.content_types.index(t.content_type) for t in topics], dtype=np.int64)
+        self.topic_group = np.array(group_near_duplicates([t.topic for t in topics], DUPLICATE_THRESHOLD), dtype=np.int64)
+        self.has_duplicates = len(np.unique(self.topic_group)) < len(topics)
+        fit = np.array([[t.platform_fit.get(name, 1.0) for name in self.platform_names] for t in topics])
+        audiences = np.array([audience_bucket(t.target_audience) for t in topics])
+        scores = engagement_model.predict_grid(
+            np.array([t.engagement for t in topics]),
+            np.array([CONTENT_TYPES.index(t.content_type) for t in topics]),
+            audiences,
+            platform_index(self.platform_names),
+        ) * fit[None, :, :, None]
+        if timing is not None:
+            # Observed hour-of-week lift per (platform, audience), gathered for every slot at once
+            scores *= timing[:, audiences][..., SLOT_BUCKETS].transpose(2, 1, 0, 3)
+        # (weekday, topic, platform, slot) -> reduce to the best slot per (weekday, topic, platform)
+        self.best_slot = scores.argmax(axis=3)
+        self.best_score = scores.max(axis=3)
+        recent = np.array([(recent_similarity or {}).get(t.topic, 0.0) for t in topics])
+        novelty = np.where(recent >= DUPLICATE_THRESHOLD, 1.0 - RECENT_PENALTY * recent, 1.0)
+        self.rank_score = self.best_score * novelty[None, :, None]
+
+        self.first_weekday = start.weekday()
+        weeks = (days + 6) // 7
+        week_posts = np.minimum(7, days - 7 * np.arange(weeks)) * self.posts_per_day
+        ratios = np.array([self.mix[name] for name in self.content_types])
+        self.type_cap = np.stack([apportion(posts, ratios, week) for week, posts in enumerate(week_posts)])
+        self.platform_cap = np.array([config["weekly_cap"] for config in self.platforms.values()])
+
+        self.used = np.zeros((days, len(topics)), dtype=np.int8)
+        self.type_week = np.zeros((weeks, len(self.content_types)), dtype=np.int64)
+        self.platform_week = np.zeros((weeks, len(self.platform_names)), dtype=np.int64)
+        self.assignments: List[List[Tuple[int, int]]] = [[] for _ in range(days)]
+        self.relaxed_days = set()
+
+    def _assign(self, day: int, topic: int, platform: int):
+        week = day // 7
+        self.used[day, topic] += 1
+        self.type_week[week, self.topic_type[topic]] += 1
+        self.platform_week[week, platform] += 1
+        self.assignments[day].append((topic, platform))
+
+    def _clear_day(self, day: int):
+        week = day // 7
+        for topic, platform in self.assignments[day]:
+            self.used[day, topic] -= 1
+            self.type_week[week, self.topic_type[topic]] -= 1
+            self.platform_week[week, platform] -= 1
+        self.assignments[day] = []
+        self.relaxed_days.discard(day)
+
+    def _fill_day(self, day: int, banned: Iterable[int] = ()):
+        week = day // 7
+        weekday = (self.first_weekday + day) % 7
+        window = self.used[max(0, day - self.min_topic_gap + 1): day + self.min_topic_gap]
+        used = window.sum(axis=0)
+        if self.has_duplicates:
+            used = np.bincount(self.topic_group, weights=used, minlength=len(self.topics))[self.topic_group]
+        spaced = used == 0
+        for i in banned:
+            spaced[i] = False
+
+        for _ in range(self.posts_per_day):
+            taken_today = np.zeros(len(self.platform_names), dtype=bool)
+            for topic, platform in self.assignments[day]:
+                taken_today[platform] = True
+                if self.has_duplicates:
+                    spaced[self.topic_group == self.topic_group[topic]] = False
+                spaced[topic] = False
+
+            type_ok = (self.type_week[week] < self.type_cap[week])[self.topic_type]
+            platform_ok = (self.platform_week[week] < self.platform_cap) & ~taken_today
+            # Strict first; if that leaves nothing, drop the mix and cadence caps
+            for topic_mask, platform_mask in ((spaced & type_ok, platform_ok), (spaced, ~taken_today)):
+                if topic_mask.any() and platform_mask.any():
+                    break
+            else:
+                return
+            if topic_mask is spaced:
+                self.relaxed_days.add(day)
+
+            scores = np.where(topic_mask[:, None] & platform_mask[None, :], self.rank_score[weekday], -np.inf)
+            topic, platform = np.unravel_index(int(scores.argmax()), scores.shape)
+            self._assign(day, int(topic), int(platform))
+
+    def plan(self) -> "CalendarPlan":
+        for day in range(self.days):
+            self._fill_day(day)
+        return self
+
+    def replan_day(self, day: int, banned_topics: Iterable[str] = ()) -> float:
+        """Re-plan one day against the rest of the calendar; returns its new score."""
+        banned_topics = set(banned_topics)
+        banned = [i for i, t in enumerate(self.topics) if t.topic in banned_topics]
+        self._clear_day(day)
+        self._fill_day(day, banned)
+        return self.day_score(day)
+
+    def optimize(self, max_passes: int = 3) -> "CalendarPlan":
+        for _ in range(max_passes):
+            before = self.total_score
+            for day in range(self.days):
+                previous = list(self.assignments[day])
+                relaxed = day in self.relaxed_days
+                score = self.day_score(day)
+                if self.replan_day(day) < score - 1e-12:
+                    # Only possible for days that had to relax a constraint; keep the old plan
+                    self._clear_day(day)
+                    for topic, platform in previous:
+                        self._assign(day, topic, platform)
+                    if relaxed:
+                        self.relaxed_days.add(day)
+            if self.total_score <= before + 1e-12:
+                break
+        return self
+
+    def day_score(self, day: int) -> float:
+        weekday = (self.first_weekday + day) % 7
+        return float(sum(self.best_score[weekday, t, p] for t, p in self.assignments[day]))
+
+    @property
+    def total_score(self) -> float:
+        return sum(self.day_score(day) for day in range(self.days))
+
+    def day_entries(self, day: int) -> List[Dict[str, Any]]:
+        current = self.start + timedelta(days=day)
+        weekday = current.weekday()
+        entries = []
+        for topic, platform in sorted(self.assignments[day], key=lambda a: self.best_slot[weekday, a[0], a[1]]):
+            option = self.topics[topic]
+            slot = SLOTS[self.best_slot[weekday, topic, platform]]
+            entries.append({
+                "day": day + 1,
+                "date": current.isoformat(),
+                "platform": self.platform_names[platform],
+                "topic": option.topic,
+                "content_type": option.content_type,
+                "content_brief": option.content_brief,
+                "predicted_engagement": round(float(self.best_score[weekday, topic, platform]), 4),
+                "optimal_time": f"{int(slot):02d}:{int(slot % 1 * 60):02d}",
+                "target_audience": option.target_audience,
+                "hashtags": option.hashtags,
+            })
+        return entries
+
+    def iter_days(self) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+        """Plan day by day, yielding each day's entries as soon as it is filled.
+
+        Days only depend on the days before them, so this produces the same
+        calendar as ``plan`` without holding finished entries in memory.
+        """
+        for day in range(self.days):
+            self._fill_day(day)
+            yield day, self.day_entries(day)
+
+    def to_dict(self) -> Dict[str, Any]:
+        summary = CalendarSummary(self.content_types)
+        entries = []
+        for day in range(self.days):
+            for entry in self.day_entries(day):
+                summary.add(entry)
+                entries.append(entry)
+        return {"calendar": entries, **summary.to_dict()}
+
+class CalendarSummary:
+    """Running totals for the summary fields, so streams don't keep entries around."""
+
+    def __init__(self, content_types: List[str]):
+        self.content_types = content_types
+        self.mix = Counter()
+        self.themes: Dict[int, Counter] = {}
+        self.posts = 0
+        self.engagement = 0.0
+
+    def add(self, entry: Dict[str, Any]):
+        self.posts += 1
+        self.engagement += entry["predicted_engagement"]
+        self.mix[entry["content_type"]] += 1
+        if entry["content_type"] == "educational":
+            self.themes.setdefault((entry["day"] - 1) // 7, Counter())[entry["topic"]] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "weekly_themes": {
+                f"week{week + 1}": themes.most_common(1)[0][0] for week, themes in sorted(self.themes.items())
+            },
+            "content_mix": {
+                name: round(100 * self.mix[name] / max(1, self.posts)) for name in self.content_types
+            },
+            "success_metrics": {
+                "target_engagement_rate": round(self.engagement / max(1, self.posts), 4),
+                "total_predicted_engagement": round(self.engagement, 4),
+                "content_goals": ["thought leadership", "lead generation"],
+            },
+        }
+
+def hashtag(text: str) -> str:
+    return "#" + "".join(word.capitalize() if word.islower() else word for word in re.findall(r"[A-Za-z0-9]+", text))
+
+# Used for the educational slots when there is no gap analysis to draw on
+DEFAULT_EDUCATIONAL = [
+    ("{niche} Best Practices Checklist", 0.045),
+    ("Common {niche} Mistakes", 0.042),
+    ("{niche} Case Study With Real Numbers", 0.050),
+    ("{niche} Tooling Deep Dive", 0.040),
+    ("{niche} Trends This Quarter", 0.038),
+    ("Beginner's Guide to {niche}", 0.035),
+]
+
+PROMOTIONAL = [
+    ("Product Feature Spotlight", 0.028, {"linkedin": 1.1}),
+    ("Customer Success Story", 0.034, {"linkedin": 1.15}),
+    ("Webinar Invite", 0.025, {}),
+]
+
+ENGAGING = [
+    ("Poll: Biggest {niche} Challenge", 0.040, {"twitter": 1.2}),
+    ("Behind the Scenes", 0.036, {}),
+    ("Hot Take on {niche} News", 0.044, {"twitter": 1.25}),
+]
+
+def build_topics(
+    niche: str,
+    gaps: Optional[List[Dict[str, Any]]] = None,
+    hashtags: Optional[Dict[str, List[str]]] = None,
+) -> List[TopicOption]:
+    """Candidate topics: gap-analysis topics (or defaults) plus promotional and engaging formats.
+
+    ``hashtags`` maps topic names to recommended tags, replacing the
+    built-in ones for the topics it covers.
+    """
+    audience = niche_audience(niche)
+    topics = []
+    if gaps:
+        for gap in gaps:
+            # Weight competitor engagement by how open the gap still is
+            engagement = gap.get("avg_engagement", 0.04) * (0.5 + gap.get("opportunity_score", 0.5))
+            topics.append(TopicOption(
+                gap["topic"], GAP_CONTENT_TYPE, engagement, audience,
+                f"Fill the gap on {gap['topic']}: {gap.get('suggested_angle', 'practical guide')}.",
+                [hashtag(gap["topic"]), hashtag(niche)],
+            ))
+    else:
+        for template, engagement in DEFAULT_EDUCATIONAL:
+            title = template.format(niche=niche)
+            topics.append(TopicOption(
+                title, "educational", engagement, audience,
+                f"Actionable post on {title.lower()} with concrete examples and steps.",
+                [hashtag(niche), "#Tips"],
+            ))
+    for template, engagement, fit in PROMOTIONAL:
+        title = template.format(niche=niche)
+        topics.append(TopicOption(
+            title, "promotional", engagement, "prospective customers",
+            f"{title} tied to a {niche} outcome, with a clear call to action.",
+            [hashtag(niche)], fit,
+        ))
+    for template, engagement, fit in ENGAGING:
+        title = template.format(niche=niche)
+        topics.append(TopicOption(
+            title, "engaging", engagement, "community followers",
+            f"{title}; invite replies and answer in the comments.",
+            [hashtag(niche), "#Community"], fit,
+        ))
+    for option in topics:
+        option.hashtags = (hashtags or {}).get(option.topic, option.hashtags)
+    return topics
+
+def create_plan(
+    niche: str,
+    days: int,
+    gaps: Optional[List[Dict[str, Any]]] = None,
+    start: Optional[date] = None,
+    posts_per_day: int = 1,
+    timing: Optional[np.ndarray] = None,
+    recent_similarity: Optional[Dict[str, float]] = None,
+    hashtags: Optional[Dict[str, List[str]]] = None,
+) -> CalendarPlan:
+    """An empty plan for the niche; call ``plan`` or iterate ``iter_days`` to fill it."""
+    start = start or date.today() + timedelta(days=1)
+    return CalendarPlan(
+        build_topics(niche, gaps, hashtags), start, days,
+        posts_per_day=posts_per_day, timing=timing, recent_similarity=recent_similarity,
+    )
+
+def plan_calendar(
+    niche: str,
+    days: int,
+    gaps: Optional[List[Dict[str, Any]]] = None,
+    start: Optional[date] = None,
+    posts_per_day: int = 1,
+    timing: Optional[np.ndarray] = None,
+    recent_similarity: Optional[Dict[str, float]] = None,
+    hashtags: Optional[Dict[str, List[str]]] = None,
+) -> CalendarPlan:
+    return create_plan(niche, days, gaps, start, posts_per_day, timing, recent_similarity, hashtags).plan()
+
+def generate_calendar(
+    niche: str,
+    days: int,
+    gaps: Optional[List[Dict[str, Any]]] = None,
+    start: Optional[date] = None,
+    timing: Optional[np.ndarray] = None,
+    recent_similarity: Optional[Dict[str, float]] = None,
+    hashtags: Optional[Dict[str, List[str]]] = None,
+) -> Dict[str, Any]:
+    """Plan and serialize in one call, for running in a worker process."""
+    return plan_calendar(
+        niche, days, gaps, start, timing=timing, recent_similarity=recent_similarity, hashtags=hashtags
+    ).to_dict()
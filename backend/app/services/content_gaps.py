@@ -0,0 +1,401 @@
+import asyncio
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from sqlalchemy import func, select
+from app.config import settings
+from app.database.models import ContentPost
+from app.database.session import async_session, engine
+from app.services.calendar_planner import GAP_CONTENT_TYPE, PLATFORMS, niche_audience
+from app.services.embedding_store import embedding_store
+from app.services.engagement_model import CONTENT_TYPES, audience_bucket, engagement_model, platform_index
+from app.services.embeddings import Embedder
+from app.services.near_duplicates import DUPLICATE_THRESHOLD, MinHashLSH, minhash
+from app.services.text_index import text_index
+from app.services.trends import trend_detector
+from app.services.vector_index import IVFIndex, normalize_rows, top_k
+
+logger = logging.getLogger(__name__)
+
+# Share of a keyword-filtered candidate's relevance that comes from its BM25 score
+KEYWORD_WEIGHT = 0.3
+
+class PostCorpus:
+    """One side of the comparison: an ANN index plus per-row metadata arrays."""
+
+    def __init__(self, dim: int):
+        self.index = IVFIndex(dim)
+        self.engagement = np.empty(0, dtype=np.float32)
+        self.topic_codes = np.empty(0, dtype=np.int32)
+        # content_posts id -> row, for joining text search hits to vectors
+        self.rows: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def add(self, vectors: np.ndarray, engagement: Sequence[float], topic_codes: Sequence[int], post_ids: Sequence[Optional[int]]):
+        start = len(self.index)
+        self.rows.update((post_id, start + i) for i, post_id in enumerate(post_ids) if post_id is not None)
+        self.index.add(vectors)
+        self.engagement = np.concatenate([self.engagement, np.asarray(engagement, dtype=np.float32)])
+        self.topic_codes = np.concatenate([self.topic_codes, np.asarray(topic_codes, dtype=np.int32)])
+
+class ContentGapEngine:
+    """Finds topics competitors do well on that our own posts don't cover.
+
+    A niche query pulls the nearest competitor posts from the ANN index and
+    groups them by topic. Each topic centroid is checked against our posts
+    in one batched search; the best similarity is that topic's coverage.
+    Opportunity is relevance x predicted engagement x (1 - coverage).
+    Given ``keywords``, candidates are the competitor posts the BM25 text
+    index matches instead, with relevance blending both scores.
+
+    Competitor posts are indexed per niche and our posts per brand, so a
+    brand's coverage only counts its own posts. A niche with no competitor
+    posts yet is searched across every niche; without a brand, coverage
+    counts all of our posts.
+
+    With ``backend="tidb"``, or when nothing is loaded locally on a MySQL
+    connection, candidates and coverage come from TiDB's
+    ``VEC_COSINE_DISTANCE`` over ``content_posts`` instead.
+
+    ``add_posts`` runs in worker threads while ``analyze`` runs on the
+    event loop, so corpora are only changed or searched under ``_lock``
+    and analyze does its local searches in a thread too.
+    """
+
+    def __init__(self, embedder: Optional[Embedder] = None, backend: str = "local", candidates: int = 2000):
+        self.embedder = embedder or embedding_store
+        self.backend = backend
+        self.candidates = candidates
+        # Keyed by brand id, and by trend_detector.niche_key
+        self.ours: Dict[Optional[int], PostCorpus] = {}
+        self.competitors: Dict[str, PostCorpus] = {}
+        self.topics: List[str] = []
+        self._topic_codes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Kept alongside the corpora so readers on the event loop never iterate them unlocked
+        self.competitor_posts = 0
+
+    def _corpus(self, corpora: Dict[Any, PostCorpus], key: Any) -> PostCorpus:
+        corpus = corpora.get(key)
+        if corpus is None:
+            corpus = corpora[key] = PostCorpus(self.embedder.dim)
+        return corpus
+
+    def _topic_code(self, topic: Optional[str]) -> int:
+        topic = topic or "General"
+        code = self._topic_codes.get(topic)
+        if code is None:
+            code = self._topic_codes[topic] = len(self.topics)
+            self.topics.append(topic)
+        return code
+
+    @property
+    def use_remote(self) -> bool:
+        if self.backend == "tidb":
+            return True
+        return self.competitor_posts == 0 and engine.dialect.name == "mysql"
+
+    @property
+    def is_empty(self) -> bool:
+        return self.competitor_posts == 0 and not self.use_remote
+
+    def add_posts(self, posts: List[Dict[str, Any]]):
+        """Add posts given as dicts with id, content_text, topic, engagement_rate,
+        is_competitor, brand_id, niche and an optional precomputed content_embedding."""
+        missing = [i for i, post in enumerate(posts) if post.get("content_embedding") is None]
+        embedded = self.embedder.embed([posts[i]["content_text"] for i in missing]) if missing else None
+        vectors = np.empty((len(posts), self.embedder.dim), dtype=np.float32)
+        for i, post in enumerate(posts):
+            if post.get("content_embedding") is not None:
+                vectors[i] = post["content_embedding"]
+        if missing:
+            vectors[missing] = embedded
+
+        engagement = np.array([post.get("engagement_rate") or 0.0 for post in posts], dtype=np.float32)
+        post_ids = np.array([post.get("id") for post in posts], dtype=object)
+        groups: Dict[Any, List[int]] = {}
+        for i, post in enumerate(posts):
+            if post.get("is_competitor"):
+                key = (True, trend_detector.niche_key(post.get("niche")))
+            else:
+                key = (False, post.get("brand_id"))
+            groups.setdefault(key, []).append(i)
+        with self._lock:
+            codes = np.array([self._topic_code(post.get("topic")) for post in posts], dtype=np.int32)
+            for (competitor, key), rows in groups.items():
+                corpus = self._corpus(self.competitors if competitor else self.ours, key)
+                corpus.add(vectors[rows], engagement[rows], codes[rows], post_ids[rows])
+                if competitor:
+                    self.competitor_posts += len(rows)
+
+    async def load_from_db(self, batch_size: int = 5000) -> int:
+        columns = (
+            ContentPost.id,
+            ContentPost.content_text,
+            ContentPost.topic,
+            ContentPost.engagement_rate,
+            ContentPost.is_competitor,
+            ContentPost.brand_id,
+            ContentPost.niche,
+            ContentPost.content_embedding,
+        )
+        loaded = 0
+        async with async_session() as db:
+            result = await db.stream(select(*columns).execution_options(yield_per=batch_size))
+            async for rows in result.partitions(batch_size):
+                posts = [dict(row._mapping) for row in rows]
+                await asyncio.to_thread(self.add_posts, posts)
+                loaded += len(rows)
+        logger.info("Loaded %d posts into the content gap index", loaded)
+        return loaded
+
+    async def analyze(
+        self, niche: str, max_gaps: int = 5, keywords: Optional[str] = None, brand_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        # Repeat niches are served from the embedding store without recomputing
+        query = (await asyncio.to_thread(self.embedder.embed, [niche]))[0]
+        matches = None
+        if keywords:
+            post_ids, text_scores = text_index.search(keywords, k=self.candidates, competitor=True)
+            if post_ids.size == 0:
+                return self._empty_analysis()
+            matches = dict(zip(post_ids.tolist(), (text_scores / text_scores.max()).tolist()))
+        if self.use_remote:
+            vectors, relevance, topics, engagement = await self._remote_candidates(query, niche, matches)
+        else:
+            vectors, relevance, topics, engagement = await asyncio.to_thread(
+                self._local_candidates, query, niche, matches
+            )
+
+        relevant = relevance > 0
+        vectors, relevance, topics, engagement = (
+            vectors[relevant], relevance[relevant], topics[relevant], engagement[relevant]
+        )
+        if relevance.size == 0:
+            return self._empty_analysis()
+
+        names, labels = np.unique(topics, return_inverse=True)
+        count = np.bincount(labels, minlength=names.size)
+        topic_relevance = np.bincount(labels, weights=relevance) / count
+        topic_engagement = np.bincount(labels, weights=engagement) / count
+        # Relevance-weighted centroid of each topic's competitor posts
+        sums = np.zeros((names.size, vectors.shape[1]), dtype=np.float32)
+        np.add.at(sums, labels, vectors * relevance[:, None])
+        centroids = normalize_rows(sums)
+
+        if self.use_remote:
+            coverage = await self._remote_coverage(centroids, brand_id)
+        else:
+            coverage = await asyncio.to_thread(self._local_coverage, centroids, brand_id)
+
+        # What we could expect posting on each topic at its best planned platform and time,
+        # as the content type and audience the calendar plans gap topics for
+        predicted = engagement_model.predict_grid(
+            topic_engagement,
+            np.full(names.size, CONTENT_TYPES.index(GAP_CONTENT_TYPE), dtype=np.int64),
+            np.full(names.size, audience_bucket(niche_audience(niche)), dtype=np.int64),
+            platform_index(list(PLATFORMS)),
+        ).max(axis=(0, 2, 3))
+        opportunity = topic_relevance * (predicted / (predicted.max() or 1.0)) * (1.0 - coverage)
+        order = np.argsort(-opportunity)
+
+        gaps = []
+        # Skip topics that only reword a higher-ranked gap
+        chosen = MinHashLSH(window=max_gaps)
+        for i in order:
+            if len(gaps) == max_gaps:
+                break
+            signature = minhash(str(names[i]))
+            if chosen.nearest(signature)[0] >= DUPLICATE_THRESHOLD:
+                continue
+            chosen.add(signature)
+            gaps.append({
+                "topic": str(names[i]),
+                "opportunity_score": round(float(opportunity[i]), 3),
+                "reasoning": (
+                    f"{int(count[i])} competitor posts at {topic_engagement[i]:.1%} avg engagement, "
+                    f"your coverage {coverage[i]:.0%}"
+                ),
+                "suggested_angle": (
+                    "First post on this topic for your audience" if coverage[i] < 0.3
+                    else "Go deeper than your existing posts on this topic"
+                ),
+                "competitor_posts": int(count[i]),
+                "avg_engagement": round(float(topic_engagement[i]), 4),
+                "predicted_engagement": round(float(predicted[i]), 4),
+                "coverage": round(float(coverage[i]), 3),
+            })
+
+        trends = trend_detector.top(niche, 3)
+        if trends:
+            trending_themes = [trend["topic"] for trend in trends]
+            trending_count = trend_detector.trending_count(niche)
+        else:
+            # No recent stream for this niche; fall back to the candidates' own engagement
+            trending = np.argsort(-(topic_engagement * np.log1p(count)))
+            trending_themes = [str(names[i]) for i in trending[:3]]
+            trending_count = int(names.size)
+        our_engagement = await self._our_engagement(query, brand_id)
+        competitor_engagement = float(engagement.mean())
+        return {
+            "content_gaps": gaps,
+            "trending_themes": trending_themes,
+            "recommendations": [f"Create content on {gap['topic']}" for gap in gaps[:3]],
+            "quantitative_insights": {
+                "your_avg_engagement": round(our_engagement, 4),
+                "competitor_avg_engagement": round(competitor_engagement, 4),
+                "engagement_gap": round(competitor_engagement - our_engagement, 4),
+                "trending_topics_count": trending_count,
+            },
+        }
+
+    def _empty_analysis(self) -> Dict[str, Any]:
+        return {
+            "content_gaps": [],
+            "trending_themes": [],
+            "recommendations": [],
+            "quantitative_insights": {
+                "your_avg_engagement": 0.0,
+                "competitor_avg_engagement": 0.0,
+                "engagement_gap": 0.0,
+                "trending_topics_count": 0,
+            },
+        }
+
+    def _competitor_corpora(self, niche: str) -> List[PostCorpus]:
+        corpus = self.competitors.get(trend_detector.niche_key(niche))
+        return [corpus] if corpus is not None and len(corpus) else list(self.competitors.values())
+
+    def _our_corpora(self, brand_id: Optional[int]) -> List[PostCorpus]:
+        if brand_id is None:
+            return list(self.ours.values())
+        return [self.ours[brand_id]] if brand_id in self.ours else []
+
+    def _local_candidates(self, query: np.ndarray, niche: str, matches: Optional[Dict[int, float]] = None):
+        vectors, scores, codes, engagement = [], [], [], []
+        with self._lock:
+            for corpus in self._competitor_corpora(niche):
+                if matches is None:
+                    ids, corpus_scores = corpus.index.search(query, k=self.candidates)
+                    keep = ids >= 0
+                    ids, corpus_scores = ids[keep], corpus_scores[keep]
+                else:
+                    # Keyword hits are the candidates, ranked on both their text and vector scores
+                    hits = [(row, score) for post_id, score in matches.items() if (row := corpus.rows.get(post_id)) is not None]
+                    ids = np.array([row for row, _ in hits], dtype=np.int64)
+                    text_scores = np.array([score for _, score in hits], dtype=np.float32)
+                    similarity = corpus.index.vectors[ids] @ normalize_rows(query[None, :])[0]
+                    corpus_scores = hybrid_relevance(similarity, text_scores)
+                vectors.append(corpus.index.vectors[ids])
+                scores.append(corpus_scores)
+                codes.append(corpus.topic_codes[ids])
+                engagement.append(corpus.engagement[ids])
+            topic_names = np.array(self.topics, dtype=object)
+        if not vectors:
+            empty = np.empty(0, dtype=np.float32)
+            return np.empty((0, self.embedder.dim), dtype=np.float32), empty, np.empty(0, dtype=object), empty
+        scores = np.concatenate(scores)
+        # Searching several niches returns up to candidates from each; keep the best overall
+        best = top_k(scores, self.candidates)
+        return (
+            np.concatenate(vectors)[best],
+            scores[best],
+            topic_names[np.concatenate(codes)[best]],
+            np.concatenate(engagement)[best],
+        )
+
+    def _local_coverage(self, centroids: np.ndarray, brand_id: Optional[int] = None) -> np.ndarray:
+        coverage = np.zeros(centroids.shape[0])
+        with self._lock:
+            for corpus in self._our_corpora(brand_id):
+                if len(corpus):
+                    _, scores = corpus.index.search_batch(centroids, k=1)
+                    coverage = np.maximum(coverage, scores[:, 0])
+        return np.clip(coverage, 0.0, 1.0)
+
+    def _local_engagement(self, query: np.ndarray, brand_id: Optional[int]) -> float:
+        with self._lock:
+            if brand_id is not None:
+                corpus = self.ours.get(brand_id)
+                if corpus is None or len(corpus) == 0:
+                    return 0.0
+                ids, scores = corpus.index.search(query, k=self.candidates)
+                ids = ids[(ids >= 0) & (scores > 0)]
+                return float(corpus.engagement[ids].mean()) if ids.size else 0.0
+            # Mean over every brand's most relevant posts, weighted by how many each has
+            total, count = 0.0, 0
+            for corpus in self.ours.values():
+                ids, scores = corpus.index.search(query, k=self.candidates)
+                ids = ids[(ids >= 0) & (scores > 0)]
+                total += float(corpus.engagement[ids].sum())
+                count += ids.size
+            return total / count if count else 0.0
+
+    async def _our_engagement(self, query: np.ndarray, brand_id: Optional[int] = None) -> float:
+        if self.use_remote:
+            stmt = select(func.avg(ContentPost.engagement_rate)).where(ContentPost.is_competitor.is_(False))
+            if brand_id is not None:
+                stmt = stmt.where(ContentPost.brand_id == brand_id)
+            async with async_session() as db:
+                value = await db.scalar(stmt)
+            return float(value or 0.0)
+        return await asyncio.to_thread(self._local_engagement, query, brand_id)
+
+    async def _remote_candidates(self, query: np.ndarray, niche: str, matches: Optional[Dict[int, float]] = None):
+        distance = func.vec_cosine_distance(ContentPost.content_embedding, _vector_literal(query))
+        stmt = (
+            select(
+                ContentPost.id,
+                ContentPost.content_embedding,
+                ContentPost.topic,
+                ContentPost.engagement_rate,
+                distance.label("distance"),
+            )
+            .where(ContentPost.is_competitor.is_(True))
+            .order_by(distance)
+            .limit(self.candidates)
+        )
+        if matches is not None:
+            stmt = stmt.where(ContentPost.id.in_(list(matches)))
+        async with async_session() as db:
+            rows = (await db.execute(stmt.where(func.lower(ContentPost.niche) == trend_detector.niche_key(niche)))).all()
+            if not rows:
+                # Same fallback as locally: a niche with no posts yet searches them all
+                rows = (await db.execute(stmt)).all()
+        if not rows:
+            empty = np.empty(0, dtype=np.float32)
+            return np.empty((0, self.embedder.dim), dtype=np.float32), empty, np.empty(0, dtype=object), empty
+        vectors = normalize_rows(np.array([row.content_embedding for row in rows], dtype=np.float32))
+        relevance = 1.0 - np.array([row.distance for row in rows], dtype=np.float32)
+        if matches is not None:
+            relevance = hybrid_relevance(relevance, np.array([matches[row.id] for row in rows], dtype=np.float32))
+        topics = np.array([row.topic or "General" for row in rows], dtype=object)
+        engagement = np.array([row.engagement_rate or 0.0 for row in rows], dtype=np.float32)
+        return vectors, relevance, topics, engagement
+
+    async def _remote_coverage(self, centroids: np.ndarray, brand_id: Optional[int] = None) -> np.ndarray:
+        coverage = np.zeros(centroids.shape[0])
+        async with async_session() as db:
+            for i, centroid in enumerate(centroids):
+                # ORDER BY distance LIMIT 1 lets TiDB use the vector index
+                distance = func.vec_cosine_distance(ContentPost.content_embedding, _vector_literal(centroid))
+                stmt = select(distance).where(ContentPost.is_competitor.is_(False))
+                if brand_id is not None:
+                    stmt = stmt.where(ContentPost.brand_id == brand_id)
+                nearest = await db.scalar(stmt.order_by(distance).limit(1))
+                if nearest is not None:
+                    coverage[i] = min(max(1.0 - float(nearest), 0.0), 1.0)
+        return coverage
+
+def hybrid_relevance(similarity: np.ndarray, text_scores: np.ndarray) -> np.ndarray:
+    """Blend cosine similarity with BM25 scores normalized to the best hit."""
+    return (1.0 - KEYWORD_WEIGHT) * similarity + KEYWORD_WEIGHT * text_scores
+
+def _vector_literal(vector: np.ndarray) -> str:
+    return json.dumps([round(float(x), 6) for x in vector], separators=(",", ":"))
+
+content_gap_engine = ContentGapEngine(backend=settings.CONTENT_GAPS_BACKEND)
@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+from app.database.models import Brand, ContentPost, DashboardEventRecord
+from app.database.session import async_session
+
+logger = logging.getLogger(__name__)
+
+REACH, ENGAGEMENTS, PUBLISHED, PLANNED = range(4)
+
+LOOKBACK_HOURS = 14 * 24
+LOOKAHEAD_HOURS = 7 * 24
+# Stored events outlive the rings so posting-time histograms can replay them
+EVENT_RETENTION_DAYS = 90
+# Ids below the watermark that are re-read each sync, in case their inserts committed late
+SYNC_OVERLAP = 256
+
+def current_hour(now: Optional[float] = None) -> int:
+    return int((time.time() if now is None else now) // 3600)
+
+def hour_of(moment: datetime) -> int:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() // 3600)
+
+class HourlyRing:
+    """Fixed ring of hourly buckets covering two weeks back and one ahead.
+
+    Each slot remembers which absolute hour it holds, so a write to a slot
+    still holding an older hour resets it first and nothing ever has to be
+    swept. Window sums are one masked reduction over the ring.
+    """
+
+    def __init__(self, lookback_hours: int = LOOKBACK_HOURS, lookahead_hours: int = LOOKAHEAD_HOURS):
+        self.lookback_hours = lookback_hours
+        self.lookahead_hours = lookahead_hours
+        self.size = lookback_hours + lookahead_hours
+        self.hours = np.full(self.size, -1, dtype=np.int64)
+        self.values = np.zeros((self.size, 4), dtype=np.float64)
+        self.events = 0
+
+    def add(self, hour: int, column: int, amount: float, now_hour: Optional[int] = None) -> bool:
+        now_hour = current_hour() if now_hour is None else now_hour
+        if not now_hour - self.lookback_hours < hour <= now_hour + self.lookahead_hours - 1:
+            return False
+        slot = hour % self.size
+        if self.hours[slot] != hour:
+            self.hours[slot] = hour
+            self.values[slot] = 0.0
+        self.values[slot, column] += amount
+        self.events += 1
+        return True
+
+    def window(self, start_hour: int, end_hour: int) -> np.ndarray:
+        """Column sums over hours in [start_hour, end_hour)."""
+        mask = (self.hours >= start_hour) & (self.hours < end_hour)
+        return self.values[mask].sum(axis=0)
+
+    def next_hour(self, column: int, from_hour: int) -> Optional[int]:
+        mask = (self.hours >= from_hour) & (self.values[:, column] > 0)
+        return int(self.hours[mask].min()) if mask.any() else None
+
+def account_key(user_id: int) -> Hashable:
+    return ("user", user_id)
+
+class DashboardMetrics:
+    """Per-brand hourly rollups behind the dashboard overview.
+
+    Events update one bucket in the brand's ring and one in the owning
+    account's ring (``account_key``), so an agency's all-brands overview
+    costs the same as a single brand's.
+
+    Events are stored in dashboard_events and every worker applies them by
+    tailing that table every ``sync_interval`` seconds, so restarts keep
+    the counts and all workers report the same numbers once synced.
+    Ids just below the watermark are re-read on each sync and skipped if
+    already applied, which catches inserts that commit out of id order.
+    ``observers`` get each newly applied batch of events.
+    """
+
+    def __init__(self, sync_interval: float = 2.0):
+        self.rings: Dict[Hashable, HourlyRing] = {}
+        self.sync_interval = sync_interval
+        self.last_event_id = 0
+        self._applied: Set[int] = set()
+        self.observers: List[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = []
+        self._sync_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _add(self, keys: List[Hashable], moment: datetime, column: int, amount: float):
+        hour = hour_of(moment)
+        now_hour = current_hour()
+        for key in keys:
+            ring = self.rings.get(key)
+            if ring is None:
+                ring = self.rings[key] = HourlyRing()
+            if not ring.add(hour, column, amount, now_hour):
+                return
+
+    def record_engagement(self, keys: List[Hashable], moment: datetime, reach: float = 0, engagements: float = 0):
+        # Events carry increments, so a post's engagement can arrive over several updates
+        if reach:
+            self._add(keys, moment, REACH, reach)
+        if engagements:
+            self._add(keys, moment, ENGAGEMENTS, engagements)
+
+    def record_published(self, keys: List[Hashable], moment: datetime, count: int = 1):
+        self._add(keys, moment, PUBLISHED, count)
+
+    def record_planned(self, keys: List[Hashable], moment: datetime, count: int = 1):
+        # A negative count unschedules a post
+        self._add(keys, moment, PLANNED, count)
+
+    def apply(self, event: Dict[str, Any]):
+        keys = [event["brand_id"], account_key(event["user_id"])]
+        if event["type"] == "engagement":
+            self.record_engagement(keys, event["at"], event["reach"] or 0, event["engagements"] or 0)
+        elif event["type"] == "published":
+            self.record_published(keys, event["at"], event["count"])
+        else:
+            self.record_planned(keys, event["at"], event["count"])
+
+    def add_observer(self, observer: Callable[[List[Dict[str, Any]]], Awaitable[None]]):
+        self.observers.append(observer)
+
+    async def record_events(self, events: List[Dict[str, Any]]):
+        """Store events and apply them here at once; other workers pick them up on their next sync."""
+        async with async_session() as db:
+            await db.execute(insert(DashboardEventRecord.__table__), events)
+            await db.commit()
+        await self.sync()
+
+    async def sync(self) -> int:
+        """Apply stored events this worker hasn't seen; returns how many."""
+        async with self._sync_lock:
+            async with async_session() as db:
+                rows = (await db.execute(
+                    select(DashboardEventRecord.__table__)
+                    .where(DashboardEventRecord.id > self.last_event_id - SYNC_OVERLAP)
+                    .order_by(DashboardEventRecord.id)
+                )).mappings().all()
+            events = [dict(row) for row in rows if row["id"] not in self._applied]
+            for event in events:
+                self.apply(event)
+                self._applied.add(event["id"])
+            if rows:
+                self.last_event_id = max(self.last_event_id, rows[-1]["id"])
+            self._applied = {event_id for event_id in self._applied if event_id > self.last_event_id - SYNC_OVERLAP}
+        if events:
+            for observer in self.observers:
+                try:
+                    await observer(events)
+                except Exception:
+                    logger.exception("Dashboard event observer %r failed", observer)
+        return len(events)
+
+    async def purge(self) -> int:
+        cutoff = datetime.utcnow() - timedelta(days=EVENT_RETENTION_DAYS)
+        async with async_session() as db:
+            result = await db.execute(delete(DashboardEventRecord).where(DashboardEventRecord.at < cutoff))
+            await db.commit()
+        return result.rowcount
+
+    async def _run_forever(self):
+        purged_at = 0.0
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+                if time.time() - purged_at > 3600:
+                    await self.purge()
+                    purged_at = time.time()
+            except Exception:
+                logger.exception("Dashboard event sync failed")
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def has_data(self, key: Hashable) -> bool:
+        ring = self.rings.get(key)
+        return ring is not None and ring.events > 0
+
+    def overview(self, key: Hashable, now: Optional[float] = None) -> Dict[str, Any]:
+        """Overview for a brand id or an ``account_key``."""
+        ring = self.rings.get(key) or HourlyRing()
+        now_hour = current_hour(now)
+        this_week = ring.window(now_hour - 167, now_hour + 1).tolist()
+        last_week = ring.window(now_hour - 335, now_hour - 167).tolist()
+
+        # Calendar week (Monday 00:00 UTC onwards) for planned vs published
+        today = datetime.fromtimestamp(now_hour * 3600, tz=timezone.utc)
+        monday = (today - timedelta(days=today.weekday())).replace(hour=0)
+        week_start = hour_of(monday)
+        calendar_week = ring.window(week_start, week_start + 168).tolist()
+
+        rate = this_week[ENGAGEMENTS] / this_week[REACH] if this_week[REACH] else 0.0
+        improvement = 0.0
+        if last_week[ENGAGEMENTS]:
+            improvement = (this_week[ENGAGEMENTS] - last_week[ENGAGEMENTS]) / last_week[ENGAGEMENTS] * 100
+        next_hour = ring.next_hour(PLANNED, now_hour)
+        return {
+            "content_calendar": {
+                "planned_this_week": int(calendar_week[PLANNED]),
+                "published_this_week": int(calendar_week[PUBLISHED]),
+                "avg_engagement_rate": round(rate, 4),
+                "next_post": (
+                    datetime.fromtimestamp(next_hour * 3600, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+                    if next_hour is not None else None
+                ),
+            },
+            "performance": {
+                "total_reach_7d": int(this_week[REACH]),
+                "total_engagement_7d": int(this_week[ENGAGEMENTS]),
+                "avg_engagement_rate_7d": round(rate, 4),
+                "improvement_vs_last_week": round(improvement, 1),
+                "trending_up": improvement > 0,
+            },
+        }
+
+    async def load_from_db(self) -> int:
+        """Seed the rings with our own posts and stored events in the lookback window."""
+        cutoff = datetime.utcnow() - timedelta(hours=LOOKBACK_HOURS)
+        loaded = 0
+        async with async_session() as db:
+            result = await db.stream(
+                select(
+                    ContentPost.brand_id, Brand.user_id, ContentPost.published_at,
+                    ContentPost.reach, ContentPost.engagement_rate,
+                )
+                .join(Brand, Brand.id == ContentPost.brand_id)
+                .where(
+                    ContentPost.is_competitor.is_(False),
+                    ContentPost.published_at >= cutoff,
+                )
+                .execution_options(yield_per=5000)
+            )
+            async for brand_id, user_id, published_at, reach, engagement_rate in result:
+                reach = reach or 0
+                keys = [brand_id, account_key(user_id)]
+                self.record_published(keys, published_at)
+                self.record_engagement(keys, published_at, reach, reach * (engagement_rate or 0.0))
+                loaded += 1
+
+            self.last_event_id = await db.scalar(select(func.max(DashboardEventRecord.id))) or 0
+            result = await db.stream(
+                select(DashboardEventRecord.__table__)
+                .where(DashboardEventRecord.at >= cutoff)
+                .execution_options(yield_per=5000)
+            )
+            async for row in result.mappings():
+                self.apply(row)
+                loaded += 1
+            # Everything up to the watermark counts as applied, including events too old for the rings
+            self._applied = set((await db.execute(
+                select(DashboardEventRecord.id).where(DashboardEventRecord.id > self.last_event_id - SYNC_OVERLAP)
+            )).scalars())
+        logger.info("Seeded dashboard rollups from %d posts and events", loaded)
+        return loaded
+
+dashboard_metrics = DashboardMetrics()
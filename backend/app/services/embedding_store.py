@@ -0,0 +1,202 @@
+import fcntl
+import hashlib
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from app.config import settings
+from app.services.embeddings import Embedder, create_embedder, normalize_text
+
+KEYS_FILE = re.compile(r"^keys(?:\.(\d+))?\.u64$")
+
+class EmbeddingStore(Embedder):
+    """Content-addressed cache of embeddings, shared between processes.
+
+    Vectors are appended to ``vectors.f32`` (raw float32 rows) and their
+    keys, a 64-bit hash of the normalized text, to ``keys.u64`` in the same
+    order, so a key's position is its row. Readers memory-map the vector
+    file, so every worker shares one copy through the page cache. Appends
+    take an exclusive ``flock``; other processes pick new rows up the next
+    time they miss. Each embedder gets its own directory, keyed by its name.
+
+    The files form a generation. Once the current one holds half of
+    ``max_rows``, the writer starts the next (``vectors.N.f32`` and
+    ``keys.N.u64``) and deletes the one before the current. Lookups see
+    the current and previous generations, and ``embed`` copies hits from
+    the previous one forward, so what is still used survives and disk and
+    each worker's key map stay within ``max_rows``.
+    """
+
+    def __init__(self, path: str, embedder: Embedder, max_rows: int = 500000):
+        self.embedder = embedder
+        self.dim = embedder.dim
+        self.name = embedder.name
+        self.segment_rows = max(1, max_rows // 2)
+        self.directory = os.path.join(path, embedder.name)
+        self._lock_path = os.path.join(self.directory, ".lock")
+        self._generation = -1
+        self._rows: Dict[int, int] = {}
+        self._count = 0
+        self._mmap: Optional[np.memmap] = None
+        self._previous_rows: Dict[int, int] = {}
+        self._previous: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "rotations": 0}
+
+    def __len__(self) -> int:
+        return self._count + len(self._previous_rows)
+
+    @staticmethod
+    def key(text: str) -> int:
+        digest = hashlib.blake2b(normalize_text(text).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little")
+
+    def _paths(self, generation: int) -> Tuple[str, str]:
+        # Generation 0 keeps the original file names
+        suffix = f".{generation}" if generation else ""
+        return (
+            os.path.join(self.directory, f"vectors{suffix}.f32"),
+            os.path.join(self.directory, f"keys{suffix}.u64"),
+        )
+
+    def _generations(self) -> List[int]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        matches = [KEYS_FILE.match(name) for name in names]
+        return sorted(int(match.group(1) or 0) for match in matches if match)
+
+    def _read_segment(self, generation: int, start: int = 0) -> Tuple[np.ndarray, Optional[np.memmap]]:
+        vectors_path, keys_path = self._paths(generation)
+        try:
+            count = os.path.getsize(keys_path) // 8
+            with open(keys_path, "rb") as f:
+                f.seek(start * 8)
+                keys = np.frombuffer(f.read((count - start) * 8), dtype="<u8")
+        except FileNotFoundError:
+            return np.empty(0, dtype="<u8"), None
+        if count == 0:
+            return keys, None
+        return keys, np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+
+    def _refresh(self):
+        # Pick up rows appended since we last looked, by this or another process
+        generations = self._generations()
+        if not generations:
+            return
+        generation = generations[-1]
+        if generation != self._generation:
+            # Another writer rotated: the old current generation is now the previous one
+            keys, self._previous = self._read_segment(generation - 1)
+            self._previous_rows = {}
+            for row, key in enumerate(keys.tolist()):
+                self._previous_rows.setdefault(key, row)
+            self._generation = generation
+            self._rows, self._count, self._mmap = {}, 0, None
+
+        new_keys, mmap = self._read_segment(generation, self._count)
+        if new_keys.size == 0:
+            return
+        for offset, key in enumerate(new_keys.tolist()):
+            self._rows.setdefault(key, self._count + offset)
+        self._count += new_keys.size
+        self._mmap = mmap
+
+    def _lookup(self, key: int) -> Optional[np.ndarray]:
+        row = self._rows.get(key)
+        if row is not None:
+            return self._mmap[row]
+        row = self._previous_rows.get(key)
+        return None if row is None else self._previous[row]
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """Cached vector for ``text`` as a read-only view into the map, or None."""
+        key = self.key(text)
+        with self._lock:
+            vector = self._lookup(key)
+            if vector is None:
+                self._refresh()
+                vector = self._lookup(key)
+            return vector
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        keys = [self.key(text) for text in texts]
+        with self._lock:
+            if any(key not in self._rows and key not in self._previous_rows for key in keys):
+                self._refresh()
+            missing: Dict[int, str] = {}
+            # Hits in the previous generation are carried into the current one
+            carried: Dict[int, np.ndarray] = {}
+            for key, text in zip(keys, texts):
+                if key not in self._rows:
+                    row = self._previous_rows.get(key)
+                    if row is not None:
+                        carried[key] = np.array(self._previous[row])
+                    else:
+                        missing.setdefault(key, text)
+        self.stats["hits"] += len(keys) - len(missing)
+        self.stats["misses"] += len(missing)
+
+        fresh = dict(carried)
+        if missing:
+            # Embed outside the lock; a slow remote embedder shouldn't block cache hits
+            vectors = self.embedder.embed(list(missing.values()))
+            fresh.update(zip(missing, vectors))
+        if fresh:
+            with self._lock:
+                self._append(list(fresh), np.stack(list(fresh.values())))
+
+        with self._lock:
+            if not keys:
+                return np.empty((0, self.dim), dtype=np.float32)
+            return np.stack([fresh[key] if key in fresh else self._lookup(key) for key in keys]).astype(np.float32)
+
+    def _rotate(self):
+        """Start the next generation and delete all but the current one; caller holds the flock."""
+        generation = self._generation + 1
+        for path in self._paths(generation):
+            open(path, "ab").close()
+        for old in self._generations():
+            if old < self._generation:
+                for path in self._paths(old):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+        self.stats["rotations"] += 1
+        self._refresh()
+
+    def _append(self, keys: List[int], vectors: np.ndarray):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                if self._generation < 0:
+                    self._generation = 0
+                fresh = [i for i, key in enumerate(keys) if key not in self._rows]
+                if not fresh:
+                    return
+                if self._count and self._count + len(fresh) > self.segment_rows:
+                    self._rotate()
+                vectors_path, keys_path = self._paths(self._generation)
+                # Drop any partial row a crashed writer left behind
+                for path, row_size in ((vectors_path, self.dim * 4), (keys_path, 8)):
+                    if os.path.exists(path) and os.path.getsize(path) != self._count * row_size:
+                        os.truncate(path, self._count * row_size)
+                # Vectors go first so a key never points past the end of the vector file
+                with open(vectors_path, "ab") as f:
+                    f.write(np.ascontiguousarray(vectors[fresh], dtype="<f4").tobytes())
+                with open(keys_path, "ab") as f:
+                    f.write(np.array([keys[i] for i in fresh], dtype="<u8").tobytes())
+                self._refresh()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+embedding_store = EmbeddingStore(
+    settings.EMBEDDING_STORE_PATH,
+    create_embedder(settings.EMBEDDER, settings.EMBEDDING_DIM, settings.OPENAI_API_KEY),
+    max_rows=settings.EMBEDDING_STORE_MAX_ROWS,
+)
@@ -0,0 +1,81 @@
+import hashlib
+import re
+from abc import ABC, abstractmethod
+from typing import List, Sequence
+import httpx
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9#+]+")
+
+def normalize_text(text: str) -> str:
+    return " ".join(TOKEN_RE.findall(text.lower()))
+
+class Embedder(ABC):
+    # ``name`` keys cached vectors, so change it whenever outputs would change
+    name: str
+    dim: int
+
+    @abstractmethod
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Return a (len(texts), dim) float32 matrix of unit vectors."""
+
+class HashingEmbedder(Embedder):
+    """Offline embedder: signed feature hashing of word unigrams and bigrams.
+
+    No model or network access is needed, and texts that share vocabulary
+    land close together, which is enough for tests and local runs.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-v1-{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        tokens = normalize_text(text).split()
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                out[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return out / norms
+
+class OpenAIEmbedder(Embedder):
+    """Embeddings from the OpenAI API, truncated to ``dim`` dimensions."""
+
+    def __init__(self, api_key: str, model: str = "text-embedding-3-small", dim: int = 256, batch_size: int = 256):
+        self.model = model
+        self.dim = dim
+        self.name = f"openai-{model}-{dim}"
+        self.batch_size = batch_size
+        self._client = httpx.Client(
+            base_url="https://api.openai.com",
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=30.0,
+        )
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), self.batch_size):
+            batch = list(texts[start:start + self.batch_size])
+            response = self._client.post(
+                "/v1/embeddings", json={"model": self.model, "input": batch, "dimensions": self.dim}
+            )
+            response.raise_for_status()
+            for item in response.json()["data"]:
+                out[start + item["index"]] = item["embedding"]
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return out / norms
+
+def create_embedder(kind: str, dim: int, api_key: str = "") -> Embedder:
+    if kind == "openai":
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY is required for the openai embedder")
+        return OpenAIEmbedder(api_key, dim=dim)
+    return HashingEmbedder(dim)
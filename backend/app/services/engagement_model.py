@@ -0,0 +1,174 @@
+import logging
+import os
+import zlib
+from typing import Any, Dict, Optional, Sequence
+import numpy as np
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = ["educational", "promotional", "engaging"]
+AUDIENCE_BUCKETS = 8
+HARMONICS = 3
+
+# Half-hour posting slots from 07:00 to 21:30
+SLOTS = np.arange(14, 44) / 2
+# Hour-of-week bucket (weekday * 24 + hour) for each weekday and slot
+SLOT_BUCKETS = np.arange(7)[:, None] * 24 + SLOTS.astype(np.int64)[None, :]
+
+# Every platform we know, in feature order. The default model is fitted to
+# the heuristic curves until real history exists: weight scales the
+# platform and peaks are (hour, width) of its daily curve. weekly_cap is
+# the most posts per calendar week the planner schedules there; platforms
+# without one aren't planned for.
+PLATFORM_PRIORS = {
+    "linkedin": {"weight": 1.0, "peaks": [(9.0, 1.5), (12.0, 1.0)], "weekend": 0.55, "weekly_cap": 5},
+    "twitter": {"weight": 0.85, "peaks": [(9.0, 1.5), (14.5, 1.5), (18.0, 1.5)], "weekend": 0.85, "weekly_cap": 7},
+    "instagram": {"weight": 0.9, "peaks": [(11.0, 1.5), (19.5, 2.0)], "weekend": 1.05, "weekly_cap": None},
+    "facebook": {"weight": 0.6, "peaks": [(9.0, 2.0), (15.0, 2.0)], "weekend": 0.9, "weekly_cap": None},
+    "tiktok": {"weight": 0.95, "peaks": [(12.0, 1.5), (20.0, 2.0)], "weekend": 1.1, "weekly_cap": None},
+}
+PLATFORM_NAMES = list(PLATFORM_PRIORS)
+
+# Feature layout: one row per candidate, model is linear in log(engagement)
+P, K = len(PLATFORM_NAMES), len(CONTENT_TYPES)
+BIAS = 0
+PLATFORM = 1
+CONTENT_TYPE = PLATFORM + P
+WEEKDAY = CONTENT_TYPE + K
+HOUR = WEEKDAY + 7                    # per-platform Fourier terms of the hour
+WEEKEND = HOUR + P * 2 * HARMONICS    # per-platform weekend shift
+PRIOR = WEEKEND + P                   # log of the topic's engagement prior
+AUDIENCE = PRIOR + 1
+N_FEATURES = AUDIENCE + AUDIENCE_BUCKETS
+
+def time_profile(config: Dict[str, Any]) -> np.ndarray:
+    """(7, len(SLOTS)) engagement multiplier by weekday and slot, 1.0 at the peak."""
+    curve = np.full(SLOTS.shape, 0.35)
+    for hour, width in config["peaks"]:
+        curve = curve + np.exp(-0.5 * ((SLOTS - hour) / width) ** 2)
+    curve = curve / curve.max()
+    weekday = np.array([1.0] * 5 + [config["weekend"]] * 2)
+    return weekday[:, None] * curve[None, :]
+
+def hour_basis(hours: np.ndarray) -> np.ndarray:
+    angle = 2 * np.pi * np.asarray(hours, dtype=np.float64)[:, None] / 24 * np.arange(1, HARMONICS + 1)
+    return np.concatenate([np.sin(angle), np.cos(angle)], axis=1)
+
+def audience_bucket(audience: str) -> int:
+    return zlib.crc32(audience.lower().encode()) % AUDIENCE_BUCKETS
+
+def platform_index(names: Sequence[str]) -> np.ndarray:
+    return np.array([PLATFORM_NAMES.index(name) for name in names], dtype=np.int64)
+
+def build_features(
+    platform: np.ndarray,
+    content_type: np.ndarray,
+    weekday: np.ndarray,
+    hour: np.ndarray,
+    prior: np.ndarray,
+    audience: np.ndarray,
+) -> np.ndarray:
+    """(n, N_FEATURES) matrix from equal-length index/value arrays."""
+    n = len(platform)
+    rows = np.arange(n)
+    X = np.zeros((n, N_FEATURES), dtype=np.float64)
+    X[:, BIAS] = 1.0
+    X[rows, PLATFORM + platform] = 1.0
+    X[rows, CONTENT_TYPE + content_type] = 1.0
+    X[rows, WEEKDAY + weekday] = 1.0
+    hour_cols = HOUR + platform[:, None] * 2 * HARMONICS + np.arange(2 * HARMONICS)
+    X[rows[:, None], hour_cols] = hour_basis(hour)
+    X[rows, WEEKEND + platform] = weekday >= 5
+    X[:, PRIOR] = np.log(np.maximum(prior, 1e-4))
+    X[rows, AUDIENCE + audience] = 1.0
+    return X
+
+class EngagementModel:
+    """Log-linear engagement model over a small one-hot/Fourier feature set.
+
+    ``predict`` scores any batch of candidates in one matrix product.
+    ``predict_grid`` scores every (weekday, topic, platform, slot)
+    combination without building the feature matrix: the model is additive
+    in log space, so each axis contributes one vector that is broadcast.
+    """
+
+    def __init__(self, weights: np.ndarray):
+        self.weights = np.asarray(weights, dtype=np.float64)
+
+    def predict(self, platform, content_type, weekday, hour, prior, audience) -> np.ndarray:
+        arrays = np.broadcast_arrays(platform, content_type, weekday, hour, prior, audience)
+        shape = arrays[0].shape
+        platform, content_type, weekday, audience = (a.ravel().astype(np.int64) for a in (arrays[0], arrays[1], arrays[2], arrays[5]))
+        X = build_features(platform, content_type, weekday, arrays[3].ravel(), arrays[4].ravel(), audience)
+        return np.exp(X @ self.weights).reshape(shape)
+
+    def predict_grid(
+        self,
+        priors: np.ndarray,
+        content_types: np.ndarray,
+        audiences: np.ndarray,
+        platforms: np.ndarray,
+        hours: np.ndarray = SLOTS,
+    ) -> np.ndarray:
+        """(7, topics, platforms, slots) predicted engagement."""
+        w = self.weights
+        topic = (
+            w[CONTENT_TYPE + np.asarray(content_types)]
+            + w[PRIOR] * np.log(np.maximum(priors, 1e-4))
+            + w[AUDIENCE + np.asarray(audiences)]
+        )
+        platform = w[BIAS] + w[PLATFORM + platforms]
+        weekday = w[WEEKDAY:WEEKDAY + 7]
+        hour = w[HOUR:WEEKEND].reshape(P, 2 * HARMONICS)[platforms] @ hour_basis(hours).T
+        weekend = (np.arange(7) >= 5)[:, None] * w[WEEKEND + platforms][None, :]
+        log = (
+            weekday[:, None, None, None]
+            + topic[None, :, None, None]
+            + platform[None, None, :, None]
+            + hour[None, None, :, :]
+            + weekend[:, None, :, None]
+        )
+        return np.exp(log)
+
+    @classmethod
+    def fit(cls, X: np.ndarray, y: np.ndarray, l2: float = 1e-3) -> "EngagementModel":
+        # Ridge regression on log engagement, closed form
+        target = np.log(np.maximum(y, 1e-4))
+        gram = X.T @ X + l2 * np.eye(X.shape[1])
+        return cls(np.linalg.solve(gram, X.T @ target))
+
+    @classmethod
+    def from_priors(cls) -> "EngagementModel":
+        """Fit to the heuristic platform curves, for use before any history exists."""
+        priors = np.array([0.02, 0.04, 0.08])
+        grids = np.meshgrid(np.arange(P), np.arange(7), np.arange(len(SLOTS)), np.arange(len(priors)), indexing="ij")
+        platform, weekday, slot, prior = (g.ravel() for g in grids)
+        profiles = np.stack([time_profile(PLATFORM_PRIORS[name]) for name in PLATFORM_NAMES])
+        weights = np.array([PLATFORM_PRIORS[name]["weight"] for name in PLATFORM_NAMES])
+        y = priors[prior] * weights[platform] * profiles[platform, weekday, slot]
+        # Priors carry no content type or audience signal; spread rows evenly so those weights stay near zero
+        content_type = np.arange(len(y)) % K
+        audience = np.arange(len(y)) % AUDIENCE_BUCKETS
+        X = build_features(platform, content_type, weekday, SLOTS[slot], priors[prior], audience)
+        return cls.fit(X, y)
+
+    def save(self, path: str):
+        np.savez(path, weights=self.weights, n_features=N_FEATURES)
+
+    @classmethod
+    def load(cls, path: str) -> "EngagementModel":
+        data = np.load(path)
+        if int(data["n_features"]) != N_FEATURES:
+            raise ValueError(f"{path} was trained for a different feature layout")
+        return cls(data["weights"])
+
+def load_engagement_model(path: Optional[str] = None) -> EngagementModel:
+    if path and os.path.exists(path):
+        try:
+            return EngagementModel.load(path)
+        except Exception:
+            logger.exception("Could not load engagement model from %s, using priors", path)
+    return EngagementModel.from_priors()
+
+engagement_model = load_engagement_model(settings.ENGAGEMENT_MODEL_PATH)
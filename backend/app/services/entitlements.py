@@ -0,0 +1,71 @@
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+from sqlalchemy import select, update
+from app.config import settings
+from app.database.models import User
+from app.database.session import async_session
+from app.services.cache import TTLCache
+from app.services.plans import PRICING_PLANS, USAGE_LIMITS
+
+# Changes whenever plan limits or features change, so a deploy that edits
+# the plans retires every token issued against the old definitions
+PLAN_VERSION = hashlib.sha1(
+    json.dumps([PRICING_PLANS, USAGE_LIMITS], sort_keys=True).encode()
+).hexdigest()[:8]
+
+@dataclass
+class Entitlements:
+    user_id: int
+    tier: str
+    limits: Dict[str, int] = field(default_factory=dict)
+    features: List[str] = field(default_factory=list)
+
+    def has_feature(self, feature: str) -> bool:
+        return feature in self.features
+
+def build_entitlement_claims(tier: str, version: int) -> Dict[str, Any]:
+    return {
+        "tier": tier,
+        "limits": USAGE_LIMITS.get(tier, USAGE_LIMITS["free"]),
+        "features": PRICING_PLANS.get(tier, {}).get("features", []),
+        "ver": version,
+        "plan_ver": PLAN_VERSION,
+    }
+
+class EntitlementVersionStore:
+    """Per-user entitlement versions, read from ``users.entitlements_version``.
+
+    Billing increments the column in the same update that changes the
+    plan, so the bump commits with the tier change and every worker sees
+    it; access tokens carrying an older version are rejected as stale and
+    must be refreshed. Reads are cached locally for ``cache_ttl`` seconds,
+    which bounds how long another worker can keep honouring a stale token.
+    """
+
+    def __init__(self, cache_ttl: float = 5.0):
+        self._cache = TTLCache(maxsize=100000, ttl=cache_ttl)
+
+    async def get(self, user_id: int) -> int:
+        version = self._cache.get(user_id)
+        if version is None:
+            async with async_session() as db:
+                version = await db.scalar(select(User.entitlements_version).where(User.id == user_id)) or 0
+            self._cache.set(user_id, version)
+        return version
+
+    async def bump(self, user_id: int) -> int:
+        """Retire the user's outstanding access tokens outside of a plan change."""
+        async with async_session() as db:
+            await db.execute(
+                update(User).where(User.id == user_id).values(entitlements_version=User.entitlements_version + 1)
+            )
+            await db.commit()
+        self._cache.invalidate(user_id)
+        return await self.get(user_id)
+
+    def invalidate(self, user_id: int):
+        self._cache.invalidate(user_id)
+
+entitlement_versions = EntitlementVersionStore(settings.ENTITLEMENT_VERSION_CACHE_TTL_SECONDS)
@@ -0,0 +1,248 @@
+import heapq
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import select
+from app.database.models import ContentPost
+from app.database.session import async_session
+
+logger = logging.getLogger(__name__)
+
+LOOKBACK_DAYS = 90
+# Tags past this many on one post are ignored; tag-spam posts would add pairs quadratically
+MAX_TAGS_PER_POST = 30
+# Share of a score that comes from the niche row and from the seed tags' rows
+NICHE_WEIGHT = 0.5
+SEED_WEIGHT = 0.5
+MAX_CACHED = 10000
+# Post weights halve every HALF_LIFE_DAYS, so old co-occurrences fade instead of piling up
+HALF_LIFE_DAYS = 30
+# Cells that have decayed below this (a lone post's minimum weight is 0.1) are pruned
+MIN_WEIGHT = 0.01
+PRUNE_INTERVAL_SECONDS = 86400
+MAX_TAGS = 50000
+MAX_TOPICS = 20000
+
+def tag_key(tag: str) -> str:
+    return "#" + tag.strip().lstrip("#").lower()
+
+def topic_key(topic: Optional[str]) -> str:
+    return " ".join((topic or "").lower().split())
+
+def timestamp(moment: datetime) -> float:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+class HashtagRecommender:
+    """Hashtags for a topic from engagement-weighted co-occurrence counts.
+
+    Two sparse matrices are kept as rows of ``{tag id: weight}``: topic x
+    tag, where a post's topic and its niche are both topics, and tag x
+    tag. Each post adds its engagement weight (its rate relative to the
+    running mean, clipped) to every cell it touches, so updates cost
+    O(tags^2) per post and never rebuild anything.
+
+    A tag's score for a topic is the topic row's weight damped by the
+    square root of the tag's overall weight, so tags that go on
+    everything don't crowd out the specific ones. Topics with no row of
+    their own borrow from their niche and from the rows of ``seeds``, the
+    tags the planner would otherwise use. Results are cached until the
+    next update, so repeat lookups are one dict access.
+
+    Weights decay with a half-life of ``half_life_days`` of publish time.
+    Rather than touching every cell, a post's weight is scaled up by how
+    far it was published past ``epoch``; pruning divides everything back
+    down, moves the epoch to now and drops cells, tags and topics that
+    have faded below ``MIN_WEIGHT``. It runs daily and whenever there are
+    more than ``max_tags`` tags or ``max_topics`` topics, keeping the
+    heaviest ones. Like the startup load, only posts published in the
+    last LOOKBACK_DAYS are counted.
+    """
+
+    def __init__(
+        self,
+        prior_engagement: float = 0.03,
+        prior_posts: float = 10.0,
+        max_weight: float = 4.0,
+        half_life_days: float = HALF_LIFE_DAYS,
+        max_tags: int = MAX_TAGS,
+        max_topics: int = MAX_TOPICS,
+    ):
+        self.tags: Dict[str, int] = {}
+        self.display: List[str] = []
+        self.topics: Dict[str, int] = {}
+        self.topic_tags: List[Dict[int, float]] = []
+        self.tag_tags: List[Dict[int, float]] = []
+        self.tag_weight: List[float] = []
+        self.engagement_sum = prior_engagement * prior_posts
+        self.posts = prior_posts
+        self.max_weight = max_weight
+        self.half_life = half_life_days * 86400
+        self.max_tags = max_tags
+        self.max_topics = max_topics
+        self.epoch = time.time()
+        self._cache: Dict[Tuple[str, str, Tuple[str, ...], int], List[str]] = {}
+        self._lock = threading.Lock()
+
+    def _tag(self, tag: str) -> int:
+        key = tag_key(tag)
+        tag_id = self.tags.get(key)
+        if tag_id is None:
+            tag_id = self.tags[key] = len(self.display)
+            self.display.append("#" + tag.strip().lstrip("#"))
+            self.tag_tags.append({})
+            self.tag_weight.append(0.0)
+        return tag_id
+
+    def _topic(self, topic: str) -> int:
+        topic_id = self.topics.get(topic)
+        if topic_id is None:
+            topic_id = self.topics[topic] = len(self.topic_tags)
+            self.topic_tags.append({})
+        return topic_id
+
+    def record_posts(self, posts: Iterable[Dict[str, Any]]) -> int:
+        """Count each post's hashtags against each other, its topic and its niche."""
+        recorded = 0
+        now = time.time()
+        cutoff = now - LOOKBACK_DAYS * 86400
+        with self._lock:
+            for post in posts:
+                tags = [tag for tag in post.get("hashtags") or [] if tag.strip("#")]
+                # Undated posts can't be aged, so they are skipped here as in load_from_db
+                if not tags or post.get("published_at") is None:
+                    continue
+                published = min(timestamp(post["published_at"]), now)
+                if published < cutoff:
+                    continue
+                engagement = max(float(post.get("engagement_rate") or 0.0), 0.0)
+                self.engagement_sum += engagement
+                self.posts += 1
+                weight = min(engagement / (self.engagement_sum / self.posts), self.max_weight) + 0.1
+                weight *= 2.0 ** ((published - self.epoch) / self.half_life)
+                tag_ids = list(dict.fromkeys(self._tag(tag) for tag in tags[:MAX_TAGS_PER_POST]))
+
+                topics = [topic_key(post.get("topic")), "niche:" + topic_key(post.get("niche"))]
+                for topic in topics:
+                    if topic and topic != "niche:":
+                        row = self.topic_tags[self._topic(topic)]
+                        for tag_id in tag_ids:
+                            row[tag_id] = row.get(tag_id, 0.0) + weight
+                for tag_id in tag_ids:
+                    self.tag_weight[tag_id] += weight
+                    row = self.tag_tags[tag_id]
+                    for other in tag_ids:
+                        if other != tag_id:
+                            row[other] = row.get(other, 0.0) + weight
+                recorded += 1
+            if recorded:
+                if (
+                    now - self.epoch > PRUNE_INTERVAL_SECONDS
+                    or len(self.display) > self.max_tags
+                    or len(self.topics) > self.max_topics
+                ):
+                    self._prune(now)
+                self._cache.clear()
+        return recorded
+
+    def _prune(self, now: float):
+        """Rescale weights to ``now`` and drop what has faded; caller holds the lock."""
+        scale = 2.0 ** (-(now - self.epoch) / self.half_life)
+        self.epoch = now
+
+        # Keep at most 90% of the caps so pruning doesn't rerun on the next few posts
+        kept = [tag_id for tag_id, weight in enumerate(self.tag_weight) if weight * scale >= MIN_WEIGHT]
+        if len(kept) > self.max_tags * 0.9:
+            kept = sorted(heapq.nlargest(int(self.max_tags * 0.9), kept, key=self.tag_weight.__getitem__))
+        remap = {old: new for new, old in enumerate(kept)}
+
+        def rescale(row: Dict[int, float]) -> Dict[int, float]:
+            return {
+                remap[tag_id]: weight * scale
+                for tag_id, weight in row.items()
+                if tag_id in remap and weight * scale >= MIN_WEIGHT
+            }
+
+        self.tags = {key: remap[tag_id] for key, tag_id in self.tags.items() if tag_id in remap}
+        self.display = [self.display[tag_id] for tag_id in kept]
+        self.tag_weight = [self.tag_weight[tag_id] * scale for tag_id in kept]
+        self.tag_tags = [rescale(self.tag_tags[tag_id]) for tag_id in kept]
+
+        rows = {topic: rescale(self.topic_tags[topic_id]) for topic, topic_id in self.topics.items()}
+        topics = [topic for topic, row in rows.items() if row]
+        if len(topics) > self.max_topics * 0.9:
+            topics = heapq.nlargest(int(self.max_topics * 0.9), topics, key=lambda topic: sum(rows[topic].values()))
+        self.topics = {topic: topic_id for topic_id, topic in enumerate(topics)}
+        self.topic_tags = [rows[topic] for topic in topics]
+        logger.info("Pruned hashtag co-occurrence to %d tags and %d topics", len(self.display), len(self.topics))
+
+    def recommend(self, topic: str, niche: Optional[str] = None, k: int = 5, seeds: Sequence[str] = ()) -> List[str]:
+        """Up to ``k`` hashtags for the topic, best first; empty when nothing relates to it."""
+        cache_key = (topic_key(topic), topic_key(niche), tuple(tag_key(seed) for seed in seeds), k)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+        with self._lock:
+            scores: Dict[int, float] = {}
+            rows = [(self.topics.get(cache_key[0]), 1.0)]
+            if niche:
+                rows.append((self.topics.get("niche:" + cache_key[1]), NICHE_WEIGHT))
+            for topic_id, share in rows:
+                if topic_id is not None:
+                    self._accumulate(scores, self.topic_tags[topic_id], share)
+            for seed in cache_key[2]:
+                tag_id = self.tags.get(seed)
+                if tag_id is not None:
+                    # A seed counts as co-occurring with itself
+                    self._accumulate(scores, {tag_id: self.tag_weight[tag_id], **self.tag_tags[tag_id]}, SEED_WEIGHT)
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1] / math.sqrt(self.tag_weight[item[0]]))
+            result = [self.display[tag_id] for tag_id, _ in best]
+            if len(self._cache) >= MAX_CACHED:
+                self._cache.clear()
+            self._cache[cache_key] = result
+        return result
+
+    @staticmethod
+    def _accumulate(scores: Dict[int, float], row: Dict[int, float], share: float):
+        # Rows are normalized so each source contributes by its share, not its volume
+        total = sum(row.values())
+        if total <= 0:
+            return
+        scale = share / total
+        for tag_id, weight in row.items():
+            scores[tag_id] = scores.get(tag_id, 0.0) + weight * scale
+
+    def recommend_many(
+        self, topics: Sequence[Tuple[str, Sequence[str]]], niche: Optional[str] = None, k: int = 5
+    ) -> Dict[str, List[str]]:
+        """Recommendations for (topic, seed tags) pairs, omitting topics with none."""
+        recommended = {}
+        for topic, seeds in topics:
+            tags = self.recommend(topic, niche, k, seeds)
+            if tags:
+                recommended[topic] = tags
+        return recommended
+
+    async def load_from_db(self, batch_size: int = 5000) -> int:
+        """Seed the matrices with posts published in the last LOOKBACK_DAYS."""
+        cutoff = datetime.utcnow() - timedelta(days=LOOKBACK_DAYS)
+        loaded = 0
+        async with async_session() as db:
+            result = await db.stream(
+                select(
+                    ContentPost.niche, ContentPost.topic, ContentPost.hashtags,
+                    ContentPost.engagement_rate, ContentPost.published_at,
+                )
+                .where(ContentPost.published_at >= cutoff)
+                .execution_options(yield_per=batch_size)
+            )
+            async for rows in result.partitions(batch_size):
+                loaded += self.record_posts(dict(row._mapping) for row in rows)
+        logger.info("Built hashtag co-occurrence from %d posts", loaded)
+        return loaded
+
+hashtag_recommender = HashtagRecommender()
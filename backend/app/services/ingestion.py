@@ -0,0 +1,325 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import re
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence
+from sqlalchemy import insert, select
+from app.config import settings
+from app.database.models import ContentPost
+from app.database.session import async_session
+from app.services.cache import TTLCache
+from app.services.embedding_store import embedding_store
+from app.services.embeddings import Embedder, normalize_text
+
+logger = logging.getLogger(__name__)
+
+HASHTAG_RE = re.compile(r"#(\w+)")
+
+class PostSource(ABC):
+    """Yields raw posts, as dicts or NDJSON lines, in batches of about ``size``."""
+
+    @abstractmethod
+    def batches(self, size: int) -> AsyncIterator[List[Any]]:
+        ...
+
+class NDJSONFileSource(PostSource):
+    """Replays an NDJSON export, gzipped if the name ends in .gz; reads happen in a thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def batches(self, size: int) -> AsyncIterator[List[Any]]:
+        opener = gzip.open if self.path.endswith(".gz") else open
+        f = await asyncio.to_thread(opener, self.path, "rt", encoding="utf-8")
+        try:
+            while True:
+                lines = await asyncio.to_thread(lambda: [line for line in (f.readline() for _ in range(size)) if line])
+                if not lines:
+                    return
+                yield lines
+        finally:
+            f.close()
+
+class NDJSONStreamSource(PostSource):
+    """NDJSON from an async byte stream, such as a request body."""
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self.chunks = chunks
+
+    async def batches(self, size: int) -> AsyncIterator[List[Any]]:
+        pending = b""
+        lines: List[bytes] = []
+        async for chunk in self.chunks:
+            *complete, pending = (pending + chunk).split(b"\n")
+            lines.extend(complete)
+            while len(lines) >= size:
+                yield lines[:size]
+                lines = lines[size:]
+        if pending:
+            lines.append(pending)
+        if lines:
+            yield lines
+
+class ListSource(PostSource):
+    def __init__(self, posts: Sequence[Dict[str, Any]]):
+        self.posts = posts
+
+    async def batches(self, size: int) -> AsyncIterator[List[Any]]:
+        for i in range(0, len(self.posts), size):
+            yield list(self.posts[i:i + size])
+
+def parse_time(value: Any) -> Optional[datetime]:
+    """Naive UTC datetime from an ISO string, epoch seconds or datetime."""
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime):
+        moment = value
+    elif isinstance(value, (int, float)):
+        moment = datetime.fromtimestamp(value, tz=timezone.utc)
+    else:
+        try:
+            moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+def dedupe_key(platform: Optional[str], source_id: Any, author: Optional[str], text: str) -> str:
+    identity = f"{platform}|id|{source_id}" if source_id not in (None, "") else f"{platform}|{author}|{normalize_text(text)}"
+    return hashlib.blake2b(identity.encode(), digest_size=16).hexdigest()
+
+def normalize_post(raw: Any, defaults: Dict[str, Any], overrides: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """A content_posts row from a raw post, or None if it can't be used.
+
+    Accepts our own column names as well as the common API spellings
+    (text, id, impressions, likes/comments/shares) and fills anything
+    missing from ``defaults``. Fields in ``overrides`` win over the post's own.
+    """
+    if isinstance(raw, (bytes, str)):
+        if not raw.strip():
+            return None
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            return None
+    if not isinstance(raw, dict):
+        return None
+    if overrides:
+        raw = {**raw, **overrides}
+    text = raw.get("content_text") or raw.get("text")
+    if not isinstance(text, str) or not text.strip():
+        return None
+
+    platform = (raw.get("platform") or defaults.get("platform") or "").lower()[:50] or None
+    author = str(raw.get("author") or "")[:255] or None
+    hashtags = raw.get("hashtags")
+    if hashtags is None:
+        hashtags = HASHTAG_RE.findall(text)
+    elif isinstance(hashtags, str):
+        hashtags = hashtags.split()
+    reach = int(raw.get("reach") or raw.get("impressions") or 0)
+    engagement_rate = raw.get("engagement_rate")
+    if engagement_rate is None:
+        interactions = sum(int(raw.get(name) or 0) for name in ("likes", "comments", "shares"))
+        engagement_rate = interactions / reach if reach else 0.0
+    is_competitor = raw.get("is_competitor", defaults.get("is_competitor", True))
+    return {
+        "brand_id": raw.get("brand_id", defaults.get("brand_id")),
+        "is_competitor": bool(is_competitor),
+        "author": author,
+        "platform": platform,
+        "niche": (raw.get("niche") or defaults.get("niche") or "")[:100] or None,
+        "topic": (raw.get("topic") or defaults.get("topic") or "")[:255] or None,
+        "content_text": text,
+        "hashtags": ["#" + str(tag).lstrip("#") for tag in hashtags],
+        "engagement_rate": float(engagement_rate),
+        "reach": reach,
+        "published_at": parse_time(raw.get("published_at") or raw.get("created_at")),
+        "dedupe_key": dedupe_key(platform, raw.get("id"), author, text),
+    }
+
+class IngestionPipeline:
+    """Streams posts from a source into content_posts.
+
+    Four stages run concurrently, joined by bounded queues of batches:
+
+        read -> normalize + dedupe -> embed (``embed_workers``) -> write
+
+    A stage that falls behind fills the queue in front of it, which stalls
+    the stages upstream down to the source, so memory stays at roughly
+    ``queue_depth`` batches per stage however large the input. Posts seen
+    in the last ``dedupe_window`` keys are dropped before embedding; older
+    repeats are skipped by the insert against the unique ``dedupe_key``.
+    Keys only count as seen once their chunk has committed, so a failed
+    run can be retried. Rows are written in chunks of ``insert_chunk`` per
+    executemany, which the drivers send as multi-row inserts, and the rows
+    each chunk actually inserted are handed to ``observers`` so in-memory
+    indexes pick every post up once.
+    """
+
+    def __init__(
+        self,
+        embedder: Optional[Embedder] = None,
+        session_factory=async_session,
+        batch_size: int = 500,
+        insert_chunk: int = 2000,
+        queue_depth: int = 8,
+        embed_workers: int = 2,
+        dedupe_window: int = 200000,
+        observers: Sequence[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = (),
+    ):
+        # Ingested posts are nearly all unique, so they bypass the embedding cache
+        self.embedder = embedder or embedding_store.embedder
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.insert_chunk = insert_chunk
+        self.queue_depth = queue_depth
+        self.embed_workers = max(1, embed_workers)
+        self.seen = TTLCache(maxsize=dedupe_window, ttl=86400)
+        self.observers = list(observers)
+        self.stats = {"read": 0, "invalid": 0, "duplicates": 0, "embedded": 0, "written": 0}
+
+    def add_observer(self, observer: Callable[[List[Dict[str, Any]]], Awaitable[None]]):
+        self.observers.append(observer)
+
+    async def run(
+        self,
+        source: PostSource,
+        defaults: Optional[Dict[str, Any]] = None,
+        overrides: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Ingest everything ``source`` yields; returns this run's counts.
+
+        ``defaults`` fill fields the posts leave out, ``overrides`` replace
+        them whatever the posts say.
+        """
+        defaults = defaults or {}
+        overrides = overrides or {}
+        stats = {name: 0 for name in self.stats}
+        raw_queue: asyncio.Queue = asyncio.Queue(self.queue_depth)
+        embed_queue: asyncio.Queue = asyncio.Queue(self.queue_depth)
+        write_queue: asyncio.Queue = asyncio.Queue(self.queue_depth)
+
+        def count(name: str, amount: int):
+            stats[name] += amount
+            self.stats[name] += amount
+
+        async def read():
+            async for batch in source.batches(self.batch_size):
+                count("read", len(batch))
+                await raw_queue.put(batch)
+            await raw_queue.put(None)
+
+        async def normalize():
+            # Keys queued in this run but not written yet
+            queued = set()
+            while (batch := await raw_queue.get()) is not None:
+                rows = []
+                for raw in batch:
+                    try:
+                        row = normalize_post(raw, defaults, overrides)
+                    except (TypeError, ValueError):
+                        row = None
+                    if row is None:
+                        count("invalid", 1)
+                        continue
+                    if row["dedupe_key"] in queued or self.seen.get(row["dedupe_key"]) is not None:
+                        count("duplicates", 1)
+                    else:
+                        queued.add(row["dedupe_key"])
+                        rows.append(row)
+                if rows:
+                    await embed_queue.put(rows)
+            for _ in range(self.embed_workers):
+                await embed_queue.put(None)
+
+        async def embed():
+            while (rows := await embed_queue.get()) is not None:
+                vectors = await asyncio.to_thread(self.embedder.embed, [row["content_text"] for row in rows])
+                for row, vector in zip(rows, vectors.tolist()):
+                    row["content_embedding"] = vector
+                count("embedded", len(rows))
+                await write_queue.put(rows)
+            await write_queue.put(None)
+
+        async def write():
+            chunk: List[Dict[str, Any]] = []
+            finished = 0
+            while finished < self.embed_workers:
+                rows = await write_queue.get()
+                if rows is None:
+                    finished += 1
+                    continue
+                chunk.extend(rows)
+                if len(chunk) >= self.insert_chunk:
+                    written = await self._write(chunk)
+                    count("written", written)
+                    count("duplicates", len(chunk) - written)
+                    chunk = []
+            if chunk:
+                written = await self._write(chunk)
+                count("written", written)
+                count("duplicates", len(chunk) - written)
+
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(coro) for coro in (read(), normalize(), *(embed() for _ in range(self.embed_workers)), write())]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # One failed stage would leave the others blocked on their queues
+            for task in tasks:
+                task.cancel()
+        elapsed = time.perf_counter() - started
+        stats["seconds"] = round(elapsed, 3)
+        stats["posts_per_second"] = round(stats["read"] / elapsed, 1) if elapsed else 0.0
+        logger.info("Ingested %s", stats)
+        return stats
+
+    async def _write(self, rows: List[Dict[str, Any]]) -> int:
+        """Insert rows not stored yet; returns how many were inserted."""
+        keys = [row["dedupe_key"] for row in rows]
+        written = 0
+        async with self.session_factory() as session:
+            # Posts already stored must not reach the observers a second time
+            stored = set((await session.execute(
+                select(ContentPost.dedupe_key).where(ContentPost.dedupe_key.in_(keys))
+            )).scalars())
+            rows = [row for row in rows if row["dedupe_key"] not in stored]
+            if rows:
+                stmt = insert(ContentPost.__table__)
+                # A concurrent run may store the same key in the meantime; skip it rather than fail
+                stmt = stmt.prefix_with("OR IGNORE" if session.bind.dialect.name == "sqlite" else "IGNORE")
+                result = await session.execute(stmt, rows)
+                written = max(result.rowcount, 0)
+                if self.observers:
+                    # Multi-row inserts don't return ids on MySQL, so look them up for the indexes
+                    ids = dict((await session.execute(
+                        select(ContentPost.dedupe_key, ContentPost.id)
+                        .where(ContentPost.dedupe_key.in_([row["dedupe_key"] for row in rows]))
+                    )).all())
+                    for row in rows:
+                        row["id"] = ids.get(row["dedupe_key"])
+            await session.commit()
+        for key in keys:
+            self.seen.set(key, True)
+        if rows:
+            for observer in self.observers:
+                try:
+                    await observer(rows)
+                except Exception:
+                    logger.exception("Ingestion observer %r failed", observer)
+        return written
+
+ingestion_pipeline = IngestionPipeline(
+    batch_size=settings.INGEST_BATCH_SIZE,
+    insert_chunk=settings.INGEST_INSERT_CHUNK,
+    queue_depth=settings.INGEST_QUEUE_DEPTH,
+    embed_workers=settings.INGEST_EMBED_WORKERS,
+    dedupe_window=settings.INGEST_DEDUPE_WINDOW,
+)
@@ -0,0 +1,360 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+FINISHED = {"succeeded", "failed"}
+
+class JobQueueFull(Exception):
+    pass
+
+class JobStore(ABC):
+    """Job records plus the queue of job ids waiting for a worker.
+
+    Records expire ``ttl`` seconds after their last update, so results can
+    be fetched for a while and then disappear on their own. A popped job
+    stays claimed by this process until ``ack``; ``recover`` puts jobs
+    claimed by processes that died back on the queue.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+
+    @abstractmethod
+    async def create(self, job: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def update(self, job_id: str, **fields) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def pop(self, timeout: float) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def queued(self) -> int:
+        ...
+
+    async def ack(self, job_id: str):
+        pass
+
+    async def heartbeat(self):
+        pass
+
+    async def recover(self) -> int:
+        return 0
+
+    async def release(self):
+        pass
+
+    async def close(self):
+        pass
+
+class InMemoryJobStore(JobStore):
+    """Single-process store for development and tests."""
+
+    def __init__(self, ttl: float):
+        super().__init__(ttl)
+        self._jobs: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._last_sweep = time.monotonic()
+
+    @property
+    def queue(self) -> asyncio.Queue:
+        # Created lazily so it binds to the running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    def _sweep(self):
+        now = time.monotonic()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        for job_id in [job_id for job_id, (expires, _) in self._jobs.items() if expires < now]:
+            del self._jobs[job_id]
+
+    async def create(self, job):
+        self._sweep()
+        self._jobs[job["job_id"]] = (time.monotonic() + self.ttl, job)
+        self.queue.put_nowait(job["job_id"])
+
+    async def get(self, job_id):
+        entry = self._jobs.get(job_id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return dict(entry[1])
+
+    async def update(self, job_id, **fields):
+        entry = self._jobs.get(job_id)
+        if entry is None:
+            return None
+        job = {**entry[1], **fields}
+        self._jobs[job_id] = (time.monotonic() + self.ttl, job)
+        return job
+
+    async def pop(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def queued(self):
+        return self.queue.qsize()
+
+class RedisJobStore(JobStore):
+    """Shared store: any API instance can submit, run or report on a job.
+
+    ``pop`` moves a job id from the queue onto this instance's own
+    processing list with BLMOVE, and ``ack`` removes it once the job
+    finishes. Each instance refreshes a liveness key every few seconds;
+    ``recover`` requeues the processing lists of instances whose key has
+    expired, so a worker that dies mid-job doesn't lose it.
+    """
+
+    QUEUE_KEY = "jobs:queue"
+    PROCESSING_PREFIX = "jobs:processing:"
+    ALIVE_PREFIX = "jobs:alive:"
+
+    def __init__(self, url: str, ttl: float, heartbeat_ttl: int = 30):
+        super().__init__(ttl)
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.heartbeat_ttl = heartbeat_ttl
+        self.instance_id = uuid.uuid4().hex
+        self.processing_key = self.PROCESSING_PREFIX + self.instance_id
+
+    def _key(self, job_id: str) -> str:
+        return f"jobs:{job_id}"
+
+    async def create(self, job):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._key(job["job_id"]), json.dumps(job), ex=int(self.ttl))
+            pipe.rpush(self.QUEUE_KEY, job["job_id"])
+            await pipe.execute()
+
+    async def get(self, job_id):
+        raw = await self.redis.get(self._key(job_id))
+        return json.loads(raw) if raw is not None else None
+
+    async def update(self, job_id, **fields):
+        # Only the worker that popped a job writes to it, so read-modify-write is safe
+        job = await self.get(job_id)
+        if job is None:
+            return None
+        job.update(fields)
+        await self.redis.set(self._key(job_id), json.dumps(job), ex=int(self.ttl))
+        return job
+
+    async def pop(self, timeout):
+        item = await self.redis.blmove(self.QUEUE_KEY, self.processing_key, max(1, int(timeout)), "LEFT", "RIGHT")
+        return item.decode() if item is not None else None
+
+    async def queued(self):
+        return await self.redis.llen(self.QUEUE_KEY)
+
+    async def ack(self, job_id):
+        await self.redis.lrem(self.processing_key, 1, job_id)
+
+    async def heartbeat(self):
+        await self.redis.set(self.ALIVE_PREFIX + self.instance_id, 1, ex=self.heartbeat_ttl)
+
+    async def _requeue(self, processing_key: str) -> int:
+        # Oldest claims go back to the front of the queue, ahead of new submissions
+        moved = 0
+        while await self.redis.lmove(processing_key, self.QUEUE_KEY, "RIGHT", "LEFT") is not None:
+            moved += 1
+        return moved
+
+    async def recover(self):
+        moved = 0
+        async for key in self.redis.scan_iter(match=self.PROCESSING_PREFIX + "*"):
+            instance_id = key.decode()[len(self.PROCESSING_PREFIX):]
+            if instance_id != self.instance_id and not await self.redis.exists(self.ALIVE_PREFIX + instance_id):
+                moved += await self._requeue(key.decode())
+        if moved:
+            logger.warning("Requeued %d jobs left by stopped workers", moved)
+        return moved
+
+    async def release(self):
+        # Jobs cancelled by a clean shutdown go straight back for another instance
+        await self._requeue(self.processing_key)
+        await self.redis.delete(self.ALIVE_PREFIX + self.instance_id)
+
+    async def close(self):
+        await self.redis.aclose()
+
+def create_job_store() -> JobStore:
+    if settings.REDIS_URL:
+        return RedisJobStore(settings.REDIS_URL, settings.JOB_RESULT_TTL_SECONDS)
+    return InMemoryJobStore(settings.JOB_RESULT_TTL_SECONDS)
+
+class JobRunner:
+    """Runs submitted jobs off the request path.
+
+    Handlers are async functions registered per job kind. They run on
+    ``workers`` dispatcher tasks, and CPU-heavy steps go through
+    ``run_in_pool`` to a process pool of the same size, so at most
+    ``workers`` jobs compute at once. Submissions beyond ``max_queue``
+    waiting jobs raise ``JobQueueFull``.
+    """
+
+    def __init__(self, store: JobStore, workers: int = 2, max_queue: int = 100, timeout: float = 300.0):
+        self.store = store
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+        # Events of the get() calls waiting on each job in this process
+        self._finished: Dict[str, Set[asyncio.Event]] = {}
+        self.stats = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0}
+
+    def register(self, kind: str, handler: Callable[[Dict[str, Any]], Awaitable[Any]]):
+        self.handlers[kind] = handler
+
+    async def submit(self, kind: str, params: Dict[str, Any], user_id: Optional[int] = None) -> Dict[str, Any]:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if await self.store.queued() >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise JobQueueFull("Too many jobs waiting")
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "kind": kind,
+            "user_id": user_id,
+            "params": params,
+            "status": "queued",
+            "result": None,
+            "error": None,
+            "created_at": datetime.utcnow().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        await self.store.create(job)
+        self.stats["submitted"] += 1
+        return job
+
+    async def get(self, job_id: str, wait: float = 0.0) -> Optional[Dict[str, Any]]:
+        """Fetch a job, long-polling up to ``wait`` seconds for it to finish."""
+        deadline = time.monotonic() + wait
+        interval = 0.05
+        finished = asyncio.Event()
+        waiters = None
+        try:
+            while True:
+                job = await self.store.get(job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job["status"] in FINISHED or remaining <= 0:
+                    return job
+                # Jobs finishing in this process wake us at once; others are polled with backoff
+                if waiters is None:
+                    waiters = self._finished.setdefault(job_id, set())
+                    waiters.add(finished)
+                try:
+                    await asyncio.wait_for(finished.wait(), min(interval, remaining))
+                except asyncio.TimeoutError:
+                    interval = min(interval * 2, 1.0)
+        finally:
+            if waiters is not None:
+                waiters.discard(finished)
+                if not waiters and self._finished.get(job_id) is waiters:
+                    del self._finished[job_id]
+
+    async def run_in_pool(self, fn: Callable, *args) -> Any:
+        """Run a picklable top-level function on the job process pool."""
+        if self._pool is None:
+            return await asyncio.to_thread(fn, *args)
+        return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+
+    async def _run(self, job_id: str):
+        job = await self.store.get(job_id)
+        # A recovered job may have finished before its worker died
+        if job is None or job["status"] in FINISHED:
+            return
+        job = await self.store.update(job_id, status="running", started_at=datetime.utcnow().isoformat())
+        if job is None:
+            return
+        try:
+            result = await asyncio.wait_for(self.handlers[job["kind"]](job["params"]), self.timeout)
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = TimeoutError(f"Job exceeded {self.timeout:.0f}s")
+            logger.exception("Job %s (%s) failed", job_id, job["kind"])
+            self.stats["failed"] += 1
+            await self.store.update(job_id, status="failed", error=str(e), finished_at=datetime.utcnow().isoformat())
+        else:
+            self.stats["succeeded"] += 1
+            await self.store.update(
+                job_id, status="succeeded", result=result, finished_at=datetime.utcnow().isoformat()
+            )
+        for finished in self._finished.pop(job_id, ()):
+            finished.set()
+
+    async def _work(self):
+        while True:
+            try:
+                job_id = await self.store.pop(timeout=1.0)
+                if job_id is not None:
+                    await self._run(job_id)
+                    await self.store.ack(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Job worker error")
+                await asyncio.sleep(1.0)
+
+    async def _maintain(self, interval: float = 10.0):
+        while True:
+            try:
+                await self.store.heartbeat()
+                await self.store.recover()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Job store maintenance failed")
+            await asyncio.sleep(interval)
+
+    async def start(self):
+        if self._tasks:
+            return
+        # Spawned workers don't inherit the server's threads, sockets or event loop
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        await self.store.heartbeat()
+        await self.store.recover()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        await self.store.release()
+        await self.store.close()
+
+job_runner = JobRunner(
+    create_job_store(),
+    workers=settings.JOB_WORKERS,
+    max_queue=settings.JOB_MAX_QUEUE,
+    timeout=settings.JOB_TIMEOUT_SECONDS,
+)
@@ -0,0 +1,207 @@
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Set, Tuple
+import numpy as np
+from sqlalchemy import select
+from app.database.models import ContentPost
+from app.database.session import async_session
+from app.services.embeddings import normalize_text
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+BANDS = 16
+SHINGLE = 4
+# Estimated Jaccard at which two texts count as rewordings of each other
+DUPLICATE_THRESHOLD = 0.6
+# Prime just above 2^32; permutations are (a * x + b) mod PRIME over crc32 shingle hashes
+PRIME = 4294967311
+
+_rng = np.random.default_rng(20240917)
+PERM_A = _rng.integers(1, PRIME, NUM_PERM, dtype=np.uint64)
+PERM_B = _rng.integers(0, PRIME, NUM_PERM, dtype=np.uint64)
+
+def timestamp(moment: Any) -> float:
+    if moment is None:
+        return time.time()
+    if isinstance(moment, datetime):
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.timestamp()
+    if isinstance(moment, date):
+        return datetime(moment.year, moment.month, moment.day, tzinfo=timezone.utc).timestamp()
+    return float(moment)
+
+def minhash(text: str) -> np.ndarray:
+    """(NUM_PERM,) MinHash signature over character 4-grams of the normalized text.
+
+    Character shingles keep short titles comparable: "Kubernetes security
+    hardening" and "Hardening Kubernetes security" share most of theirs.
+    """
+    text = normalize_text(text)
+    grams = {text[i:i + SHINGLE] for i in range(max(1, len(text) - SHINGLE + 1))}
+    hashes = np.fromiter((zlib.crc32(gram.encode()) for gram in grams), dtype=np.uint64, count=len(grams))
+    return ((PERM_A[:, None] * hashes[None, :] + PERM_B[:, None]) % PRIME).min(axis=1)
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+def band_keys(signature: np.ndarray, bands: int = BANDS) -> List[Tuple[int, bytes]]:
+    return [(band, rows.tobytes()) for band, rows in enumerate(signature.reshape(bands, -1))]
+
+class MinHashLSH:
+    """Banded LSH over a rolling window of MinHash signatures.
+
+    Each signature is split into ``bands`` bands and filed under every
+    band's bucket, so a query only compares against entries sharing at
+    least one band; with 16 bands of 4 rows, pairs above roughly 0.5
+    Jaccard almost always collide and pairs below 0.3 rarely do. The
+    window keeps the newest ``window`` entries and ignores any older than
+    ``max_age`` seconds.
+    """
+
+    def __init__(self, window: int = 2000, max_age: float = 90 * 86400, bands: int = BANDS):
+        self.window = window
+        self.max_age = max_age
+        self.bands = bands
+        self.buckets: Dict[Tuple[int, bytes], Set[int]] = {}
+        self.entries: "OrderedDict[int, Tuple[float, np.ndarray, Any]]" = OrderedDict()
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, signature: np.ndarray, at: Any = None, label: Any = None) -> int:
+        entry_id = self._next_id
+        self._next_id += 1
+        self.entries[entry_id] = (timestamp(at), signature, label)
+        for key in band_keys(signature, self.bands):
+            self.buckets.setdefault(key, set()).add(entry_id)
+        while len(self.entries) > self.window:
+            self._remove(next(iter(self.entries)))
+        return entry_id
+
+    def _remove(self, entry_id: int):
+        _, signature, _ = self.entries.pop(entry_id)
+        for key in band_keys(signature, self.bands):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self.buckets[key]
+
+    def candidates(self, signature: np.ndarray) -> Set[int]:
+        found: Set[int] = set()
+        for key in band_keys(signature, self.bands):
+            found.update(self.buckets.get(key, ()))
+        return found
+
+    def nearest(self, signature: np.ndarray, before: Any = None, now: Any = None) -> Tuple[float, Any]:
+        """(similarity, label) of the closest entry in the window, or (0.0, None).
+
+        ``before`` limits the match to entries stamped earlier than it.
+        """
+        oldest = timestamp(now) - self.max_age
+        cutoff = timestamp(before) if before is not None else float("inf")
+        best, best_label = 0.0, None
+        for entry_id in self.candidates(signature):
+            at, other, label = self.entries[entry_id]
+            if oldest <= at < cutoff:
+                score = similarity(signature, other)
+                if score > best:
+                    best, best_label = score, label
+        return best, best_label
+
+def group_near_duplicates(texts: Sequence[str], threshold: float = DUPLICATE_THRESHOLD) -> List[int]:
+    """Group id per text; texts whose signatures reach ``threshold`` share a group."""
+    index = MinHashLSH(window=len(texts) + 1)
+    signatures = [minhash(text) for text in texts]
+    groups = list(range(len(texts)))
+
+    def root(i: int) -> int:
+        while groups[i] != i:
+            groups[i] = groups[groups[i]]
+            i = groups[i]
+        return i
+
+    for i, signature in enumerate(signatures):
+        for j in index.candidates(signature):
+            if similarity(signature, signatures[j]) >= threshold:
+                groups[root(i)] = root(j)
+        index.add(signature, 0.0, i)
+    return [root(i) for i in range(len(texts))]
+
+class NearDuplicateDetector:
+    """Rolling per-scope windows of recent briefs and published posts.
+
+    A scope is usually a brand id, or a niche when no brand is given. At
+    most ``max_scopes`` scopes are kept, least recently written first out.
+    """
+
+    def __init__(self, window: int = 2000, max_age_days: float = 90, max_scopes: int = 1024, threshold: float = DUPLICATE_THRESHOLD):
+        self.window = window
+        self.max_age = max_age_days * 86400
+        self.max_scopes = max_scopes
+        self.threshold = threshold
+        self.scopes: "OrderedDict[Hashable, MinHashLSH]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"recorded": 0, "queries": 0, "duplicates": 0}
+
+    def record(self, scope: Hashable, text: str, at: Any = None, label: Any = None):
+        signature = minhash(text)
+        with self._lock:
+            index = self.scopes.get(scope)
+            if index is None:
+                index = self.scopes[scope] = MinHashLSH(self.window, self.max_age)
+                if len(self.scopes) > self.max_scopes:
+                    self.scopes.popitem(last=False)
+            self.scopes.move_to_end(scope)
+            index.add(signature, at, label)
+            self.stats["recorded"] += 1
+
+    def nearest(self, scope: Hashable, text: str, before: Any = None) -> Tuple[float, Any]:
+        """(similarity, label) of the closest recent item in the scope."""
+        with self._lock:
+            index = self.scopes.get(scope)
+            self.stats["queries"] += 1
+            if index is None:
+                return 0.0, None
+            score, label = index.nearest(minhash(text), before)
+            if score >= self.threshold:
+                self.stats["duplicates"] += 1
+            return score, label
+
+    def similarities(self, scope: Hashable, texts: Sequence[str], before: Any = None) -> Dict[str, float]:
+        """Closest-match similarity per text, for penalizing candidates in bulk."""
+        return {text: self.nearest(scope, text, before)[0] for text in texts}
+
+    def is_duplicate(self, scope: Hashable, text: str, before: Any = None) -> bool:
+        return self.nearest(scope, text, before)[0] >= self.threshold
+
+    async def load_from_db(self) -> int:
+        """Seed brand windows with our own posts published within ``max_age``."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.max_age)
+        loaded = 0
+        async with async_session() as db:
+            result = await db.stream(
+                select(ContentPost.brand_id, ContentPost.content_text, ContentPost.published_at)
+                .where(
+                    ContentPost.is_competitor.is_(False),
+                    ContentPost.brand_id.is_not(None),
+                    ContentPost.published_at >= cutoff,
+                )
+                .order_by(ContentPost.published_at)
+                .execution_options(yield_per=5000)
+            )
+            async for brand_id, content_text, published_at in result:
+                self.record(brand_id, content_text, published_at)
+                loaded += 1
+        logger.info("Seeded near-duplicate windows from %d posts", loaded)
+        return loaded
+
+near_duplicates = NearDuplicateDetector()
@@ -0,0 +1,42 @@
+from enum import Enum
+
+class SubscriptionTier(Enum):
+    FREE = "free"
+    STARTER = "starter"  # $29/month
+    PRO = "professional"  # $99/month
+    AGENCY = "agency"    # $299/month
+
+PRICING_PLANS = {
+    "starter": {
+        "stripe_price_id": "price_starter_monthly",
+        "amount": 29,
+        "currency": "usd",
+        "brands_limit": 3,
+        "api_calls_limit": 1000,
+        "features": ["basic_automation", "content_calendar", "analytics"]
+    },
+    "professional": {
+        "stripe_price_id": "price_pro_monthly",
+        "amount": 99,
+        "currency": "usd", 
+        "brands_limit": 10,
+        "api_calls_limit": 10000,
+        "features": ["advanced_ai", "competitor_analysis", "white_label", "api_access"]
+    },
+    "agency": {
+        "stripe_price_id": "price_agency_monthly",
+        "amount": 299,
+        "currency": "usd",
+        "brands_limit": 50,
+        "api_calls_limit": 100000,
+        "features": ["client_management", "custom_workflows", "priority_support"]
+    }
+}
+
+# Monthly usage limits per tier, enforced by UsageService
+USAGE_LIMITS = {
+    "free": {"api_calls": 10, "brands": 1, "calendar_generations": 2},
+    "starter": {"api_calls": 1000, "brands": 3, "calendar_generations": 50},
+    "professional": {"api_calls": 10000, "brands": 10, "calendar_generations": 500},
+    "agency": {"api_calls": 100000, "brands": 50, "calendar_generations": 5000}
+}
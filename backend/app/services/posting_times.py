@@ -0,0 +1,211 @@
+import logging
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import numpy as np
+from sqlalchemy import select
+from app.database.models import Brand, ContentPost, DashboardEventRecord
+from app.database.session import async_session
+from app.services.engagement_model import AUDIENCE_BUCKETS, PLATFORM_NAMES, audience_bucket, engagement_model
+
+logger = logging.getLogger(__name__)
+
+HOURS_OF_WEEK = 168
+LOOKBACK_DAYS = 90
+
+def brand_timezone(brand_settings: Optional[Dict[str, Any]]) -> tzinfo:
+    """The IANA zone in a brand's ``settings["timezone"]``; UTC when unset or unknown."""
+    name = (brand_settings or {}).get("timezone")
+    if name:
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            logger.warning("Unknown brand timezone %r, using UTC", name)
+    return timezone.utc
+
+def hour_of_week(moment: datetime, zone: tzinfo = timezone.utc) -> int:
+    """Wall-clock hour of week in ``zone``; naive moments are UTC."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    moment = moment.astimezone(zone)
+    return moment.weekday() * 24 + moment.hour
+
+def spread(values: np.ndarray) -> np.ndarray:
+    """Share a quarter of each bucket with its neighbouring hours, wrapping Sunday into Monday."""
+    return 0.5 * values + 0.25 * (np.roll(values, 1, axis=-1) + np.roll(values, -1, axis=-1))
+
+class PostingTimes:
+    """Engagement by hour of week per brand, platform and audience.
+
+    Each (brand, platform, audience) key owns one row of two float32
+    arrays, engagement sums and post counts over 168 buckets, and an event
+    updates its audience row, the brand's platform row and the all-brands
+    platform row in place. Reads shrink each row towards its parent, so a
+    brand with a handful of posts follows the all-brands curve and the
+    all-brands curve follows the engagement model until data arrives.
+
+    ``lift_table`` returns (platforms, audience buckets, 168) multipliers
+    relative to the model's hour-of-week shape, computed once per brand and
+    reused until new events arrive, so per-slot lookups are plain array
+    indexing.
+
+    Buckets are in each brand's local wall-clock time (``brand_timezone``)
+    because the planner's SLOTS are local posting times: 09:00 means 9am
+    where the brand's audience is. The all-brands rows therefore pool
+    local hours too. A brand's zone is read the first time it is seen, so
+    changing it only affects later events.
+    """
+
+    def __init__(self, prior_strength: float = 10.0, capacity: int = 64):
+        self.prior_strength = prior_strength
+        self.keys: Dict[Tuple[Optional[int], str, Optional[int]], int] = {}
+        self.sums = np.zeros((capacity, HOURS_OF_WEEK), dtype=np.float32)
+        self.counts = np.zeros((capacity, HOURS_OF_WEEK), dtype=np.float32)
+        self.version = 0
+        self.timezones: Dict[int, tzinfo] = {}
+        self._tables: Dict[Tuple[Optional[int], Tuple[str, ...]], np.ndarray] = {}
+        self._shapes: Dict[str, np.ndarray] = {}
+
+    def _row(self, key: Tuple[Optional[int], str, Optional[int]]) -> int:
+        row = self.keys.get(key)
+        if row is None:
+            row = self.keys[key] = len(self.keys)
+            if row == len(self.sums):
+                self.sums = np.concatenate([self.sums, np.zeros_like(self.sums)])
+                self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)])
+        return row
+
+    def record(
+        self,
+        brand_id: int,
+        platform: str,
+        moment: datetime,
+        engagement_rate: float,
+        audience: Optional[str] = None,
+        count: int = 1,
+    ):
+        """Add ``count`` posts published at ``moment`` with the given mean engagement rate."""
+        bucket = hour_of_week(moment, self.timezones.get(brand_id, timezone.utc))
+        keys = [(None, platform, None), (brand_id, platform, None)]
+        if audience:
+            keys.append((brand_id, platform, audience_bucket(audience)))
+        for key in keys:
+            row = self._row(key)
+            self.sums[row, bucket] += engagement_rate * count
+            self.counts[row, bucket] += count
+        self.version += 1
+        self._tables.clear()
+
+    async def load_timezones(self, brand_ids: Optional[Iterable[int]] = None):
+        """Read the zones of the given brands not seen yet, or of every brand."""
+        query = select(Brand.id, Brand.settings)
+        if brand_ids is not None:
+            missing = {brand_id for brand_id in brand_ids if brand_id not in self.timezones}
+            if not missing:
+                return
+            query = query.where(Brand.id.in_(missing))
+        async with async_session() as db:
+            for brand_id, brand_settings in (await db.execute(query)).all():
+                self.timezones[brand_id] = brand_timezone(brand_settings)
+
+    async def record_events(self, events: List[Dict[str, Any]]):
+        """Dashboard-metrics observer: engagement events with a known platform and some reach."""
+        events = [
+            event for event in events
+            if event["type"] == "engagement" and event["platform"] in PLATFORM_NAMES and event["reach"]
+        ]
+        await self.load_timezones(event["brand_id"] for event in events)
+        for event in events:
+            self.record(
+                event["brand_id"], event["platform"], event["at"],
+                (event["engagements"] or 0) / event["reach"], event["audience"],
+            )
+
+    def has_data(self, brand_id: Optional[int] = None) -> bool:
+        return any(key[0] == brand_id for key in self.keys)
+
+    def _shape(self, platform: str) -> np.ndarray:
+        """The engagement model's hour-of-week curve for the platform, mean 1."""
+        shape = self._shapes.get(platform)
+        if shape is None:
+            hours = np.arange(HOURS_OF_WEEK)
+            curve = engagement_model.predict(
+                PLATFORM_NAMES.index(platform), 0, hours // 24, hours % 24 + 0.5, 0.04, 0
+            )
+            shape = self._shapes[platform] = curve / curve.mean()
+        return shape
+
+    def _smooth(self, key: Tuple[Optional[int], str, Optional[int]], parent: np.ndarray) -> np.ndarray:
+        """Mean engagement per bucket, shrunk towards ``parent`` rescaled to this row's level."""
+        row = self.keys.get(key)
+        if row is None:
+            return parent
+        sums, counts = self.sums[row].astype(np.float64), self.counts[row].astype(np.float64)
+        # Without engagement there is no level to rescale by; follow the parent as is
+        if sums.sum() == 0 or counts.sum() == 0:
+            return parent
+        level = sums.sum() / counts.sum() / (parent @ counts / counts.sum())
+        return (spread(sums) + self.prior_strength * level * parent) / (spread(counts) + self.prior_strength)
+
+    def lift_table(self, brand_id: Optional[int], platforms: List[str]) -> np.ndarray:
+        """(platforms, AUDIENCE_BUCKETS, 168) engagement relative to the model's curve; 1.0 without data."""
+        cache_key = (brand_id, tuple(platforms))
+        cached = self._tables.get(cache_key)
+        if cached is not None:
+            return cached
+
+        lift = np.ones((len(platforms), AUDIENCE_BUCKETS, HOURS_OF_WEEK), dtype=np.float32)
+        for p, platform in enumerate(platforms):
+            shape = self._shape(platform)
+            curve = self._smooth((None, platform, None), shape)
+            if brand_id is not None:
+                curve = self._smooth((brand_id, platform, None), curve)
+            for audience in range(AUDIENCE_BUCKETS):
+                smoothed = self._smooth((brand_id, platform, audience), curve) if brand_id is not None else curve
+                # Relative to the row's own level, so only the timing changes the score
+                if smoothed.mean() > 0:
+                    lift[p, audience] = smoothed / (smoothed.mean() * shape)
+
+        self._tables[cache_key] = lift
+        return lift
+
+    async def load_from_db(self) -> int:
+        """Seed the histograms with our own posts and engagement events from the last LOOKBACK_DAYS."""
+        cutoff = datetime.utcnow() - timedelta(days=LOOKBACK_DAYS)
+        loaded = 0
+        await self.load_timezones()
+        async with async_session() as db:
+            result = await db.stream(
+                select(ContentPost.brand_id, ContentPost.platform, ContentPost.published_at, ContentPost.engagement_rate)
+                .where(
+                    ContentPost.is_competitor.is_(False),
+                    ContentPost.brand_id.is_not(None),
+                    ContentPost.platform.in_(PLATFORM_NAMES),
+                    ContentPost.engagement_rate > 0,
+                    ContentPost.published_at >= cutoff,
+                )
+                .execution_options(yield_per=5000)
+            )
+            async for brand_id, platform, published_at, engagement_rate in result:
+                self.record(brand_id, platform, published_at, engagement_rate)
+                loaded += 1
+            result = await db.stream(
+                select(DashboardEventRecord.__table__)
+                .where(
+                    DashboardEventRecord.type == "engagement",
+                    DashboardEventRecord.platform.in_(PLATFORM_NAMES),
+                    DashboardEventRecord.reach > 0,
+                    DashboardEventRecord.at >= cutoff,
+                )
+                .execution_options(yield_per=5000)
+            )
+            async for event in result.mappings():
+                self.record(
+                    event["brand_id"], event["platform"], event["at"],
+                    (event["engagements"] or 0) / event["reach"], event["audience"],
+                )
+                loaded += 1
+        logger.info("Seeded posting-time histograms from %d posts", loaded)
+        return loaded
+
+posting_times = PostingTimes()
@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import select, update
+from app.database.models import User
+from app.database.session import async_session
+from app.services.auth import auth_service
+from app.services.hashing import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+class ProvisioningError(Exception):
+    pass
+
+class CustomerProvisioner:
+    """Creates Stripe customers off the signup path.
+
+    ``submit`` queues a user and returns at once; a small worker pool calls
+    ``create_customer`` with retries and jittered backoff, then stores the
+    customer id on the user row. Callers that need the id right away (e.g.
+    checkout) use ``ensure_customer``, which waits on the in-flight attempt
+    or provisions inline. ``reconcile`` periodically re-queues users that
+    still have no customer, which covers queue entries lost on restart.
+    Each round that exhausts its attempts is recorded on the user row, and
+    users with ``max_reconcile_rounds`` failed rounds are no longer
+    re-queued; their last error stays in ``stripe_provisioning_error``.
+    """
+
+    def __init__(
+        self,
+        create_customer: Callable[[int, str, str], Awaitable[Dict[str, Any]]],
+        workers: int = 4,
+        max_attempts: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        reconcile_interval: float = 300.0,
+        reconcile_grace: float = 120.0,
+        max_reconcile_rounds: int = 5,
+    ):
+        self.create_customer = create_customer
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.reconcile_interval = reconcile_interval
+        self.reconcile_grace = reconcile_grace
+        self.max_reconcile_rounds = max_reconcile_rounds
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._tasks: List[asyncio.Task] = []
+        self.latency = LatencyStats()
+        self.stats = {"submitted": 0, "provisioned": 0, "retries": 0, "failed": 0, "reconciled": 0}
+
+    def submit(self, user_id: int, email: str, name: str) -> asyncio.Future:
+        future = self._pending.get(user_id)
+        if future is not None and not future.done():
+            return future
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may ever await this, so don't let a failure log as unretrieved
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._pending[user_id] = future
+        self.stats["submitted"] += 1
+
+        if self._queue is None:
+            # Workers aren't running (e.g. scripts): provision in the background directly
+            asyncio.get_running_loop().create_task(self._provision(user_id, email, name, time.perf_counter()))
+        else:
+            self._queue.put_nowait((user_id, email, name, time.perf_counter()))
+        return future
+
+    async def ensure_customer(self, user_id: int, email: str, name: str, timeout: float = 15.0) -> str:
+        future = self._pending.get(user_id)
+        if future is None or (future.done() and future.exception() is not None):
+            future = self.submit(user_id, email, name)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            raise ProvisioningError("Timed out waiting for Stripe customer")
+
+    async def _provision(self, user_id: int, email: str, name: str, submitted: float):
+        future = self._pending.get(user_id)
+        attempt = 0
+        while True:
+            attempt += 1
+            result = await self.create_customer(user_id, email, name)
+            if result["success"]:
+                break
+            if attempt >= self.max_attempts:
+                self.stats["failed"] += 1
+                logger.warning("Giving up on Stripe customer for user %s: %s", user_id, result["error"])
+                await self._record_failure(user_id, result["error"])
+                if future is not None and not future.done():
+                    future.set_exception(ProvisioningError(result["error"]))
+                self._pending.pop(user_id, None)
+                return
+            self.stats["retries"] += 1
+            await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt))))
+
+        customer_id = result["customer_id"]
+        await self._save_customer_id(user_id, customer_id)
+        self.stats["provisioned"] += 1
+        self.latency.record(time.perf_counter() - submitted)
+        if future is not None and not future.done():
+            future.set_result(customer_id)
+        self._pending.pop(user_id, None)
+
+    async def _save_customer_id(self, user_id: int, customer_id: str):
+        async with async_session() as db:
+            await db.execute(
+                update(User)
+                .where(User.id == user_id, User.stripe_customer_id.is_(None))
+                .values(stripe_customer_id=customer_id)
+            )
+            await db.commit()
+        # The cached row predates the customer id
+        auth_service.user_cache.invalidate(user_id)
+
+    async def _record_failure(self, user_id: int, error: str):
+        async with async_session() as db:
+            await db.execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(
+                    stripe_provisioning_failures=User.stripe_provisioning_failures + 1,
+                    stripe_provisioning_error=str(error)[:255],
+                )
+            )
+            await db.commit()
+
+    async def reconcile(self) -> int:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.reconcile_grace)
+        async with async_session() as db:
+            result = await db.execute(
+                select(User.id, User.email, User.name).where(
+                    User.stripe_customer_id.is_(None),
+                    User.is_active.is_(True),
+                    User.created_at < cutoff,
+                    User.stripe_provisioning_failures < self.max_reconcile_rounds,
+                )
+            )
+            missing: List[Tuple[int, str, str]] = result.all()
+
+        requeued = 0
+        for user_id, email, name in missing:
+            if user_id not in self._pending:
+                self.submit(user_id, email, name)
+                requeued += 1
+        self.stats["reconciled"] += requeued
+        return requeued
+
+    async def _work(self):
+        while True:
+            user_id, email, name, submitted = await self._queue.get()
+            try:
+                await self._provision(user_id, email, name, submitted)
+            except Exception as e:
+                logger.exception("Provisioning user %s failed", user_id)
+                future = self._pending.pop(user_id, None)
+                if future is not None and not future.done():
+                    future.set_exception(ProvisioningError(str(e)))
+            finally:
+                self._queue.task_done()
+
+    async def _reconcile_forever(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile()
+            except Exception:
+                logger.exception("Customer reconciliation failed")
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reconcile_forever()))
+
+    async def drain(self):
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "in_flight": len(self._pending),
+            "latency": self.latency.summary(),
+        }
@@ -0,0 +1,126 @@
+import calendar
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+from app.config import settings
+from app.services.usage_buffer import month_start
+
+# Keep counters a little past month end so late readers still see them
+KEY_GRACE_SECONDS = 3 * 24 * 3600
+
+# KEYS[1] counter key
+# ARGV[1] amount, ARGV[2] limit, ARGV[3] expire-at (unix seconds), ARGV[4] seed ("" to skip)
+CONSUME_SCRIPT = """
+if ARGV[4] ~= '' then
+    redis.call('SET', KEYS[1], ARGV[4], 'NX', 'EXAT', ARGV[3])
+end
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local amount = tonumber(ARGV[1])
+if current + amount > tonumber(ARGV[2]) then
+    return {0, current}
+end
+current = redis.call('INCRBY', KEYS[1], amount)
+if current == amount then
+    redis.call('EXPIREAT', KEYS[1], ARGV[3])
+end
+return {1, current}
+"""
+
+@dataclass
+class QuotaResult:
+    allowed: bool
+    current: int
+
+def quota_key(user_id: int, feature: str, period: datetime) -> str:
+    return f"quota:{user_id}:{feature}:{period:%Y%m}"
+
+def period_expiry(period: datetime) -> int:
+    if period.month == 12:
+        next_period = period.replace(year=period.year + 1, month=1)
+    else:
+        next_period = period.replace(month=period.month + 1)
+    return calendar.timegm(next_period.utctimetuple()) + KEY_GRACE_SECONDS
+
+class QuotaBackend(ABC):
+    """Atomic check-and-increment of monthly per-feature counters.
+
+    ``consume`` only increments when the result stays within ``limit``. The
+    first call for a key in this process may pass ``seed`` (the count already
+    recorded in the database) so a fresh counter starts from the real total.
+    """
+
+    def __init__(self):
+        self._seeded: Set[str] = set()
+        self._period: Optional[datetime] = None
+
+    def needs_seed(self, user_id: int, feature: str) -> bool:
+        return quota_key(user_id, feature, month_start()) not in self._seeded
+
+    async def consume(
+        self, user_id: int, feature: str, limit: int, amount: int = 1, seed: Optional[int] = None
+    ) -> QuotaResult:
+        period = month_start()
+        if period != self._period:
+            self._period = period
+            self._seeded.clear()
+        key = quota_key(user_id, feature, period)
+        result = await self._consume(key, amount, limit, period_expiry(period), seed)
+        self._seeded.add(key)
+        return result
+
+    @abstractmethod
+    async def _consume(self, key: str, amount: int, limit: int, expire_at: int, seed: Optional[int]) -> QuotaResult:
+        ...
+
+    async def close(self):
+        pass
+
+class InMemoryQuotaBackend(QuotaBackend):
+    def __init__(self):
+        super().__init__()
+        self._counters: Dict[str, Tuple[int, int]] = {}
+        self._expire_at = 0
+
+    async def _consume(self, key, amount, limit, expire_at, seed):
+        # No awaits below, so this is atomic with respect to the event loop
+        now = time.time()
+        if expire_at != self._expire_at:
+            # New period: drop counters whose keys have expired
+            self._expire_at = expire_at
+            self._counters = {k: v for k, v in self._counters.items() if v[1] > now}
+        current, expiry = self._counters.get(key, (None, expire_at))
+        if current is None or expiry <= now:
+            current, expiry = (seed or 0), expire_at
+
+        if current + amount > limit:
+            self._counters[key] = (current, expiry)
+            return QuotaResult(False, current)
+
+        current += amount
+        self._counters[key] = (current, expiry)
+        return QuotaResult(True, current)
+
+class RedisQuotaBackend(QuotaBackend):
+    def __init__(self, url: str):
+        super().__init__()
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self._script = self.redis.register_script(CONSUME_SCRIPT)
+
+    async def _consume(self, key, amount, limit, expire_at, seed):
+        allowed, current = await self._script(
+            keys=[key],
+            args=[amount, limit, expire_at, "" if seed is None else seed],
+        )
+        return QuotaResult(bool(allowed), int(current))
+
+    async def close(self):
+        await self.redis.aclose()
+
+def create_quota_backend() -> QuotaBackend:
+    if settings.REDIS_URL:
+        return RedisQuotaBackend(settings.REDIS_URL)
+    return InMemoryQuotaBackend()
@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from app.config import settings
+from app.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+def normalize_param(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    return value
+
+class ResultCache:
+    """Caches endpoint results with stale-while-revalidate and single-flight.
+
+    An entry is fresh for ``ttl`` seconds and then served stale for up to
+    ``stale_ttl`` more while one background task recomputes it. Concurrent
+    misses for a key share a single computation. Entries live in a local
+    LRU and, when ``redis_url`` is set, in Redis too so that other API
+    instances can reuse them. Redis errors are logged and treated as misses.
+    """
+
+    def __init__(self, namespace: str, ttl: float, stale_ttl: float, maxsize: int = 1024, redis_url: str = ""):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl + stale_ttl)
+        self.redis = None
+        if redis_url:
+            import redis.asyncio as redis
+
+            self.redis = redis.from_url(redis_url)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {
+            "fresh_hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "redis_hits": 0,
+            "refreshes": 0,
+            "errors": 0,
+        }
+
+    def make_key(self, name: str, **params) -> str:
+        normalized = json.dumps({k: normalize_param(v) for k, v in params.items()}, sort_keys=True)
+        return f"{self.namespace}:{name}:{hashlib.sha1(normalized.encode()).hexdigest()}"
+
+    async def _lookup(self, key: str) -> Optional[Tuple[Any, float]]:
+        entry = self.local.get(key)
+        if entry is not None or self.redis is None:
+            return entry
+        try:
+            raw = await self.redis.get(key)
+        except Exception:
+            logger.warning("Result cache read from Redis failed", exc_info=True)
+            return None
+        if raw is None:
+            return None
+        payload = json.loads(raw)
+        entry = (payload["value"], payload["fresh_until"])
+        self.stats["redis_hits"] += 1
+        self.local.set(key, entry, ttl=max(0.0, payload["fresh_until"] + self.stale_ttl - time.time()))
+        return entry
+
+    async def _store(self, key: str, value: Any):
+        fresh_until = time.time() + self.ttl
+        self.local.set(key, (value, fresh_until))
+        if self.redis is None:
+            return
+        try:
+            payload = json.dumps({"value": value, "fresh_until": fresh_until})
+            await self.redis.set(key, payload, ex=int(self.ttl + self.stale_ttl))
+        except Exception:
+            logger.warning("Result cache write to Redis failed", exc_info=True)
+
+    def _compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is not None:
+            return task
+
+        async def fill():
+            try:
+                value = await compute()
+                await self._store(key, value)
+                return value
+            except Exception:
+                self.stats["errors"] += 1
+                raise
+            finally:
+                self._inflight.pop(key, None)
+
+        # A task, not the caller's coroutine, so a disconnecting client can't cancel it for everyone
+        task = asyncio.create_task(fill())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._inflight[key] = task
+        return task
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        entry = await self._lookup(key)
+        if entry is not None:
+            value, fresh_until = entry
+            if time.time() < fresh_until:
+                self.stats["fresh_hits"] += 1
+            else:
+                self.stats["stale_hits"] += 1
+                if key not in self._inflight:
+                    self.stats["refreshes"] += 1
+                    self._compute(key, compute)
+            return value
+
+        if key in self._inflight:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+        return await asyncio.shield(self._compute(key, compute))
+
+    async def invalidate(self, key: str):
+        self.local.invalidate(key)
+        if self.redis is not None:
+            try:
+                await self.redis.delete(key)
+            except Exception:
+                logger.warning("Result cache delete in Redis failed", exc_info=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["fresh_hits"] + self.stats["stale_hits"] + self.stats["misses"] + self.stats["coalesced"]
+        served = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(served / lookups, 4) if lookups else 0.0,
+            "in_flight": len(self._inflight),
+            "local": self.local.stats(),
+        }
+
+    async def close(self):
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self.redis is not None:
+            await self.redis.aclose()
+
+result_cache = ResultCache(
+    "results",
+    ttl=settings.RESULT_CACHE_TTL_SECONDS,
+    stale_ttl=settings.RESULT_CACHE_STALE_SECONDS,
+    maxsize=settings.RESULT_CACHE_MAX_SIZE,
+    redis_url=settings.REDIS_URL,
+)
@@ -0,0 +1,148 @@
+import asyncio
+import random
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+import httpx
+
+RETRYABLE_STATUS = {409, 429, 500, 502, 503, 504}
+
+class StripeError(Exception):
+    def __init__(self, message: str, status: Optional[int] = None, code: Optional[str] = None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+def encode_params(params: Dict[str, Any], prefix: str = "") -> List[Tuple[str, str]]:
+    # Stripe's form encoding: nested dicts and lists become a[b][0][c]=value
+    pairs = []
+    for key, value in params.items():
+        if value is None:
+            continue
+        name = f"{prefix}[{key}]" if prefix else str(key)
+        if isinstance(value, dict):
+            pairs.extend(encode_params(value, name))
+        elif isinstance(value, (list, tuple)):
+            for index, item in enumerate(value):
+                item_name = f"{name}[{index}]"
+                if isinstance(item, dict):
+                    pairs.extend(encode_params(item, item_name))
+                else:
+                    pairs.append((item_name, _encode_scalar(item)))
+        else:
+            pairs.append((name, _encode_scalar(value)))
+    return pairs
+
+def _encode_scalar(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+class StripeClient:
+    """Async Stripe REST client with a pooled HTTP connection.
+
+    Every POST carries an Idempotency-Key, so retries on network errors,
+    429s and 5xx responses can't create duplicate objects. Backoff is
+    exponential with full jitter. ``base_url`` can point at the local stub
+    server in ``tools/stripe_stub.py`` for offline runs.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://api.stripe.com",
+        timeout: float = 10.0,
+        max_retries: int = 2,
+        max_connections: int = 20,
+        backoff_base: float = 0.25,
+        backoff_max: float = 4.0,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_connections = max_connections
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                auth=(self.api_key, ""),
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        idempotency_key: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        headers = {}
+        content = None
+        query = None
+        if method == "POST":
+            headers["Idempotency-Key"] = idempotency_key or str(uuid.uuid4())
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            content = urlencode(encode_params(params or {}))
+        elif params:
+            query = encode_params(params)
+
+        attempt = 0
+        while True:
+            try:
+                response = await self.client.request(method, path, content=content, params=query, headers=headers)
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                if attempt >= self.max_retries:
+                    raise StripeError(f"Network error talking to Stripe: {e}") from e
+            else:
+                if response.status_code < 400:
+                    return response.json()
+                if not self._should_retry(response) or attempt >= self.max_retries:
+                    raise self._error_from(response)
+
+            attempt += 1
+            await asyncio.sleep(self._backoff(attempt))
+
+    def _should_retry(self, response: httpx.Response) -> bool:
+        should_retry = response.headers.get("Stripe-Should-Retry")
+        if should_retry is not None:
+            return should_retry == "true"
+        return response.status_code in RETRYABLE_STATUS
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _error_from(self, response: httpx.Response) -> StripeError:
+        try:
+            error = response.json().get("error", {})
+        except ValueError:
+            error = {}
+        return StripeError(
+            error.get("message") or f"Stripe returned HTTP {response.status_code}",
+            status=response.status_code,
+            code=error.get("code"),
+        )
+
+    async def create_customer(self, email: str, name: str, idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        return await self.request(
+            "POST", "/v1/customers", {"email": email, "name": name}, idempotency_key=idempotency_key
+        )
+
+    async def create_checkout_session(self, idempotency_key: Optional[str] = None, **params) -> Dict[str, Any]:
+        return await self.request("POST", "/v1/checkout/sessions", params, idempotency_key=idempotency_key)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,368 @@
+import asyncio
+import bisect
+import fcntl
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import func, select
+from app.config import settings
+from app.database.models import ContentPost
+from app.database.session import async_session
+from app.services.embeddings import TOKEN_RE
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how in is it its of on or our that the this to was we were "
+    "what when which will with you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+class BM25Index:
+    """Inverted index over post text, ranked with BM25.
+
+    Postings live in two parts. The frozen part is CSR: ``offsets[t]`` to
+    ``offsets[t + 1]`` slice ``doc_ids`` and ``freqs`` for term ``t``, and
+    after a snapshot load those arrays are memory-mapped, so API workers
+    share one copy through the page cache. Posts added since go to small
+    per-term tail arrays, which are folded into the CSR arrays once they
+    hold ``merge_threshold`` postings. Documents are numbered in insertion
+    order and map back to content_posts ids through ``post_ids``; their
+brand (-1 for none) is kept alongside so searches can be scoped to the
+caller's brands.
+
+    Snapshots are written to a fresh generation directory and published by
+    atomically replacing the ``CURRENT`` pointer file. Workers save under an
+    exclusive ``flock`` on ``LOCK`` and load under a shared one, so only one
+    publishes at a time and old generations are never removed while a
+    worker is still writing or opening them.
+    """
+
+    def __init__(self, path: str = "", k1: float = 1.2, b: float = 0.75, merge_threshold: int = 500000):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.merge_threshold = merge_threshold
+        self.terms: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.empty(0, dtype=np.int32)
+        self.freqs = np.empty(0, dtype=np.uint16)
+        self.tail: Dict[int, Tuple[array, array]] = {}
+        self.tail_postings = 0
+        self._doc_len = np.empty(0, dtype=np.int32)
+        self._post_ids = np.empty(0, dtype=np.int64)
+        self._competitor = np.empty(0, dtype=bool)
+        self._brand_ids = np.empty(0, dtype=np.int64)
+        self.size = 0
+        self.total_len = 0
+        self.max_post_id = 0
+        # Sorted frozen terms for prefix lookups, plus terms added since the last merge
+        self._sorted_terms: List[str] = []
+        self._new_terms: List[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _reserve(self, extra: int):
+        needed = self.size + extra
+        capacity = len(self._doc_len)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        for name in ("_doc_len", "_post_ids", "_competitor", "_brand_ids"):
+            old = getattr(self, name)
+            grown = np.zeros(capacity, dtype=old.dtype)
+            grown[: self.size] = old[: self.size]
+            setattr(self, name, grown)
+
+    def add(self, posts: Sequence[Dict[str, Any]]):
+        """Index posts given as dicts with id, content_text, is_competitor and brand_id."""
+        tokenized = [tokenize(post["content_text"]) for post in posts]
+        with self._lock:
+            self._reserve(len(posts))
+            for post, tokens in zip(posts, tokenized):
+                doc = self.size
+                counts: Dict[str, int] = {}
+                for token in tokens:
+                    counts[token] = counts.get(token, 0) + 1
+                for token, count in counts.items():
+                    term = self.terms.get(token)
+                    if term is None:
+                        term = self.terms[token] = len(self.terms)
+                        self._new_terms.append(token)
+                    postings = self.tail.get(term)
+                    if postings is None:
+                        postings = self.tail[term] = (array("i"), array("H"))
+                    postings[0].append(doc)
+                    postings[1].append(min(count, 65535))
+                self.tail_postings += len(counts)
+                self._doc_len[doc] = len(tokens)
+                self._post_ids[doc] = post.get("id") or -1
+                self._competitor[doc] = bool(post.get("is_competitor"))
+                self._brand_ids[doc] = post.get("brand_id") or -1
+                self.size += 1
+                self.total_len += len(tokens)
+                self.max_post_id = max(self.max_post_id, post.get("id") or 0)
+            if self.tail_postings >= self.merge_threshold:
+                self._merge()
+
+    def _merge(self):
+        """Fold the tail into fresh CSR arrays."""
+        n_terms = len(self.terms)
+        frozen = np.zeros(n_terms, dtype=np.int64)
+        frozen[: len(self.offsets) - 1] = np.diff(self.offsets)
+        added = np.zeros(n_terms, dtype=np.int64)
+        for term, (docs, _) in self.tail.items():
+            added[term] = len(docs)
+        offsets = np.concatenate([[0], np.cumsum(frozen + added)])
+        doc_ids = np.empty(offsets[-1], dtype=np.int32)
+        freqs = np.empty(offsets[-1], dtype=np.uint16)
+
+        # Frozen postings keep their order within each term, shifted to the term's new start
+        old_terms = np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets))
+        positions = offsets[old_terms] + np.arange(len(self.doc_ids)) - self.offsets[old_terms]
+        doc_ids[positions] = self.doc_ids
+        freqs[positions] = self.freqs
+        # Tail documents are newer than every frozen one, so they go after them
+        for term, (docs, counts) in self.tail.items():
+            start = offsets[term] + frozen[term]
+            doc_ids[start:start + len(docs)] = docs
+            freqs[start:start + len(counts)] = counts
+
+        self.offsets, self.doc_ids, self.freqs = offsets, doc_ids, freqs
+        self.tail, self.tail_postings = {}, 0
+        self._sorted_terms = sorted(self.terms)
+        self._new_terms = []
+
+    def _postings(self, term: int) -> Tuple[np.ndarray, np.ndarray]:
+        docs, freqs = [], []
+        if term < len(self.offsets) - 1:
+            start, end = self.offsets[term], self.offsets[term + 1]
+            docs.append(self.doc_ids[start:end])
+            freqs.append(self.freqs[start:end])
+        tail = self.tail.get(term)
+        if tail is not None:
+            docs.append(np.array(tail[0], dtype=np.int32))
+            freqs.append(np.array(tail[1], dtype=np.uint16))
+        if len(docs) == 1:
+            return docs[0], freqs[0]
+        return np.concatenate(docs or [np.empty(0, np.int32)]), np.concatenate(freqs or [np.empty(0, np.uint16)])
+
+    def _expand(self, prefix: str, limit: int) -> List[int]:
+        """Ids of up to ``limit`` terms starting with ``prefix``, most frequent first."""
+        matches = []
+        position = bisect.bisect_left(self._sorted_terms, prefix)
+        while position < len(self._sorted_terms) and self._sorted_terms[position].startswith(prefix):
+            matches.append(self.terms[self._sorted_terms[position]])
+            position += 1
+        matches.extend(self.terms[token] for token in self._new_terms if token.startswith(prefix))
+        if len(matches) > limit:
+            matches.sort(key=self._df, reverse=True)
+            matches = matches[:limit]
+        return matches
+
+    def _df(self, term: int) -> int:
+        frozen = int(self.offsets[term + 1] - self.offsets[term]) if term < len(self.offsets) - 1 else 0
+        tail = self.tail.get(term)
+        return frozen + (len(tail[0]) if tail is not None else 0)
+
+    def search(
+        self,
+        query: str,
+        k: int = 10,
+        competitor: Optional[bool] = None,
+        prefix: bool = False,
+        max_expansions: int = 16,
+        brand_ids: Optional[Sequence[int]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """(post ids, scores) of the ``k`` best matches, best first.
+
+        With ``prefix`` the last query word also matches longer terms, for
+        search-as-you-type. ``brand_ids`` limits matches to those brands' posts.
+        """
+        tokens = tokenize(query)
+        with self._lock:
+            if not tokens or self.size == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            terms = [self.terms[token] for token in tokens[:-1] if token in self.terms]
+            if prefix:
+                terms.extend(self._expand(tokens[-1], max_expansions))
+            elif tokens[-1] in self.terms:
+                terms.append(self.terms[tokens[-1]])
+
+            avg_len = self.total_len / self.size
+            docs, contributions = [], []
+            for term in dict.fromkeys(terms):
+                doc, freq = self._postings(term)
+                if doc.size == 0:
+                    continue
+                idf = math.log(1.0 + (self.size - doc.size + 0.5) / (doc.size + 0.5))
+                tf = freq.astype(np.float32)
+                norm = self.k1 * (1.0 - self.b + self.b * self._doc_len[doc] / avg_len)
+                docs.append(doc)
+                contributions.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+            if not docs:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+            matched, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(contributions))
+            if competitor is not None:
+                keep = self._competitor[matched] == competitor
+                matched, scores = matched[keep], scores[keep]
+            if brand_ids is not None:
+                keep = np.isin(self._brand_ids[matched], np.asarray(brand_ids, dtype=np.int64))
+                matched, scores = matched[keep], scores[keep]
+            if matched.size > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                matched, scores = matched[top], scores[top]
+            order = np.argsort(-scores, kind="stable")
+            return self._post_ids[matched[order]], scores[order].astype(np.float32)
+
+    def save(self):
+        """Write a snapshot generation and point CURRENT at it, unless the published one is as new."""
+        if not self.path:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "LOCK"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._save_locked()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save_locked(self):
+        pointer = os.path.join(self.path, "CURRENT")
+        previous = _read(pointer)
+        meta = _read_meta(os.path.join(self.path, previous)) if previous else None
+        with self._lock:
+            # Another worker already published everything this one has
+            if meta and meta["max_post_id"] >= self.max_post_id and meta["docs"] >= self.size:
+                return
+            if self.tail:
+                self._merge()
+            generation = f"gen-{int(time.time() * 1000)}-{os.getpid()}"
+            directory = os.path.join(self.path, generation)
+            os.makedirs(directory)
+            for name, values in (
+                ("offsets", self.offsets),
+                ("doc_ids", self.doc_ids),
+                ("freqs", self.freqs),
+                ("doc_len", self._doc_len[: self.size]),
+                ("post_ids", self._post_ids[: self.size]),
+                ("competitor", self._competitor[: self.size]),
+                ("brand_ids", self._brand_ids[: self.size]),
+            ):
+                np.save(os.path.join(directory, f"{name}.npy"), values)
+            ordered = sorted(self.terms, key=self.terms.__getitem__)
+            with open(os.path.join(directory, "terms.txt"), "w") as f:
+                f.write("\n".join(ordered))
+            with open(os.path.join(directory, "meta.json"), "w") as f:
+                json.dump({"docs": self.size, "total_len": self.total_len, "max_post_id": self.max_post_id}, f)
+
+        with open(pointer + f".{os.getpid()}", "w") as f:
+            f.write(generation)
+        os.replace(pointer + f".{os.getpid()}", pointer)
+        # Keep the generation other workers are most likely mapping; drop anything older
+        for entry in os.listdir(self.path):
+            if entry.startswith("gen-") and entry not in (generation, previous):
+                shutil.rmtree(os.path.join(self.path, entry), ignore_errors=True)
+
+    def load(self) -> bool:
+        """Map the current snapshot if there is one; returns whether it loaded."""
+        if not self.path or not os.path.isdir(self.path):
+            return False
+        with open(os.path.join(self.path, "LOCK"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            try:
+                return self._load_locked()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_locked(self) -> bool:
+        generation = _read(os.path.join(self.path, "CURRENT"))
+        if not generation:
+            return False
+        directory = os.path.join(self.path, generation)
+        if not os.path.exists(os.path.join(directory, "brand_ids.npy")):
+            # Snapshots from before brands were indexed can't scope searches; rebuild instead
+            logger.info("Text index snapshot %s has no brand ids, rebuilding", generation)
+            return False
+        meta = _read_meta(directory)
+        with open(os.path.join(directory, "terms.txt")) as f:
+            text = f.read()
+        ordered = text.split("\n") if text else []
+
+        with self._lock:
+            self.offsets, self.doc_ids, self.freqs = (
+                np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in ("offsets", "doc_ids", "freqs")
+            )
+            # Per-document arrays are small and grow with new posts, so they are copied in
+            self._doc_len, self._post_ids, self._competitor, self._brand_ids = (
+                np.load(os.path.join(directory, f"{name}.npy"))
+                for name in ("doc_len", "post_ids", "competitor", "brand_ids")
+            )
+            self.terms = {token: term for term, token in enumerate(ordered)}
+            self.tail, self.tail_postings = {}, 0
+            self._sorted_terms, self._new_terms = sorted(ordered), []
+            self.size, self.total_len, self.max_post_id = meta["docs"], meta["total_len"], meta["max_post_id"]
+        return True
+
+    async def load_from_db(self, batch_size: int = 5000) -> int:
+        """Load the snapshot, index posts newer than it and save a fresh one."""
+        try:
+            await asyncio.to_thread(self.load)
+        except Exception:
+            logger.exception("Could not load the text index snapshot, rebuilding")
+        indexed = 0
+        columns = (ContentPost.id, ContentPost.content_text, ContentPost.is_competitor, ContentPost.brand_id)
+        async with async_session() as db:
+            # Workers ingest different posts, so the published snapshot can lack some below its max id
+            stored = await db.scalar(select(func.count()).where(ContentPost.id <= self.max_post_id))
+            if stored > self.size:
+                ids = np.fromiter(
+                    await db.scalars(select(ContentPost.id).where(ContentPost.id <= self.max_post_id)), dtype=np.int64
+                )
+                missing = np.setdiff1d(ids, self._post_ids[: self.size]).tolist()
+                for start in range(0, len(missing), batch_size):
+                    rows = (await db.execute(select(*columns).where(ContentPost.id.in_(missing[start:start + batch_size])))).all()
+                    await asyncio.to_thread(self.add, [dict(row._mapping) for row in rows])
+                    indexed += len(rows)
+            result = await db.stream(
+                select(*columns)
+                .where(ContentPost.id > self.max_post_id)
+                .order_by(ContentPost.id)
+                .execution_options(yield_per=batch_size)
+            )
+            async for rows in result.partitions(batch_size):
+                await asyncio.to_thread(self.add, [dict(row._mapping) for row in rows])
+                indexed += len(rows)
+        if indexed:
+            await asyncio.to_thread(self.save)
+        logger.info("Text index holds %d posts, %d indexed since the snapshot", self.size, indexed)
+        return indexed
+
+def _read_meta(directory: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(directory, "meta.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+text_index = BM25Index(settings.TEXT_INDEX_PATH)
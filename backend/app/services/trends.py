@@ -0,0 +1,273 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import select
+from app.database.models import ContentPost
+from app.database.session import async_session
+
+logger = logging.getLogger(__name__)
+
+# Forward decay: an event at time t is added with weight exp(rate * (t - landmark)),
+# and a count read at time T is divided by exp(rate * (T - landmark)). Counters
+# are rescaled and the landmark moved before the exponent gets large.
+MAX_EXPONENT = 40.0
+
+def decay_rate(half_life: float) -> float:
+    return math.log(2) / half_life
+
+def to_timestamp(moment: Any) -> float:
+    if moment is None:
+        return time.time()
+    if isinstance(moment, datetime):
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.timestamp()
+    return float(moment)
+
+def post_terms(post: Dict[str, Any]) -> List[str]:
+    terms = [post.get("topic")]
+    terms.extend("#" + tag.lstrip("#").lower() for tag in post.get("hashtags") or [] if tag.strip("#"))
+    return terms
+
+class CountMinSketch:
+    """Time-decayed Count-Min Sketch; estimates never undercount."""
+
+    def __init__(self, width: int, depth: int, half_life: float):
+        self.width = width
+        self.depth = depth
+        self.rate = decay_rate(half_life)
+        self.table = np.zeros((depth, width), dtype=np.float64)
+        self.landmark: Optional[float] = None
+
+    def _columns(self, keys: List[str]) -> np.ndarray:
+        # Double hashing: column_i = (a + i * b) mod width
+        digests = [hashlib.blake2b(key.encode(), digest_size=8).digest() for key in keys]
+        a = np.array([int.from_bytes(d[:4], "little") for d in digests], dtype=np.int64)
+        b = np.array([int.from_bytes(d[4:], "little") | 1 for d in digests], dtype=np.int64)
+        return (a[None, :] + np.arange(self.depth)[:, None] * b[None, :]) % self.width
+
+    def _weight(self, at: float) -> float:
+        if self.landmark is None:
+            self.landmark = at
+        exponent = self.rate * (at - self.landmark)
+        if exponent > MAX_EXPONENT:
+            self.table *= math.exp(-exponent)
+            self.landmark = at
+            exponent = 0.0
+        return math.exp(exponent)
+
+    def add(self, counts: Dict[str, float], at: float):
+        if not counts:
+            return
+        keys = list(counts)
+        weights = np.array([counts[key] for key in keys]) * self._weight(at)
+        columns = self._columns(keys)
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], weights)
+
+    def estimate(self, keys: List[str], now: float) -> np.ndarray:
+        if self.landmark is None or not keys:
+            return np.zeros(len(keys))
+        columns = self._columns(keys)
+        raw = self.table[np.arange(self.depth)[:, None], columns].min(axis=0)
+        return raw * math.exp(-self.rate * (now - self.landmark))
+
+class SpaceSaving:
+    """Time-decayed Space-Saving summary holding the ``capacity`` heaviest keys."""
+
+    def __init__(self, capacity: int, half_life: float):
+        self.capacity = capacity
+        self.rate = decay_rate(half_life)
+        self.counts: Dict[str, float] = {}
+        self.errors: Dict[str, float] = {}
+        self.landmark: Optional[float] = None
+
+    def _weight(self, at: float) -> float:
+        if self.landmark is None:
+            self.landmark = at
+        exponent = self.rate * (at - self.landmark)
+        if exponent > MAX_EXPONENT:
+            scale = math.exp(-exponent)
+            self.counts = {key: count * scale for key, count in self.counts.items()}
+            self.errors = {key: error * scale for key, error in self.errors.items()}
+            self.landmark = at
+            exponent = 0.0
+        return math.exp(exponent)
+
+    def add(self, counts: Dict[str, float], at: float):
+        scale = self._weight(at)
+        for key, amount in counts.items():
+            weight = amount * scale
+            if key in self.counts:
+                self.counts[key] += weight
+            elif len(self.counts) < self.capacity:
+                self.counts[key] = weight
+                self.errors[key] = 0.0
+            else:
+                # Evict the smallest counter; the newcomer inherits its count as error
+                victim = min(self.counts, key=self.counts.__getitem__)
+                floor = self.counts.pop(victim)
+                del self.errors[victim]
+                self.counts[key] = floor + weight
+                self.errors[key] = floor
+
+    def top(self, now: float, k: Optional[int] = None) -> List[Tuple[str, float, float]]:
+        """(key, decayed count, decayed error) for the heaviest keys."""
+        if self.landmark is None:
+            return []
+        scale = math.exp(-self.rate * (now - self.landmark))
+        items = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(key, count * scale, self.errors[key] * scale) for key, count in items]
+
+class NicheTrends:
+    def __init__(self, capacity: int, width: int, depth: int, fast_half_life: float, slow_half_life: float):
+        self.recent = SpaceSaving(capacity, fast_half_life)
+        self.baseline = CountMinSketch(width, depth, slow_half_life)
+        self.events = 0
+        self.ranked: Optional[Tuple[int, float, List[Dict[str, Any]]]] = None
+
+class TrendDetector:
+    """Finds topics and hashtags whose recent volume outpaces their baseline.
+
+    Per niche, a Space-Saving summary with a short half-life tracks the
+    heaviest recent terms and a Count-Min Sketch with a long half-life
+    estimates every term's baseline. Both are fixed-size, so memory stays
+    flat however many posts stream through, and at most ``max_niches``
+    niches are kept (least recently updated first out). A term's lift is
+    its recent rate over its baseline rate, smoothed so that one-off
+    mentions don't rank.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 128,
+        width: int = 2048,
+        depth: int = 4,
+        fast_half_life: float = 6 * 3600,
+        slow_half_life: float = 7 * 86400,
+        max_niches: int = 512,
+        min_support: float = 3.0,
+        refresh_seconds: float = 30.0,
+    ):
+        self.capacity = capacity
+        self.width = width
+        self.depth = depth
+        self.fast_half_life = fast_half_life
+        self.slow_half_life = slow_half_life
+        self.max_niches = max_niches
+        self.min_support = min_support
+        self.refresh_seconds = refresh_seconds
+        self.niches: "OrderedDict[str, NicheTrends]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def niche_key(niche: Optional[str]) -> str:
+        return " ".join((niche or "").lower().split())
+
+    def _niche(self, niche: str) -> NicheTrends:
+        trends = self.niches.get(niche)
+        if trends is None:
+            trends = self.niches[niche] = NicheTrends(
+                self.capacity, self.width, self.depth, self.fast_half_life, self.slow_half_life
+            )
+            if len(self.niches) > self.max_niches:
+                self.niches.popitem(last=False)
+        self.niches.move_to_end(niche)
+        return trends
+
+    def observe(self, niche: str, terms: Iterable[str], at: Any = None):
+        self.observe_batch([(niche, terms, at)])
+
+    def observe_batch(self, events: Iterable[Tuple[str, Iterable[str], Any]]):
+        """Count (niche, terms, time) events, merging duplicates per niche and hour first."""
+        grouped: Dict[Tuple[str, float], Counter] = {}
+        for niche, terms, at in events:
+            at = to_timestamp(at)
+            # Events within the same hour decay alike, so they can be added together
+            bucket = (self.niche_key(niche), at - at % 3600)
+            grouped.setdefault(bucket, Counter()).update(term for term in terms if term)
+        with self._lock:
+            for (niche, at), counts in sorted(grouped.items(), key=lambda item: item[0][1]):
+                trends = self._niche(niche)
+                trends.recent.add(counts, at)
+                trends.baseline.add(counts, at)
+                trends.events += sum(counts.values())
+
+    def observe_posts(self, posts: Iterable[Dict[str, Any]]):
+        """Count each post's topic and hashtags under its niche at its publish time."""
+        self.observe_batch(
+            (post.get("niche"), post_terms(post), post.get("published_at"))
+            for post in posts
+        )
+
+    def has_data(self, niche: str) -> bool:
+        return self.niche_key(niche) in self.niches
+
+    def _rank(self, trends: NicheTrends, now: float) -> List[Dict[str, Any]]:
+        candidates = trends.recent.top(now)
+        baseline = trends.baseline.estimate([key for key, _, _ in candidates], now)
+        fast, slow = decay_rate(self.fast_half_life), decay_rate(self.slow_half_life)
+        ranked = []
+        for (key, count, error), base in zip(candidates, baseline):
+            # Guaranteed count excludes the error inherited on eviction
+            support = count - error
+            if support < self.min_support:
+                continue
+            # Decayed counts times their rate approximate events per second
+            lift = (support * fast + self.min_support * slow) / (base * slow + self.min_support * slow)
+            ranked.append({"topic": key, "lift": round(float(lift), 2), "recent_count": round(float(support), 1)})
+        ranked.sort(key=lambda item: item["lift"], reverse=True)
+        return ranked
+
+    def ranked(self, niche: str, now: Any = None) -> List[Dict[str, Any]]:
+        """All trending candidates for a niche, highest lift first.
+
+        Rankings are reused until the niche sees new posts or
+        ``refresh_seconds`` pass, so repeat reads cost a dict lookup.
+        """
+        now = to_timestamp(now)
+        with self._lock:
+            trends = self.niches.get(self.niche_key(niche))
+            if trends is None:
+                return []
+            cached = trends.ranked
+            if cached is not None and cached[0] == trends.events and abs(now - cached[1]) < self.refresh_seconds:
+                return cached[2]
+            ranked = self._rank(trends, now)
+            trends.ranked = (trends.events, now, ranked)
+            return ranked
+
+    def top(self, niche: str, k: int = 5, now: Any = None) -> List[Dict[str, Any]]:
+        return self.ranked(niche, now)[:k]
+
+    def trending_count(self, niche: str, min_lift: float = 1.5, now: Any = None) -> int:
+        return sum(1 for item in self.ranked(niche, now) if item["lift"] >= min_lift)
+
+    def memory_bytes(self) -> int:
+        per_niche = self.width * self.depth * 8 + self.capacity * 200
+        return per_niche * len(self.niches)
+
+    async def load_from_db(self, batch_size: int = 5000) -> int:
+        """Replay posts from the last four baseline half-lives; older ones would weigh nothing."""
+        cutoff = datetime.utcnow() - timedelta(seconds=4 * self.slow_half_life)
+        loaded = 0
+        async with async_session() as db:
+            result = await db.stream(
+                select(ContentPost.niche, ContentPost.topic, ContentPost.hashtags, ContentPost.published_at)
+                .where(ContentPost.published_at >= cutoff)
+                .order_by(ContentPost.published_at)
+                .execution_options(yield_per=batch_size)
+            )
+            async for rows in result.partitions(batch_size):
+                self.observe_posts(dict(row._mapping) for row in rows)
+                loaded += len(rows)
+        logger.info("Replayed %d posts into the trend detector", loaded)
+        return loaded
+
+trend_detector = TrendDetector()
@@ -1,22 +1,38 @@
 from datetime import datetime, timedelta
 from typing import Dict, Optional
 from fastapi import HTTPException
-from app.services.billing import PRICING_PLANS, SubscriptionTier
+from sqlalchemy import delete, func, insert, select
+from app.config import settings
+from app.database.models import UsageMonthly, UsageRecord
+from app.database.session import async_session, engine
+from app.services.billing import PRICING_PLANS, USAGE_LIMITS, SubscriptionTier
+from app.services.quota import create_quota_backend
+from app.services.usage_buffer import UsageBuffer, month_start
 
 class UsageService:
     def __init__(self):
-        self.limits = {
-            "free": {"api_calls": 10, "brands": 1, "calendar_generations": 2},
-            "starter": {"api_calls": 1000, "brands": 3, "calendar_generations": 50},
-            "professional": {"api_calls": 10000, "brands": 10, "calendar_generations": 500},
-            "agency": {"api_calls": 100000, "brands": 50, "calendar_generations": 5000}
-        }
-    
-    async def check_usage_limit(self, user_id: int, subscription_tier: str, feature: str):
-        current_usage = await self.get_monthly_usage(user_id, feature)
-        limit = self.limits[subscription_tier][feature]
-        
-        if current_usage >= limit:
+        self.limits = USAGE_LIMITS
+        self.buffer = UsageBuffer(
+            self._write_usage_rows,
+            max_pending=settings.USAGE_FLUSH_MAX_PENDING,
+            flush_interval=settings.USAGE_FLUSH_INTERVAL_SECONDS,
+        )
+        self.quota = create_quota_backend()
+    
+    async def check_usage_limit(self, user_id: int, subscription_tier: str, feature: str, limit: Optional[int] = None):
+        if limit is None:
+            limit = self.limits[subscription_tier][feature]
+        
+        # Seed the counter from the database the first time this process sees it
+        seed = None
+        if self.quota.needs_seed(user_id, feature):
+            seed = await self.get_monthly_usage(user_id, feature)
+        
+        # Check and increment in one atomic step so concurrent requests can't race past the limit
+        result = await self.quota.consume(user_id, feature, limit, seed=seed)
+        current_usage = result.current
+        
+        if not result.allowed:
             raise HTTPException(
                 status_code=402,
                 detail={
@@ -28,24 +44,135 @@ class UsageService:
                 }
             )
         
+        # Record the call for history and reporting
         await self.increment_usage(user_id, feature)
         return True
     
     async def get_monthly_usage(self, user_id: int, feature: str) -> int:
-        # Query database for current month usage
-        # This would be implemented with your actual database
-        return 0
+        period = month_start()
+        async with async_session() as session:
+            result = await session.execute(
+                select(UsageMonthly.count).where(
+                    UsageMonthly.user_id == user_id,
+                    UsageMonthly.feature == feature,
+                    UsageMonthly.period == period.date(),
+                )
+            )
+            stored = result.scalar_one_or_none() or 0
+        
+        # Include increments still waiting in the write-behind buffer
+        return stored + self.buffer.pending(user_id, feature, period)
+    
+    async def get_monthly_usage_raw(self, user_id: int) -> Dict[str, int]:
+        # Aggregate straight from usage_records, bypassing the rollup
+        async with async_session() as session:
+            result = await session.execute(
+                select(UsageRecord.feature, func.sum(UsageRecord.count))
+                .where(
+                    UsageRecord.user_id == user_id,
+                    UsageRecord.created_at >= month_start(),
+                )
+                .group_by(UsageRecord.feature)
+            )
+            return {feature: int(total) for feature, total in result.all()}
+    
+    async def increment_usage(self, user_id: int, feature: str, count: int = 1):
+        self.buffer.add(user_id, feature, count)
+    
+    async def _write_usage_rows(self, rows, committed):
+        rollup_rows = [
+            {
+                "user_id": row["user_id"],
+                "feature": row["feature"],
+                "period": month_start(row["created_at"]).date(),
+                "count": row["count"],
+            }
+            for row in rows
+        ]
+        
+        # Raw rows and rollup deltas commit together so the two never drift
+        async with async_session() as session:
+            await session.execute(insert(UsageRecord), rows)
+            await session.execute(self._rollup_upsert(), rollup_rows)
+            await session.commit()
+            # Before any other await, so readers never count these rows twice
+            committed()
     
-    async def increment_usage(self, user_id: int, feature: str):
-        # Increment usage counter in database
-        pass
+    def _rollup_upsert(self):
+        # Add each row's count to the existing monthly total
+        if engine.dialect.name == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+            stmt = sqlite_insert(UsageMonthly)
+            return stmt.on_conflict_do_update(
+                index_elements=["user_id", "feature", "period"],
+                set_={"count": UsageMonthly.count + stmt.excluded.count, "updated_at": func.now()},
+            )
+        
+        # MySQL / TiDB
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(UsageMonthly)
+        return stmt.on_duplicate_key_update(
+            count=UsageMonthly.count + stmt.inserted.count,
+            updated_at=func.now(),
+        )
+    
+    async def rebuild_monthly_rollup(self, period: Optional[datetime] = None) -> int:
+        """Recompute usage_monthly for one month from usage_records.
+
+        Compacted rows carry their day's total in ``count``, so they sum the
+        same as the raw rows they replaced. Months reaching back past the
+        retention window have lost rows and raise ``ValueError`` rather than
+        overwriting their totals with a partial sum.
+        """
+        period = month_start(period)
+        retained_from = datetime.utcnow() - timedelta(days=settings.USAGE_RETENTION_DAYS)
+        if period < retained_from:
+            raise ValueError(
+                f"Usage before {retained_from:%Y-%m-%d} is past retention; can't rebuild {period:%Y-%m}"
+            )
+        if period.month == 12:
+            period_end = period.replace(year=period.year + 1, month=1)
+        else:
+            period_end = period.replace(month=period.month + 1)
+        
+        async with async_session() as session:
+            result = await session.execute(
+                select(UsageRecord.user_id, UsageRecord.feature, func.sum(UsageRecord.count))
+                .where(
+                    UsageRecord.created_at >= period,
+                    UsageRecord.created_at < period_end,
+                )
+                .group_by(UsageRecord.user_id, UsageRecord.feature)
+            )
+            rows = [
+                {"user_id": user_id, "feature": feature, "period": period.date(), "count": int(total)}
+                for user_id, feature, total in result.all()
+            ]
+            
+            await session.execute(delete(UsageMonthly).where(UsageMonthly.period == period.date()))
+            if rows:
+                await session.execute(insert(UsageMonthly), rows)
+            await session.commit()
+        
+        return len(rows)
     
     async def get_usage_stats(self, user_id: int, subscription_tier: str) -> Dict:
         usage = {}
         limits = self.limits[subscription_tier]
+        period = month_start()
+        
+        # One query for every feature's current-month total
+        async with async_session() as session:
+            result = await session.execute(
+                select(UsageMonthly.feature, UsageMonthly.count).where(
+                    UsageMonthly.user_id == user_id,
+                    UsageMonthly.period == period.date(),
+                )
+            )
+            stored = dict(result.all())
         
         for feature, limit in limits.items():
-            current = await self.get_monthly_usage(user_id, feature)
+            current = stored.get(feature, 0) + self.buffer.pending(user_id, feature, period)
             usage[feature] = {
                 "current": current,
                 "limit": limit,
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (user_id, feature, period_start)
+BufferKey = Tuple[int, str, datetime]
+
+def month_start(moment: Optional[datetime] = None) -> datetime:
+    moment = moment or datetime.utcnow()
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+class UsageBuffer:
+    """Write-behind accumulator for usage increments.
+
+    Increments are summed per (user_id, feature, month) in memory and handed
+    to ``flush_handler`` as one row per key, either when ``max_pending`` keys
+    have accumulated or every ``flush_interval`` seconds. Counts stay visible
+    through ``pending()`` until the flush that carries them has committed:
+    the handler calls the ``committed`` callback it is given right after its
+    commit, with no await in between, so readers never see a count both in
+    the database and in the buffer.
+
+    A failed flush puts its rows back and further flushes back off
+    exponentially, up to ``max_backoff`` seconds, until one succeeds;
+    ``stop`` makes a last attempt regardless.
+    """
+
+    def __init__(
+        self,
+        flush_handler: Callable[[List[dict], Callable[[], None]], Awaitable[None]],
+        max_pending: int = 500,
+        flush_interval: float = 5.0,
+        max_backoff: float = 300.0,
+    ):
+        self.flush_handler = flush_handler
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._failures = 0
+        self._retry_at = 0.0
+        self._pending: Dict[BufferKey, int] = {}
+        self._first_seen: Dict[BufferKey, datetime] = {}
+        self._in_flight: Dict[BufferKey, int] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._timer_task: Optional[asyncio.Task] = None
+
+    def add(self, user_id: int, feature: str, count: int = 1):
+        now = datetime.utcnow()
+        key = (user_id, feature, month_start(now))
+        self._pending[key] = self._pending.get(key, 0) + count
+        self._first_seen.setdefault(key, now)
+
+        if len(self._pending) >= self.max_pending:
+            self._schedule_flush()
+
+    def pending(self, user_id: int, feature: str, period: Optional[datetime] = None) -> int:
+        key = (user_id, feature, period or month_start())
+        return self._pending.get(key, 0) + self._in_flight.get(key, 0)
+
+    async def flush(self, force: bool = False) -> int:
+        async with self._flush_lock:
+            if not self._pending or (not force and time.monotonic() < self._retry_at):
+                return 0
+
+            batch, first_seen = self._pending, self._first_seen
+            self._pending, self._first_seen = {}, {}
+            self._in_flight = batch
+
+            rows = [
+                {
+                    "user_id": user_id,
+                    "feature": feature,
+                    "count": count,
+                    "created_at": first_seen[(user_id, feature, period)],
+                }
+                for (user_id, feature, period), count in batch.items()
+            ]
+
+            committed = False
+
+            def on_commit():
+                nonlocal committed
+                committed = True
+                self._in_flight = {}
+
+            try:
+                await self.flush_handler(rows, on_commit)
+            except Exception:
+                self._in_flight = {}
+                if committed:
+                    # The rows are stored; re-queueing them would count them twice
+                    logger.exception("Usage flush failed after committing %d rows", len(rows))
+                    return len(rows)
+                self._failures += 1
+                delay = min(self.max_backoff, self.flush_interval * 2 ** (self._failures - 1))
+                self._retry_at = time.monotonic() + delay
+                logger.exception("Usage flush failed, re-queueing %d rows and retrying in %.0fs", len(rows), delay)
+                for key, count in batch.items():
+                    self._pending[key] = self._pending.get(key, 0) + count
+                    self._first_seen.setdefault(key, first_seen[key])
+                return 0
+
+            self._in_flight = {}
+            self._failures, self._retry_at = 0, 0.0
+            return len(rows)
+
+    def _schedule_flush(self):
+        if self._flush_task and not self._flush_task.done():
+            return
+        if time.monotonic() < self._retry_at:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._flush_task = loop.create_task(self.flush())
+
+    async def _run_timer(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        if self._timer_task is None:
+            self._timer_task = asyncio.create_task(self._run_timer())
+
+    async def stop(self):
+        if self._timer_task is not None:
+            self._timer_task.cancel()
+            try:
+                await self._timer_task
+            except asyncio.CancelledError:
+                pass
+            self._timer_task = None
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush(force=True)
@@ -0,0 +1,319 @@
+import asyncio
+import logging
+import uuid
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import bindparam, delete, func, insert, or_, select, text, update
+from sqlalchemy.exc import IntegrityError
+from app.config import settings
+from app.database.models import MaintenanceLease, UsageRecord
+from app.database.session import async_session, engine
+from app.services.usage_buffer import month_start
+
+logger = logging.getLogger(__name__)
+
+def _next_month(period: datetime) -> datetime:
+    if period.month == 12:
+        return period.replace(year=period.year + 1, month=1)
+    return period.replace(month=period.month + 1)
+
+def _as_date(value) -> date:
+    # SQLite's DATE() returns text, MySQL/TiDB return a date
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+class UsageMaintenance:
+    """Keeps usage_records small.
+
+    * compaction folds raw rows older than ``compact_after_days`` into one
+      row per (user, feature, day), carrying the total in ``count``
+    * retention deletes raw rows older than ``retention_days``
+    * on MySQL/TiDB the table is range-partitioned by month, so retention
+      drops whole partitions and current-month queries prune to one partition.
+      TiDB can't drop a clustered primary key to add created_at to it, so
+      such a table stays unpartitioned and retention deletes rows instead
+
+    Every worker starts the loop, but only the holder of the
+    ``usage_maintenance`` row in maintenance_leases runs a pass, so the DDL
+    and compaction run in one process at a time. The row also stores how
+    far compaction has got, so a restart or a new leader resumes there.
+
+    Monthly totals live in usage_monthly, so none of this changes what
+    limit checks or usage stats report.
+    """
+
+    LEASE = "usage_maintenance"
+
+    def __init__(
+        self,
+        retention_days: int = 395,
+        compact_after_days: int = 7,
+        interval_hours: float = 6,
+        partitions_ahead: int = 2,
+    ):
+        self.retention_days = retention_days
+        self.compact_after_days = compact_after_days
+        self.interval_hours = interval_hours
+        self.partitions_ahead = partitions_ahead
+        self.holder = uuid.uuid4().hex
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def partitioned(self) -> bool:
+        return engine.dialect.name == "mysql"
+
+    async def acquire_lease(self) -> bool:
+        """Take or renew the maintenance lease; False while another live process holds it."""
+        now = datetime.utcnow()
+        expires_at = now + timedelta(hours=self.interval_hours * 2)
+        async with async_session() as session:
+            result = await session.execute(
+                update(MaintenanceLease)
+                .where(
+                    MaintenanceLease.name == self.LEASE,
+                    or_(
+                        MaintenanceLease.holder == self.holder,
+                        MaintenanceLease.holder.is_(None),
+                        MaintenanceLease.expires_at < now,
+                    ),
+                )
+                .values(holder=self.holder, expires_at=expires_at)
+            )
+            if result.rowcount == 0:
+                session.add(MaintenanceLease(name=self.LEASE, holder=self.holder, expires_at=expires_at))
+                try:
+                    await session.commit()
+                except IntegrityError:
+                    # The row exists and someone else holds it
+                    return False
+            else:
+                await session.commit()
+        return True
+
+    async def release_lease(self):
+        async with async_session() as session:
+            await session.execute(
+                update(MaintenanceLease)
+                .where(MaintenanceLease.name == self.LEASE, MaintenanceLease.holder == self.holder)
+                .values(holder=None, expires_at=None)
+            )
+            await session.commit()
+
+    async def compact(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> int:
+        now = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        until = until or now - timedelta(days=self.compact_after_days)
+
+        day = func.date(UsageRecord.created_at)
+        async with async_session() as session:
+            if since is None:
+                since = await session.scalar(
+                    select(MaintenanceLease.watermark).where(MaintenanceLease.name == self.LEASE)
+                ) or now - timedelta(days=self.retention_days)
+            if since >= until:
+                return 0
+
+            result = await session.execute(
+                select(
+                    UsageRecord.user_id,
+                    UsageRecord.feature,
+                    day,
+                    func.sum(UsageRecord.count),
+                    func.count(UsageRecord.id),
+                )
+                .where(UsageRecord.created_at >= since, UsageRecord.created_at < until)
+                .group_by(UsageRecord.user_id, UsageRecord.feature, day)
+                .having(func.count(UsageRecord.id) > 1)
+            )
+            groups = result.all()
+
+            if groups:
+                deletes: List[dict] = []
+                rows: List[dict] = []
+                for user_id, feature, group_day, total, row_count in groups:
+                    start = datetime.combine(_as_date(group_day), datetime.min.time())
+                    deletes.append({
+                        "b_user_id": user_id,
+                        "b_feature": feature,
+                        "b_start": start,
+                        "b_end": start + timedelta(days=1),
+                    })
+                    rows.append({
+                        "user_id": user_id,
+                        "feature": feature,
+                        "count": int(total),
+                        "extra_metadata": {"compacted_rows": int(row_count)},
+                        "created_at": start,
+                    })
+
+                # Deleting by (user, feature, day range) keeps these on idx_user_feature_date
+                records = UsageRecord.__table__
+                await session.execute(
+                    delete(records).where(
+                        records.c.user_id == bindparam("b_user_id"),
+                        records.c.feature == bindparam("b_feature"),
+                        records.c.created_at >= bindparam("b_start"),
+                        records.c.created_at < bindparam("b_end"),
+                    ),
+                    deletes,
+                )
+                await session.execute(insert(UsageRecord), rows)
+
+            # Moves with the compaction it records, in the same transaction
+            await session.execute(
+                update(MaintenanceLease).where(MaintenanceLease.name == self.LEASE).values(watermark=until)
+            )
+            await session.commit()
+        return len(groups)
+
+    async def enforce_retention(self) -> int:
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+
+        if self.partitioned:
+            dropped = await self._drop_expired_partitions(cutoff)
+            if dropped is not None:
+                return dropped
+
+        async with async_session() as session:
+            result = await session.execute(
+                delete(UsageRecord).where(UsageRecord.created_at < cutoff)
+            )
+            await session.commit()
+            return result.rowcount or 0
+
+    async def ensure_partitions(self):
+        if not self.partitioned:
+            return
+
+        async with engine.begin() as conn:
+            existing = await self._partition_bounds(conn)
+            current = month_start()
+
+            if not existing:
+                if not await self._partition_table(conn, current):
+                    return
+                existing = await self._partition_bounds(conn)
+
+            # Split the catch-all partition so upcoming months each get their own
+            upper = max(existing)
+            target = current
+            for _ in range(self.partitions_ahead + 1):
+                target = _next_month(target)
+            while upper < target:
+                await conn.execute(text(
+                    "ALTER TABLE usage_records REORGANIZE PARTITION pmax INTO ("
+                    f"{self._partition_clause(upper)}, "
+                    "PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+                ))
+                upper = _next_month(upper)
+
+    async def _partition_table(self, conn, current: datetime) -> bool:
+        # Partitioned tables can't carry foreign keys, and every unique key
+        # must include the partitioning column
+        if "tidb" in (await conn.scalar(text("SELECT VERSION()")) or "").lower():
+            pk_type = await conn.scalar(text(
+                "SELECT TIDB_PK_TYPE FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'usage_records'"
+            ))
+            if pk_type == "CLUSTERED":
+                logger.warning(
+                    "usage_records has a clustered primary key, which TiDB can't rebuild to include "
+                    "created_at; leaving it unpartitioned, retention will delete rows"
+                )
+                return False
+
+        result = await conn.execute(text(
+            "SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS "
+            "WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = 'usage_records'"
+        ))
+        for (constraint,) in result.all():
+            await conn.execute(text(f"ALTER TABLE usage_records DROP FOREIGN KEY `{constraint}`"))
+
+        await conn.execute(text(
+            "ALTER TABLE usage_records MODIFY created_at DATETIME NOT NULL, "
+            "DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)"
+        ))
+
+        # Older rows all land in one partition that retention drops once it ages out
+        await conn.execute(text(
+            "ALTER TABLE usage_records PARTITION BY RANGE COLUMNS(created_at) ("
+            f"{self._partition_clause(current)}, "
+            f"{self._partition_clause(_next_month(current))}, "
+            "PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+        ))
+        return True
+
+    async def _partition_bounds(self, conn) -> List[datetime]:
+        # Upper bounds of the monthly partitions, excluding pmax
+        result = await conn.execute(text(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'usage_records' "
+            "AND PARTITION_NAME IS NOT NULL AND PARTITION_NAME <> 'pmax'"
+        ))
+        bounds = []
+        for (name,) in result.all():
+            period = datetime.strptime(name[1:], "%Y%m")
+            bounds.append(_next_month(period))
+        return bounds
+
+    async def _drop_expired_partitions(self, cutoff: datetime) -> Optional[int]:
+        """Partitions dropped, or None if the table isn't partitioned."""
+        async with engine.begin() as conn:
+            bounds = await self._partition_bounds(conn)
+            if not bounds:
+                return None
+            dropped = 0
+            for upper in sorted(bounds):
+                # A partition can go once everything in it is past retention
+                if upper <= cutoff:
+                    period = month_start(upper - timedelta(days=1))
+                    await conn.execute(text(f"ALTER TABLE usage_records DROP PARTITION p{period:%Y%m}"))
+                    dropped += 1
+            return dropped
+
+    def _partition_clause(self, period: datetime) -> str:
+        # Partition pYYYYMM holds rows created before the following month
+        return f"PARTITION p{period:%Y%m} VALUES LESS THAN ('{_next_month(period):%Y-%m-%d}')"
+
+    async def run_once(self):
+        if not await self.acquire_lease():
+            logger.debug("Usage maintenance is running in another process")
+            return
+        await self.ensure_partitions()
+        compacted = await self.compact()
+        removed = await self.enforce_retention()
+        logger.info("Usage maintenance: compacted %d groups, retention removed %d", compacted, removed)
+
+    async def _run_forever(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Usage maintenance run failed")
+            await asyncio.sleep(self.interval_hours * 3600)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            # Let another worker take over without waiting for the lease to expire
+            try:
+                await self.release_lease()
+            except Exception:
+                logger.exception("Could not release the usage maintenance lease")
+
+usage_maintenance = UsageMaintenance(
+    retention_days=settings.USAGE_RETENTION_DAYS,
+    compact_after_days=settings.USAGE_COMPACT_AFTER_DAYS,
+    interval_hours=settings.USAGE_MAINTENANCE_INTERVAL_HOURS,
+)
@@ -0,0 +1,172 @@
+from typing import List, Optional, Tuple
+import numpy as np
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    # Indices of the k best scores along the last axis, best first
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.take_along_axis(scores, part, axis=-1).argsort(axis=-1)[..., ::-1]
+    return np.take_along_axis(part, order, axis=-1)
+
+class IVFIndex:
+    """In-process inverted-file ANN index over unit vectors (cosine similarity).
+
+    Vectors live in one contiguous float32 matrix that grows by doubling.
+    Below ``train_threshold`` vectors, search is an exact matrix product.
+    Above it, k-means centroids partition the matrix into ``nlist`` lists
+    and a query only scores the members of its ``nprobe`` nearest lists.
+    The index retrains itself once it has grown ``retrain_factor`` times
+    past the size it was last trained on.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        train_threshold: int = 20000,
+        retrain_factor: float = 4.0,
+        seed: int = 0,
+    ):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.retrain_factor = retrain_factor
+        self._rng = np.random.default_rng(seed)
+        self._vectors = np.empty((1024, dim), dtype=np.float32)
+        self._ids = np.empty(1024, dtype=np.int64)
+        self._size = 0
+        self.centroids: Optional[np.ndarray] = None
+        self._assignments = np.empty(1024, dtype=np.int32)
+        self._lists: List[np.ndarray] = []
+        self._lists_dirty = False
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[: self._size]
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[: self._size]
+
+    def _reserve(self, extra: int):
+        needed = self._size + extra
+        capacity = self._vectors.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("_vectors", "_ids", "_assignments"):
+            old = getattr(self, name)
+            grown = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            grown[: self._size] = old[: self._size]
+            setattr(self, name, grown)
+
+    def add(self, vectors: np.ndarray, ids=None):
+        # ids default to row positions, so index.vectors[id] is the stored vector
+        vectors = normalize_rows(vectors)
+        count = vectors.shape[0]
+        if ids is None:
+            ids = np.arange(self._size, self._size + count, dtype=np.int64)
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        self._reserve(count)
+        start, end = self._size, self._size + count
+        self._vectors[start:end] = vectors
+        self._ids[start:end] = ids
+        self._size = end
+
+        if self.centroids is not None:
+            self._assignments[start:end] = self._assign(vectors)
+            self._lists_dirty = True
+
+        if self._size >= self.train_threshold and (
+            self.centroids is None or self._size >= self._trained_size * self.retrain_factor
+        ):
+            self.train()
+
+    def train(self, iterations: int = 10, sample_size: int = 100000):
+        if self._size == 0:
+            return
+        nlist = self.nlist or max(1, int(np.sqrt(self._size)))
+        nlist = min(nlist, self._size)
+        data = self.vectors
+        if self._size > sample_size:
+            data = data[self._rng.choice(self._size, sample_size, replace=False)]
+
+        # Spherical k-means: batched similarity against all centroids per iteration
+        centroids = data[self._rng.choice(data.shape[0], nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, data)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            sums[empty] = data[self._rng.choice(data.shape[0], int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        self.centroids = centroids
+        self._assignments[: self._size] = self._assign(self.vectors)
+        self._lists_dirty = True
+        self._trained_size = self._size
+
+    def _assign(self, vectors: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        out = np.empty(vectors.shape[0], dtype=np.int32)
+        for start in range(0, vectors.shape[0], chunk):
+            out[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ self.centroids.T, axis=1)
+        return out
+
+    def _rebuild_lists(self):
+        # CSR-style lists: row positions grouped by centroid
+        assignments = self._assignments[: self._size]
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(self.centroids.shape[0] + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(self.centroids.shape[0])]
+        self._lists_dirty = False
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        ids, scores = self.search_batch(query[None, :] if query.ndim == 1 else query, k, nprobe)
+        return ids[0], scores[0]
+
+    def search_batch(self, queries: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, scores) of shape (len(queries), k'), where k' <= k."""
+        queries = normalize_rows(queries)
+        if self._size == 0:
+            empty = np.empty((queries.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+
+        if self.centroids is None:
+            scores = queries @ self.vectors.T
+            best = top_k(scores, k)
+            return self._ids[best], np.take_along_axis(scores, best, axis=1)
+
+        if self._lists_dirty:
+            self._rebuild_lists()
+        nprobe = min(nprobe or self.nprobe, self.centroids.shape[0])
+        probes = top_k(queries @ self.centroids.T, nprobe)
+
+        k = min(k, self._size)
+        out_ids = np.full((queries.shape[0], k), -1, dtype=np.int64)
+        out_scores = np.full((queries.shape[0], k), -np.inf, dtype=np.float32)
+        for row, lists in enumerate(probes):
+            candidates = np.concatenate([self._lists[i] for i in lists])
+            if candidates.size == 0:
+                continue
+            scores = self._vectors[candidates] @ queries[row]
+            best = top_k(scores, k)
+            out_ids[row, : best.size] = self._ids[candidates[best]]
+            out_scores[row, : best.size] = scores[best]
+        return out_ids, out_scores
@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Events are spread over a fixed number of shards by Stripe customer, and
+# each worker owns a subset of shards, so one customer's events are always
+# applied in order by a single worker
+SHARDS = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_events (
+    event_id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    shard INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    received_at REAL NOT NULL,
+    claimed_at REAL,
+    finished_at REAL,
+    last_error TEXT,
+    next_attempt_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_webhook_events_status ON webhook_events (status, shard, received_at);
+"""
+
+# Handlers return {event_id: error} for the events they couldn't apply; an
+# exception fails the whole batch
+BatchHandler = Callable[[List[Dict[str, Any]]], Awaitable[Optional[Dict[str, str]]]]
+
+class WebhookQueue:
+    """Durable local queue for verified Stripe events.
+
+    Events are appended to a SQLite database in WAL mode and acknowledged
+    once the insert is on disk. ``event_id`` is the primary key, so Stripe
+    retries of an event that is already queued or processed are dropped at
+    insert time. A pool of workers claims pending events in batches and
+    hands each batch to ``handler``, which reports the events it couldn't
+    apply. Those, or the whole batch if the handler raises, go back to
+    pending with an exponential backoff from ``retry_delay`` until
+    ``max_attempts`` is reached, after which they are parked as failed
+    for ``failed_events`` and ``replay``. A shard doesn't move past an
+    event waiting to be retried, so one customer's events still apply in
+    order.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 50,
+        max_attempts: int = 5,
+        poll_interval: float = 1.0,
+        claim_timeout: float = 300.0,
+        retention_days: float = 7.0,
+        retry_delay: float = 30.0,
+        max_retry_delay: float = 3600.0,
+    ):
+        self.path = path
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        self.retention_days = retention_days
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self.stats = {"enqueued": 0, "duplicates": 0, "processed": 0, "failed_events": 0, "failed_batches": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Acknowledged events must survive a power loss
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(webhook_events)")}
+            if "next_attempt_at" not in columns:
+                # Queues created before retries were backed off
+                conn.execute("ALTER TABLE webhook_events ADD COLUMN next_attempt_at REAL")
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn: Callable, *args):
+        def locked():
+            with self._lock:
+                return fn(self._connect(), *args)
+        return await asyncio.to_thread(locked)
+
+    async def enqueue(self, event: Dict[str, Any]) -> bool:
+        def insert(conn, event_id, event_type, shard, payload):
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO webhook_events (event_id, type, shard, payload, received_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (event_id, event_type, shard, payload, time.time()),
+            )
+            return cursor.rowcount == 1
+
+        obj = event.get("data", {}).get("object", {})
+        shard_key = obj.get("customer") or event["id"]
+        shard = zlib.crc32(str(shard_key).encode()) % SHARDS
+        inserted = await self._run(insert, event["id"], event["type"], shard, json.dumps(event))
+        if inserted:
+            self.stats["enqueued"] += 1
+            if self._wakeup is not None:
+                self._wakeup.set()
+        else:
+            self.stats["duplicates"] += 1
+        return inserted
+
+    async def _claim(self, worker: int, workers: int) -> List[Dict[str, Any]]:
+        def claim(conn, batch_size, claim_timeout):
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Reclaim batches left behind by a worker that died mid-flight
+                conn.execute(
+                    "UPDATE webhook_events SET status = 'pending' WHERE status = 'processing' AND claimed_at < ?",
+                    (now - claim_timeout,),
+                )
+                # Stop at a shard's first in-flight or backing-off event so later events can't overtake it
+                rows = conn.execute(
+                    "SELECT event_id, payload FROM webhook_events e WHERE status = 'pending' "
+                    "AND shard % ? = ? AND COALESCE(next_attempt_at, 0) <= ? AND NOT EXISTS ("
+                    "  SELECT 1 FROM webhook_events p WHERE p.shard = e.shard AND (p.status = 'processing' "
+                    "  OR (p.status = 'pending' AND p.next_attempt_at > ? AND p.received_at <= e.received_at))"
+                    ") ORDER BY received_at LIMIT ?",
+                    (workers, worker, now, now, batch_size),
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE webhook_events SET status = 'processing', claimed_at = ?, attempts = attempts + 1 "
+                    "WHERE event_id = ?",
+                    [(now, event_id) for event_id, _ in rows],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            return [json.loads(payload) for _, payload in rows]
+
+        return await self._run(claim, self.batch_size, self.claim_timeout)
+
+    async def _finish(self, done: Sequence[str], errors: Dict[str, str]):
+        def finish(conn, done, errors, max_attempts, retry_delay, max_retry_delay):
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "UPDATE webhook_events SET status = 'done', finished_at = ?, last_error = NULL, "
+                    "next_attempt_at = NULL WHERE event_id = ?",
+                    [(now, event_id) for event_id in done],
+                )
+                # attempts was bumped at claim time, so the first retry waits retry_delay
+                conn.executemany(
+                    "UPDATE webhook_events SET "
+                    "status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                    "finished_at = CASE WHEN attempts >= ? THEN ? END, "
+                    "next_attempt_at = ? + MIN(? * (1 << (attempts - 1)), ?), "
+                    "last_error = ? WHERE event_id = ?",
+                    [
+                        (max_attempts, max_attempts, now, now, retry_delay, max_retry_delay, error, event_id)
+                        for event_id, error in errors.items()
+                    ],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        await self._run(finish, list(done), dict(errors), self.max_attempts, self.retry_delay, self.max_retry_delay)
+
+    async def failed_events(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Events parked after ``max_attempts``, newest first."""
+        def failed(conn, limit):
+            rows = conn.execute(
+                "SELECT event_id, type, attempts, received_at, finished_at, last_error FROM webhook_events "
+                "WHERE status = 'failed' ORDER BY received_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+            columns = ("event_id", "type", "attempts", "received_at", "finished_at", "last_error")
+            return [dict(zip(columns, row)) for row in rows]
+
+        return await self._run(failed, limit)
+
+    async def replay(self, event_ids: Optional[Sequence[str]] = None) -> int:
+        """Queue failed events again with fresh attempts; all of them if no ids are given."""
+        def replay(conn, event_ids):
+            reset = (
+                "UPDATE webhook_events SET status = 'pending', attempts = 0, next_attempt_at = NULL, "
+                "finished_at = NULL WHERE status = 'failed'"
+            )
+            if event_ids is None:
+                return conn.execute(reset).rowcount
+            return sum(conn.execute(reset + " AND event_id = ?", (event_id,)).rowcount for event_id in event_ids)
+
+        replayed = await self._run(replay, None if event_ids is None else list(event_ids))
+        if replayed and self._wakeup is not None:
+            self._wakeup.set()
+        return replayed
+
+    async def purge(self) -> int:
+        def purge(conn, cutoff):
+            # Done rows are kept for a while so late Stripe retries still dedupe
+            return conn.execute(
+                "DELETE FROM webhook_events WHERE status = 'done' AND finished_at < ?", (cutoff,)
+            ).rowcount
+
+        return await self._run(purge, time.time() - self.retention_days * 86400)
+
+    async def counts(self) -> Dict[str, int]:
+        def counts(conn):
+            return dict(conn.execute("SELECT status, COUNT(*) FROM webhook_events GROUP BY status").fetchall())
+
+        return await self._run(counts)
+
+    async def _work(self, handler: BatchHandler, worker: int, workers: int):
+        while True:
+            events = await self._claim(worker, workers)
+            if not events:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            event_ids = [event["id"] for event in events]
+            try:
+                errors = await handler(events) or {}
+            except Exception as e:
+                logger.exception("Webhook batch of %d events failed", len(events))
+                self.stats["failed_batches"] += 1
+                errors = {event_id: repr(e) for event_id in event_ids}
+            for event_id, error in errors.items():
+                logger.warning("Webhook event %s failed: %s", event_id, error)
+            self.stats["failed_events"] += len(errors)
+            self.stats["processed"] += len(event_ids) - len(errors)
+            await self._finish([event_id for event_id in event_ids if event_id not in errors], errors)
+
+    async def start(self, handler: BatchHandler, workers: int = 2):
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        await self.purge()
+        workers = max(1, min(workers, SHARDS))
+        self._workers = [asyncio.create_task(self._work(handler, i, workers)) for i in range(workers)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
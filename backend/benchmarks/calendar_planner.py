@@ -0,0 +1,48 @@
+"""
+Plan a year of posts for many brands and re-plan single days.
+
+    cd backend && python -m benchmarks.calendar_planner --brands 36 --days 365
+
+Uses the default topic catalog, so no database or embeddings are needed.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.calendar_planner import plan_calendar
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--brands", type=int, default=36)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--posts-per-day", type=int, default=1)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    plans = [
+        plan_calendar(f"Niche {i}", args.days, posts_per_day=args.posts_per_day)
+        for i in range(args.brands)
+    ]
+    elapsed = time.perf_counter() - started
+    print(f"planned {args.brands} brands x {args.days} days in {elapsed * 1000:.0f} ms "
+          f"({elapsed / args.brands * 1000:.1f} ms per brand)")
+
+    plan = plans[0]
+    relaxed = sum(len(p.relaxed_days) for p in plans)
+    print(f"total predicted engagement (brand 0): {plan.total_score:.3f}, relaxed days across brands: {relaxed}")
+
+    timings = []
+    for day in range(0, args.days, 7):
+        banned = [topic for topic, _ in plan.assignments[day]]
+        started = time.perf_counter()
+        plan.replan_day(day, banned_topics=[plan.topics[t].topic for t in banned])
+        timings.append(time.perf_counter() - started)
+    print(f"replan_day: median {statistics.median(timings) * 1e6:.0f} us over {len(timings)} days")
+
+if __name__ == "__main__":
+    main()
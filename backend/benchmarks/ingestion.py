@@ -0,0 +1,68 @@
+"""
+Push synthetic posts through the ingestion pipeline into a scratch SQLite file.
+
+    cd backend && python -m benchmarks.ingestion --posts 200000
+
+Every tenth post repeats an earlier one, to exercise deduplication. Peak
+RSS should stay flat as --posts grows, since stages only hold their queues.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.database.models import Base
+from app.services.ingestion import IngestionPipeline, NDJSONFileSource
+
+WORDS = "kubernetes cloud security cost devops pipeline observability latency api release incident scale".split()
+
+def write_posts(path: str, count: int):
+    random.seed(0)
+    with open(path, "w") as f:
+        for i in range(count):
+            n = i - random.randrange(1, i) if i > 1 and i % 10 == 0 else i
+            text = " ".join(random.Random(n).choices(WORDS, k=30)) + f" #{WORDS[n % len(WORDS)]} {n}"
+            f.write(json.dumps({
+                "id": n, "text": text, "author": f"competitor{n % 50}", "platform": "linkedin",
+                "impressions": 1000 + n % 5000, "likes": n % 97, "comments": n % 13,
+                "created_at": 1760000000 + n * 30,
+            }) + "\n")
+
+async def run(path: str, db_path: str, args):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    pipeline = IngestionPipeline(
+        session_factory=async_sessionmaker(engine, expire_on_commit=False),
+        batch_size=args.batch_size,
+        insert_chunk=args.insert_chunk,
+    )
+    stats = await pipeline.run(NDJSONFileSource(path), {"niche": "DevOps"})
+    await engine.dispose()
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--insert-chunk", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        path = os.path.join(scratch, "posts.ndjson")
+        write_posts(path, args.posts)
+        stats = asyncio.run(run(path, os.path.join(scratch, "ingest.db"), args))
+    print(json.dumps(stats, indent=2))
+    print(f"{stats['posts_per_second'] * 86400 / 1e6:.1f}M posts/day sustained, "
+          f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+if __name__ == "__main__":
+    main()
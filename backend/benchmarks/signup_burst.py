@@ -0,0 +1,115 @@
+"""
+Signup burst against the local Stripe stub: inline vs deferred customer creation.
+
+    cd backend && python -m benchmarks.signup_burst --signups 500 --latency-ms 150
+
+Starts tools/stripe_stub.py in-process, points the billing client at it and
+uses a throwaway SQLite database. Password hashing is left out so the numbers
+isolate the Stripe call on the signup path.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--signups", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--port", type=int, default=12111)
+    return parser.parse_args()
+
+args = parse_args()
+workdir = tempfile.mkdtemp(prefix="signup-bench-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite+aiosqlite:///{workdir}/bench.db",
+    "WEBHOOK_QUEUE_PATH": f"{workdir}/webhooks.db",
+    "REDIS_URL": "",
+    "STRIPE_API_BASE": f"http://127.0.0.1:{args.port}",
+    "STRIPE_STUB_LATENCY_MS": str(args.latency_ms),
+    "STRIPE_STUB_FAILURE_RATE": str(args.failure_rate),
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uvicorn
+from app.database.session import init_models
+from app.services.auth import auth_service
+from app.services.billing import billing_service, customer_provisioner
+from tools import stripe_stub
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def report(label, latencies, elapsed):
+    print(
+        f"{label:<10} signups/s={len(latencies) / elapsed:8.1f}  "
+        f"p50={percentile(latencies, 50) * 1000:7.1f}ms  "
+        f"p99={percentile(latencies, 99) * 1000:7.1f}ms  "
+        f"mean={statistics.mean(latencies) * 1000:7.1f}ms"
+    )
+
+async def burst(label, signup):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await signup(f"{label}-{i}@bench.test", f"User {i}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.signups)))
+    return latencies, time.perf_counter() - started
+
+async def inline_signup(email, name):
+    user = await auth_service.create_user(email, "x", name)
+    await billing_service.create_customer(user.id, email, name)
+    return user
+
+async def deferred_signup(email, name):
+    user = await auth_service.create_user(email, "x", name)
+    customer_provisioner.submit(user.id, email, name)
+    return user
+
+async def main():
+    server = uvicorn.Server(uvicorn.Config(stripe_stub.app, port=args.port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    await init_models()
+    print(f"{args.signups} signups, concurrency {args.concurrency}, "
+          f"stub latency {args.latency_ms:.0f}ms, failure rate {args.failure_rate:.0%}")
+
+    latencies, elapsed = await burst("inline", inline_signup)
+    report("inline", latencies, elapsed)
+
+    await customer_provisioner.start()
+    latencies, elapsed = await burst("deferred", deferred_signup)
+    report("deferred", latencies, elapsed)
+
+    started = time.perf_counter()
+    await customer_provisioner.drain()
+    drained = elapsed + time.perf_counter() - started
+    snapshot = customer_provisioner.snapshot()
+    print(
+        f"{'':<10} all customers provisioned after {drained:.2f}s "
+        f"({snapshot['provisioned']} ok, {snapshot['failed']} failed, {snapshot['retries']} retries, "
+        f"submit-to-saved p50={snapshot['latency']['p50_ms']:.0f}ms p95={snapshot['latency']['p95_ms']:.0f}ms)"
+    )
+
+    await customer_provisioner.stop()
+    await billing_service.client.close()
+    server.should_exit = True
+    await server_task
+
+if __name__ == "__main__":
+    asyncio.run(main())
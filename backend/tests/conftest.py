@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+
+# Settings are read at import time, so point everything at a scratch directory first
+SCRATCH = tempfile.mkdtemp(prefix="contentr-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{SCRATCH}/test.db"
+os.environ["REDIS_URL"] = ""
+os.environ["EMBEDDING_STORE_PATH"] = os.path.join(SCRATCH, "embeddings")
+os.environ["TEXT_INDEX_PATH"] = os.path.join(SCRATCH, "text_index")
+os.environ["WEBHOOK_QUEUE_PATH"] = os.path.join(SCRATCH, "webhook_queue.db")
+
+import pytest
+from app.database.models import Base
+from app.database.session import engine, init_models
+from app.services.auth import auth_service
+from app.services.entitlements import entitlement_versions
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def db():
+    """A fresh schema on the SQLite test engine, dropped afterwards."""
+    await init_models()
+    yield engine
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    # Ids restart with the schema, so nothing cached by user id may outlive it
+    auth_service.user_cache.clear()
+    entitlement_versions._cache.clear()
+    # Pooled connections belong to this test's event loop
+    await engine.dispose()
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(SCRATCH, ignore_errors=True)
@@ -0,0 +1,84 @@
+from collections import Counter
+from datetime import date, timedelta
+import pytest
+from app.services.calendar_planner import PLATFORMS, create_plan, plan_calendar
+
+START = date(2026, 11, 2)
+
+GAPS = [
+    {"topic": topic, "avg_engagement": 0.04 + 0.002 * i, "opportunity_score": 0.6, "suggested_angle": "checklist"}
+    for i, topic in enumerate([
+        "Kubernetes cost optimization for platform teams",
+        "Kubernetes cost optimization for platform teams in 2026",
+        "Zero trust networking basics",
+        "Incident postmortems that stick",
+        "Terraform module versioning",
+        "Observability budgets",
+        "CI pipeline caching",
+        "Secrets rotation at scale",
+    ])
+]
+
+def entries_by_day(plan):
+    return [plan.day_entries(day) for day in range(plan.days)]
+
+@pytest.fixture(scope="module")
+def month():
+    return plan_calendar("DevOps", 28, GAPS, START)
+
+def test_weekly_platform_caps_hold(month):
+    assert not month.relaxed_days
+    for week in range(4):
+        platforms = Counter(entry["platform"] for day in entries_by_day(month)[week * 7:week * 7 + 7] for entry in day)
+        for name, config in PLATFORMS.items():
+            assert platforms[name] <= config["weekly_cap"]
+
+def test_weekly_content_mix_is_apportioned(month):
+    for week in range(4):
+        types = Counter(entry["content_type"] for day in entries_by_day(month)[week * 7:week * 7 + 7] for entry in day)
+        expected = dict(zip(month.content_types, month.type_cap[week].tolist()))
+        assert types == expected
+        # 60/20/20 of seven posts, the remainder rotating between weeks
+        assert expected["educational"] >= 4 and sum(expected.values()) == 7
+
+def test_topics_and_near_duplicates_are_spaced(month):
+    groups = {GAPS[1]["topic"]: GAPS[0]["topic"]}
+    last_seen = {}
+    for day, entries in enumerate(entries_by_day(month)):
+        for entry in entries:
+            key = groups.get(entry["topic"], entry["topic"])
+            if key in last_seen:
+                assert day - last_seen[key] >= month.min_topic_gap
+            last_seen[key] = day
+
+def test_one_post_per_platform_per_day_when_caps_must_relax():
+    # Two posts a day is 14 a week, more than the platforms' caps allow together
+    plan = create_plan("DevOps", 14, GAPS, START, posts_per_day=2).plan()
+    assert plan.relaxed_days
+    for day, entries in enumerate(entries_by_day(plan)):
+        assert len(entries) == 2
+        assert len({entry["platform"] for entry in entries}) == 2
+        assert len({entry["topic"] for entry in entries}) == 2
+
+def test_streaming_matches_planning_in_one_go(month):
+    streamed = [entries for _, entries in create_plan("DevOps", 28, GAPS, START).iter_days()]
+    assert streamed == entries_by_day(month)
+
+def test_replanned_day_avoids_banned_topic_and_keeps_constraints():
+    plan = plan_calendar("DevOps", 14, GAPS, START)
+    banned = plan.day_entries(3)[0]["topic"]
+    plan.replan_day(3, banned_topics=[banned])
+    [entry] = plan.day_entries(3)
+    assert entry["topic"] != banned
+    assert (entry["date"], entry["day"]) == ((START + timedelta(days=3)).isoformat(), 4)
+    assert not plan.relaxed_days
+    assert (plan.platform_week <= plan.platform_cap).all()
+
+def test_recent_duplicates_are_ranked_lower():
+    def topics(plan):
+        return Counter(entry["topic"] for day in entries_by_day(plan) for entry in day)
+
+    fresh = topics(plan_calendar("DevOps", 7, GAPS, START))
+    best = fresh.most_common(1)[0][0]
+    penalized = topics(plan_calendar("DevOps", 7, GAPS, START, recent_similarity={best: 1.0}))
+    assert penalized[best] < fresh[best]
@@ -0,0 +1,91 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+from sqlalchemy import update
+from app.config import settings
+from app.database.models import User
+from app.database.session import async_session
+from app.services.auth import auth_service
+from app.services.billing import billing_service
+from app.services.entitlements import EntitlementVersionStore, entitlement_versions
+
+pytestmark = pytest.mark.anyio
+
+def bearer(token: str) -> HTTPAuthorizationCredentials:
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+@pytest.fixture
+async def user(db):
+    return await auth_service.create_user("owner@example.com", "not-a-real-hash", "Owner")
+
+async def upgrade(user_id: int, plan: str):
+    errors = await billing_service.process_webhook_events([{
+        "id": f"evt_{plan}",
+        "type": "checkout.session.completed",
+        "data": {"object": {"client_reference_id": str(user_id), "customer": "cus_1", "metadata": {"plan": plan}}},
+    }])
+    assert not errors
+
+async def assert_stale(token: str):
+    with pytest.raises(HTTPException) as rejected:
+        await auth_service.get_current_entitlements(bearer(token))
+    assert rejected.value.status_code == 401
+    assert "stale_entitlements" in rejected.value.headers["WWW-Authenticate"]
+
+async def test_current_token_carries_the_plan(user):
+    tokens = await auth_service.issue_tokens(user.id, "free")
+    entitlements = await auth_service.get_current_entitlements(bearer(tokens["access_token"]))
+    assert (entitlements.user_id, entitlements.tier) == (user.id, "free")
+
+async def test_plan_change_rejects_tokens_with_the_old_version(user):
+    tokens = await auth_service.issue_tokens(user.id, "free")
+    await upgrade(user.id, "professional")
+    await assert_stale(tokens["access_token"])
+
+    refreshed = await auth_service.refresh_tokens(tokens["refresh_token"])
+    entitlements = await auth_service.get_current_entitlements(bearer(refreshed["access_token"]))
+    assert entitlements.tier == "professional"
+
+async def test_other_workers_see_the_bump_once_their_cache_expires(user):
+    other_worker = EntitlementVersionStore(cache_ttl=0)
+    assert await other_worker.get(user.id) == 0
+    await upgrade(user.id, "starter")
+    assert await other_worker.get(user.id) == 1
+
+async def test_cached_user_is_reloaded_after_a_plan_change_elsewhere(user):
+    assert (await auth_service._load_user(user.id)).subscription_tier == "free"
+    # Another worker's billing update; this worker's user cache still holds the old row
+    async with async_session() as session:
+        await session.execute(
+            update(User).where(User.id == user.id)
+            .values(subscription_tier="starter", entitlements_version=User.entitlements_version + 1)
+        )
+        await session.commit()
+    entitlement_versions.invalidate(user.id)
+    assert (await auth_service._load_user(user.id)).subscription_tier == "starter"
+
+async def test_tokens_issued_against_other_plan_definitions_are_rejected(user):
+    tokens = await auth_service.issue_tokens(user.id, "free")
+    claims = jwt.decode(tokens["access_token"], settings.SECRET_KEY, algorithms=["HS256"])
+    claims["ent"]["plan_ver"] = "00000000"
+    await assert_stale(jwt.encode(claims, settings.SECRET_KEY, algorithm="HS256"))
+
+async def test_tokens_with_a_non_numeric_subject_are_rejected(user):
+    token = jwt.encode({"sub": "user_id", "type": "access"}, settings.SECRET_KEY, algorithm="HS256")
+    with pytest.raises(HTTPException) as rejected:
+        await auth_service.get_current_entitlements(bearer(token))
+    assert rejected.value.status_code == 401
+
+async def test_reused_refresh_token_revokes_every_session(user):
+    first = await auth_service.issue_tokens(user.id, "free")
+    second = await auth_service.issue_tokens(user.id, "free")
+    await auth_service.refresh_tokens(first["refresh_token"])
+
+    with pytest.raises(HTTPException) as reused:
+        await auth_service.refresh_tokens(first["refresh_token"])
+    assert reused.value.status_code == 401
+    # The leak retires outstanding access tokens and the user's other refresh tokens
+    await assert_stale(second["access_token"])
+    with pytest.raises(HTTPException):
+        await auth_service.refresh_tokens(second["refresh_token"])
@@ -0,0 +1,81 @@
+import json
+import pytest
+from sqlalchemy import func, select
+from app.config import settings
+from app.database.models import ContentPost
+from app.database.session import async_session
+from app.services.embeddings import HashingEmbedder
+from app.services.ingestion import IngestionPipeline, ListSource, NDJSONStreamSource
+
+pytestmark = pytest.mark.anyio
+
+def export(count: int, offset: int = 0):
+    return [
+        {
+            "id": f"li-{i}",
+            "platform": "linkedin",
+            "author": "competitor",
+            "text": f"Post number {i} about #devops pipelines",
+            "impressions": 100 + i,
+            "likes": i % 7,
+            "created_at": "2026-10-01T09:00:00Z",
+        }
+        for i in range(offset, offset + count)
+    ]
+
+def pipeline(observed):
+    async def observe(rows):
+        observed.extend(row["dedupe_key"] for row in rows)
+
+    # A new pipeline per run has an empty in-memory window, like a restarted worker
+    return IngestionPipeline(
+        embedder=HashingEmbedder(settings.EMBEDDING_DIM), batch_size=7, insert_chunk=10, embed_workers=2, observers=[observe],
+    )
+
+async def stored_posts() -> int:
+    async with async_session() as session:
+        return await session.scalar(select(func.count()).select_from(ContentPost))
+
+async def test_replaying_an_export_writes_and_indexes_each_post_once(db):
+    observed = []
+    first = await pipeline(observed).run(ListSource(export(40)), defaults={"niche": "DevOps"})
+    assert (first["read"], first["written"], first["duplicates"]) == (40, 40, 0)
+
+    second = await pipeline(observed).run(ListSource(export(40)), defaults={"niche": "DevOps"})
+    assert (second["read"], second["written"], second["duplicates"]) == (40, 0, 40)
+    assert await stored_posts() == 40
+    assert len(observed) == len(set(observed)) == 40
+
+async def test_overlapping_replay_only_adds_the_new_posts(db):
+    observed = []
+    runner = pipeline(observed)
+    await runner.run(ListSource(export(30)))
+    stats = await runner.run(ListSource(export(30, offset=20)))
+    # Posts 20-29 are caught by the in-memory window before they are embedded
+    assert (stats["written"], stats["duplicates"], stats["embedded"]) == (20, 10, 20)
+    assert await stored_posts() == 50
+    assert len(observed) == 50
+
+async def test_repeats_within_one_run_and_invalid_lines_are_skipped(db):
+    lines = [json.dumps(post) for post in export(5) + export(5)] + ["not json", json.dumps({"text": ""})]
+
+    async def body():
+        data = ("\n".join(lines) + "\n").encode()
+        for start in range(0, len(data), 64):
+            yield data[start:start + 64]
+
+    observed = []
+    stats = await pipeline(observed).run(NDJSONStreamSource(body()))
+    assert (stats["read"], stats["invalid"], stats["duplicates"], stats["written"]) == (12, 2, 5, 5)
+    assert await stored_posts() == 5
+
+async def test_posts_without_a_source_id_dedupe_on_their_text(db):
+    posts = [
+        {"platform": "twitter", "author": "a", "text": "Same   TEXT here"},
+        {"platform": "twitter", "author": "a", "text": "same text here"},
+    ]
+    observed = []
+    await pipeline(observed).run(ListSource(posts[:1]))
+    stats = await pipeline(observed).run(ListSource(posts[1:]))
+    assert stats["written"] == 0
+    assert await stored_posts() == 1
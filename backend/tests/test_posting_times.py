@@ -0,0 +1,24 @@
+import json
+from datetime import date, datetime
+import numpy as np
+from app.services.calendar_planner import PLATFORMS, plan_calendar
+from app.services.posting_times import PostingTimes
+
+MONDAY_NINE = datetime(2026, 11, 2, 9)
+
+def test_zero_engagement_brand_plans_finite_calendar():
+    times = PostingTimes()
+    times.record(7, "linkedin", MONDAY_NINE, 0.0, audience="developers")
+    lift = times.lift_table(7, list(PLATFORMS))
+    assert np.isfinite(lift).all()
+    plan = plan_calendar("DevOps", 7, start=date(2026, 11, 2), timing=lift)
+    json.dumps(plan.to_dict(), allow_nan=False)
+
+def test_zero_engagement_brand_follows_all_brands_curve():
+    times = PostingTimes()
+    times.record(1, "linkedin", MONDAY_NINE, 0.08, count=20)
+    times.record(7, "linkedin", MONDAY_NINE, 0.0)
+    platforms = list(PLATFORMS)
+    brand = times.lift_table(7, platforms)
+    assert np.isfinite(brand).all()
+    assert np.allclose(brand, times.lift_table(None, platforms))
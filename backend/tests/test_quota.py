@@ -0,0 +1,64 @@
+import asyncio
+from datetime import timedelta
+import fakeredis.aioredis
+import pytest
+import redis.asyncio
+from app.services import quota
+from app.services.quota import InMemoryQuotaBackend, RedisQuotaBackend
+from app.services.usage_buffer import month_start
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request, monkeypatch):
+    if request.param == "memory":
+        return InMemoryQuotaBackend()
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.asyncio, "from_url", lambda url: fakeredis.aioredis.FakeRedis(server=server))
+    return RedisQuotaBackend("redis://test")
+
+THIS_MONTH = month_start()
+NEXT_MONTH = month_start(THIS_MONTH.replace(day=28) + timedelta(days=4))
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controls the quota period, starting in the current month so counters haven't expired."""
+    state = {"period": THIS_MONTH}
+    monkeypatch.setattr(quota, "month_start", lambda: state["period"])
+    return state
+
+async def test_concurrent_consumers_never_pass_the_limit(backend, clock):
+    results = await asyncio.gather(*(backend.consume(1, "api_calls", limit=10) for _ in range(50)))
+    assert sum(result.allowed for result in results) == 10
+    assert max(result.current for result in results) == 10
+
+async def test_seed_only_applies_to_a_fresh_counter(backend, clock):
+    assert backend.needs_seed(1, "api_calls")
+    first = await backend.consume(1, "api_calls", limit=10, seed=7)
+    assert (first.allowed, first.current) == (True, 8)
+    assert not backend.needs_seed(1, "api_calls")
+    # A later seed, e.g. from another process's stale read, doesn't reset the count
+    second = await backend.consume(1, "api_calls", limit=10, seed=0)
+    assert second.current == 9
+
+async def test_month_rollover_starts_a_new_counter(backend, clock):
+    this_month = await asyncio.gather(*(backend.consume(1, "api_calls", limit=5) for _ in range(8)))
+    assert sum(result.allowed for result in this_month) == 5
+
+    clock["period"] = NEXT_MONTH
+    assert backend.needs_seed(1, "api_calls")
+    next_month = await asyncio.gather(
+        backend.consume(1, "api_calls", limit=5, seed=0),
+        *(backend.consume(1, "api_calls", limit=5) for _ in range(7)),
+    )
+    assert sum(result.allowed for result in next_month) == 5
+
+async def test_requests_spanning_the_rollover_are_counted_in_their_own_month(backend, clock):
+    await backend.consume(1, "api_calls", limit=3, amount=3)
+    assert not (await backend.consume(1, "api_calls", limit=3)).allowed
+
+    clock["period"] = NEXT_MONTH
+    # Next month's counter is independent of this month's exhausted one
+    assert (await backend.consume(1, "api_calls", limit=3)).current == 1
+    clock["period"] = THIS_MONTH
+    assert not (await backend.consume(1, "api_calls", limit=3)).allowed
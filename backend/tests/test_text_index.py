@@ -0,0 +1,122 @@
+import os
+import numpy as np
+import pytest
+from app.database.models import ContentPost
+from app.database.session import async_session
+from app.services.text_index import BM25Index
+
+WORDS = "kubernetes terraform observability pipelines security costs incidents caching rollout latency".split()
+
+def post(i: int):
+    # Seeded by id, so a post reads the same whichever batch it is built in
+    rng = np.random.default_rng(i)
+    words = rng.choice(WORDS, size=int(rng.integers(3, 12)))
+    return {"id": i, "content_text": " ".join(words) + f" post{i}", "is_competitor": i % 3 != 0, "brand_id": i % 2 + 1}
+
+def posts(start: int, count: int):
+    return [post(i) for i in range(start, start + count)]
+
+QUERIES = [
+    ("kubernetes costs", {}),
+    ("terraform rollout latency", {"competitor": True}),
+    ("security", {"competitor": False}),
+    ("observ", {"prefix": True}),
+    ("post12", {}),
+    ("kubernetes security", {"brand_ids": [2]}),
+]
+
+def results(index: BM25Index):
+    return [index.search(query, k=10, **options) for query, options in QUERIES]
+
+def assert_same(left, right):
+    for (left_ids, left_scores), (right_ids, right_scores) in zip(left, right):
+        assert np.array_equal(left_ids, right_ids)
+        np.testing.assert_allclose(left_scores, right_scores, rtol=1e-6)
+
+def test_snapshot_round_trip_matches_the_live_index(tmp_path):
+    # A low merge threshold leaves postings both in the CSR arrays and in the tail
+    index = BM25Index(str(tmp_path), merge_threshold=200)
+    index.add(posts(1, 150))
+    index.add(posts(151, 7))
+    assert index.tail
+    index.save()
+
+    loaded = BM25Index(str(tmp_path))
+    assert loaded.load()
+    assert (loaded.size, loaded.total_len, loaded.max_post_id) == (index.size, index.total_len, index.max_post_id)
+    assert isinstance(loaded.doc_ids, np.memmap)
+    assert_same(results(loaded), results(index))
+
+def test_loaded_index_keeps_growing_like_a_fresh_one(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.add(posts(1, 100))
+    index.save()
+
+    loaded = BM25Index(str(tmp_path))
+    loaded.load()
+    loaded.add(posts(101, 60))
+    fresh = BM25Index()
+    fresh.add(posts(1, 160))
+    assert_same(results(loaded), results(fresh))
+
+    # And survives a second round trip
+    loaded.save()
+    reloaded = BM25Index(str(tmp_path))
+    reloaded.load()
+    assert_same(results(reloaded), results(fresh))
+
+def test_save_skips_when_the_published_snapshot_is_as_new(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.add(posts(1, 50))
+    index.save()
+    generation = open(tmp_path / "CURRENT").read()
+
+    stale = BM25Index(str(tmp_path))
+    stale.add(posts(1, 20))
+    stale.save()
+    assert open(tmp_path / "CURRENT").read() == generation
+    assert [entry for entry in os.listdir(tmp_path) if entry.startswith("gen-")] == [generation]
+
+def test_brand_filter_keeps_only_those_brands(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.add(posts(1, 100))
+    ids, _ = index.search("kubernetes", k=100, brand_ids=[1])
+    assert ids.size and all(post(i)["brand_id"] == 1 for i in ids.tolist())
+    assert index.search("kubernetes", k=100, brand_ids=[])[0].size == 0
+
+    index.save()
+    loaded = BM25Index(str(tmp_path))
+    loaded.load()
+    assert np.array_equal(loaded.search("kubernetes", k=100, brand_ids=[1])[0], ids)
+
+def test_snapshot_without_brand_ids_is_not_loaded(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.add(posts(1, 20))
+    index.save()
+    os.remove(tmp_path / open(tmp_path / "CURRENT").read() / "brand_ids.npy")
+    assert not BM25Index(str(tmp_path)).load()
+
+def test_load_without_a_snapshot(tmp_path):
+    assert not BM25Index(str(tmp_path / "missing")).load()
+    assert not BM25Index("").load()
+
+@pytest.mark.anyio
+async def test_load_from_db_backfills_posts_missing_from_the_snapshot(db, tmp_path):
+    rows = posts(1, 40)
+    async with async_session() as session:
+        session.add_all(ContentPost(**row) for row in rows)
+        await session.commit()
+
+    # Another worker published a snapshot that skipped some posts below its max id
+    published = [row for row in rows if row["id"] % 4 and row["id"] <= 30]
+    partial = BM25Index(str(tmp_path))
+    partial.add(published)
+    partial.save()
+
+    index = BM25Index(str(tmp_path))
+    assert await index.load_from_db() == len(rows) - len(published)
+    assert index.size == 40
+    assert sorted(index._post_ids[: index.size].tolist()) == list(range(1, 41))
+    fresh = BM25Index()
+    fresh.add(rows)
+    assert [set(ids.tolist()) for ids, _ in results(index)] == [set(ids.tolist()) for ids, _ in results(fresh)]
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from app.services.vector_index import IVFIndex, normalize_rows, top_k
+
+def clustered(count: int, dim: int = 32, clusters: int = 40, seed: int = 0) -> np.ndarray:
+    # Embeddings of real posts cluster by topic; uniform noise would make every list equally likely
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return centers[rng.integers(clusters, size=count)] + 0.35 * rng.normal(size=(count, dim))
+
+def brute_force(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    return top_k(normalize_rows(queries) @ normalize_rows(vectors).T, k)
+
+def recall(found: np.ndarray, exact: np.ndarray) -> float:
+    return np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found.tolist(), exact.tolist())])
+
+@pytest.fixture(scope="module")
+def data():
+    vectors = clustered(6000)
+    queries = clustered(200, seed=1)
+    return vectors, queries, brute_force(vectors, queries, 10)
+
+def test_small_index_searches_exactly(data):
+    vectors, queries, exact = data
+    index = IVFIndex(32, train_threshold=10000)
+    index.add(vectors)
+    assert index.centroids is None
+    ids, _ = index.search_batch(queries, k=10)
+    assert np.array_equal(ids, exact)
+
+def test_ivf_recall_against_brute_force(data):
+    vectors, queries, exact = data
+    index = IVFIndex(32, nprobe=8, train_threshold=2000)
+    # Added in batches, so the index trains part way and assigns later vectors to existing lists
+    for start in range(0, len(vectors), 1000):
+        index.add(vectors[start:start + 1000])
+    assert index.centroids is not None
+    ids, scores = index.search_batch(queries, k=10)
+    assert recall(ids, exact) >= 0.9
+    # Scores are cosine similarities, best first
+    assert np.all(np.diff(scores, axis=1) <= 1e-6)
+
+def test_probing_every_list_matches_brute_force(data):
+    vectors, queries, exact = data
+    index = IVFIndex(32, train_threshold=2000)
+    index.add(vectors)
+    ids, _ = index.search_batch(queries, k=10, nprobe=index.centroids.shape[0])
+    assert recall(ids, exact) == 1.0
+
+def test_recall_improves_with_nprobe(data):
+    vectors, queries, exact = data
+    index = IVFIndex(32, train_threshold=2000)
+    index.add(vectors)
+    recalls = [recall(index.search_batch(queries, k=10, nprobe=nprobe)[0], exact) for nprobe in (1, 4, 16)]
+    assert recalls == sorted(recalls)
+
+def test_custom_ids_are_returned(data):
+    vectors, queries, exact = data
+    index = IVFIndex(32, train_threshold=2000)
+    index.add(vectors, ids=np.arange(len(vectors)) + 1000)
+    ids, _ = index.search(queries[0], k=10, nprobe=index.centroids.shape[0])
+    assert set(ids.tolist()) == set((exact[0] + 1000).tolist())
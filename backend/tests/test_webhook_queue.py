@@ -0,0 +1,112 @@
+import asyncio
+import pytest
+from sqlalchemy import select
+from app.database.models import User
+from app.database.session import async_session
+from app.services.billing import billing_service
+from app.services.webhook_queue import WebhookQueue
+
+pytestmark = pytest.mark.anyio
+
+def stripe_event(event_id: str, customer: str = "cus_1", event_type: str = "invoice.paid"):
+    return {"id": event_id, "type": event_type, "data": {"object": {"customer": customer}}}
+
+@pytest.fixture
+async def queue(tmp_path):
+    queue = WebhookQueue(str(tmp_path / "queue.db"), max_attempts=3, poll_interval=0.01, retry_delay=0.0)
+    yield queue
+    await queue.stop()
+
+async def wait_for(queue: WebhookQueue, **expected):
+    for _ in range(500):
+        counts = await queue.counts()
+        if all(counts.get(status, 0) == count for status, count in expected.items()):
+            return counts
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"queue counts {await queue.counts()} never reached {expected}")
+
+async def test_redelivered_events_are_dropped_at_insert(queue):
+    assert await queue.enqueue(stripe_event("evt_1"))
+    assert not await queue.enqueue(stripe_event("evt_1"))
+    applied = []
+
+    async def handler(events):
+        applied.extend(event["id"] for event in events)
+
+    await queue.start(handler, workers=1)
+    await wait_for(queue, done=1)
+    # A retry arriving after the event was applied is still a duplicate
+    assert not await queue.enqueue(stripe_event("evt_1"))
+    await asyncio.sleep(0.05)
+    assert applied == ["evt_1"]
+    assert queue.stats["duplicates"] == 2
+
+async def test_poison_event_is_parked_without_blocking_other_customers(queue):
+    for i in range(5):
+        await queue.enqueue(stripe_event(f"evt_ok_{i}", customer=f"cus_{i}"))
+    await queue.enqueue(stripe_event("evt_poison", customer="cus_bad"))
+    attempts = {}
+
+    async def handler(events):
+        for event in events:
+            attempts[event["id"]] = attempts.get(event["id"], 0) + 1
+        return {event["id"]: "cannot apply" for event in events if event["id"] == "evt_poison"}
+
+    await queue.start(handler, workers=2)
+    await wait_for(queue, done=5, failed=1, pending=0, processing=0)
+    assert attempts["evt_poison"] == 3
+    assert all(attempts[f"evt_ok_{i}"] == 1 for i in range(5))
+
+    [failed] = await queue.failed_events()
+    assert (failed["event_id"], failed["attempts"], failed["last_error"]) == ("evt_poison", 3, "cannot apply")
+
+async def test_failing_batch_is_retried_and_later_events_of_the_customer_wait(queue):
+    await queue.enqueue(stripe_event("evt_first"))
+    await queue.enqueue(stripe_event("evt_second"))
+    applied = []
+    calls = {"count": 0}
+
+    async def handler(events):
+        calls["count"] += 1
+        if calls["count"] == 1:
+            raise RuntimeError("database unavailable")
+        applied.extend(event["id"] for event in events)
+
+    await queue.start(handler, workers=1)
+    await wait_for(queue, done=2)
+    # Same customer, so the retried batch still applies in order
+    assert applied == ["evt_first", "evt_second"]
+    assert queue.stats["failed_batches"] == 1
+
+async def test_replay_requeues_parked_events(queue):
+    await queue.enqueue(stripe_event("evt_poison"))
+    fixed = asyncio.Event()
+
+    async def handler(events):
+        if not fixed.is_set():
+            return {event["id"]: "bug" for event in events}
+
+    await queue.start(handler, workers=1)
+    await wait_for(queue, failed=1)
+    fixed.set()
+    assert await queue.replay(["evt_poison"]) == 1
+    await wait_for(queue, done=1, failed=0)
+
+async def test_billing_batch_rolls_back_only_the_poison_event(db):
+    async with async_session() as session:
+        session.add(User(id=1, email="a@example.com", password_hash="x", name="A"))
+        await session.commit()
+
+    def checkout(event_id: str, reference: str):
+        return {
+            "id": event_id,
+            "type": "checkout.session.completed",
+            "created": 1,
+            "data": {"object": {"client_reference_id": reference, "customer": "cus_1", "metadata": {"plan": "starter"}}},
+        }
+
+    errors = await billing_service.process_webhook_events([checkout("evt_bad", "not-a-user-id"), checkout("evt_ok", "1")])
+    assert list(errors) == ["evt_bad"]
+    async with async_session() as session:
+        user = await session.scalar(select(User).where(User.id == 1))
+    assert (user.subscription_tier, user.entitlements_version) == ("starter", 1)
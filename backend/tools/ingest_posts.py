@@ -0,0 +1,38 @@
+"""
+Replay an NDJSON export of posts into content_posts.
+
+    cd backend && python -m tools.ingest_posts posts.ndjson.gz --niche DevOps --platform linkedin
+
+Each line is one post; see app/services/ingestion.normalize_post for the
+accepted fields. Re-running the same file is safe, repeats are skipped.
+The API's in-memory indexes pick the posts up on its next start.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database.session import init_models
+from app.services.ingestion import NDJSONFileSource, ingestion_pipeline
+
+async def ingest(args):
+    await init_models()
+    defaults = {"niche": args.niche, "platform": args.platform, "is_competitor": not args.own, "brand_id": args.brand_id}
+    return await ingestion_pipeline.run(NDJSONFileSource(args.path), defaults)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--niche")
+    parser.add_argument("--platform")
+    parser.add_argument("--brand-id", type=int)
+    parser.add_argument("--own", action="store_true", help="posts are ours rather than competitors'")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(ingest(args)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Local stand-in for the subset of the Stripe API the backend uses.
+
+    uvicorn tools.stripe_stub:app --port 12111
+    STRIPE_API_BASE=http://localhost:12111 uvicorn app.main:app
+
+Idempotency keys are honoured like Stripe does: replaying a key returns the
+original response. Latency and failures can be injected to exercise the
+client's timeouts and retries:
+
+    STRIPE_STUB_LATENCY_MS=150     fixed delay per request
+    STRIPE_STUB_FAILURE_RATE=0.1   fraction of requests answered with a 500
+"""
+
+import asyncio
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Stripe stub")
+
+LATENCY_MS = float(os.getenv("STRIPE_STUB_LATENCY_MS", "0"))
+FAILURE_RATE = float(os.getenv("STRIPE_STUB_FAILURE_RATE", "0"))
+
+customers: Dict[str, Dict[str, Any]] = {}
+sessions: Dict[str, Dict[str, Any]] = {}
+idempotent_responses: Dict[str, Dict[str, Any]] = {}
+stats = {"requests": 0, "replays": 0, "injected_failures": 0}
+
+def _object_id(prefix: str) -> str:
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+def _decode_form(form) -> Dict[str, Any]:
+    # Undo Stripe's a[b][0][c]=value encoding into nested dicts/lists
+    root: Dict[str, Any] = {}
+    for raw_key, value in form.multi_items():
+        parts = raw_key.replace("]", "").split("[")
+        node = root
+        for part, following in zip(parts, parts[1:]):
+            container = [] if following.isdigit() else {}
+            if isinstance(node, list):
+                index = int(part)
+                while len(node) <= index:
+                    node.append(None)
+                if node[index] is None:
+                    node[index] = container
+                node = node[index]
+            else:
+                node = node.setdefault(part, container)
+        if isinstance(node, list):
+            index = int(parts[-1])
+            while len(node) <= index:
+                node.append(None)
+            node[index] = value
+        else:
+            node[parts[-1]] = value
+    return root
+
+async def _respond(request: Request, build) -> JSONResponse:
+    stats["requests"] += 1
+    if LATENCY_MS:
+        await asyncio.sleep(LATENCY_MS / 1000)
+
+    key = request.headers.get("Idempotency-Key")
+    if key and key in idempotent_responses:
+        stats["replays"] += 1
+        return JSONResponse(idempotent_responses[key], headers={"Idempotent-Replayed": "true"})
+
+    if FAILURE_RATE and random.random() < FAILURE_RATE:
+        stats["injected_failures"] += 1
+        return JSONResponse(
+            {"error": {"type": "api_error", "message": "Injected failure"}},
+            status_code=500,
+            headers={"Stripe-Should-Retry": "true"},
+        )
+
+    body = build(_decode_form(await request.form()))
+    if key:
+        idempotent_responses[key] = body
+    return JSONResponse(body)
+
+@app.post("/v1/customers")
+async def create_customer(request: Request):
+    def build(params):
+        customer = {
+            "id": _object_id("cus"),
+            "object": "customer",
+            "email": params.get("email"),
+            "name": params.get("name"),
+            "created": int(time.time()),
+        }
+        customers[customer["id"]] = customer
+        return customer
+
+    return await _respond(request, build)
+
+@app.get("/v1/customers/{customer_id}")
+async def get_customer(customer_id: str):
+    if customer_id not in customers:
+        return JSONResponse(
+            {"error": {"type": "invalid_request_error", "code": "resource_missing", "message": "No such customer"}},
+            status_code=404,
+        )
+    return customers[customer_id]
+
+@app.post("/v1/checkout/sessions")
+async def create_checkout_session(request: Request):
+    def build(params):
+        session_id = _object_id("cs_test")
+        session = {
+            "id": session_id,
+            "object": "checkout.session",
+            "customer": params.get("customer"),
+            "client_reference_id": params.get("client_reference_id"),
+            "metadata": params.get("metadata", {}),
+            "mode": params.get("mode"),
+            "url": f"https://checkout.stripe.test/pay/{session_id}",
+        }
+        sessions[session_id] = session
+        return session
+
+    return await _respond(request, build)
+
+@app.get("/_stats")
+async def get_stats():
+    return {**stats, "customers": len(customers), "sessions": len(sessions)}
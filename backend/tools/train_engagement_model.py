@@ -0,0 +1,74 @@
+"""
+Fit the engagement model to published posts in content_posts.
+
+    cd backend && python -m tools.train_engagement_model --out engagement_model.npz
+
+Each post becomes one feature row: platform, weekday, hour and its topic's
+smoothed mean engagement as the prior. Posts carry no content type or
+audience, so those features stay at their defaults. The API picks the file
+up from ENGAGEMENT_MODEL_PATH on its next start.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import select
+from app.database.models import ContentPost
+from app.database.session import async_session
+from app.services.engagement_model import PLATFORM_NAMES, EngagementModel, build_features
+
+async def load_posts():
+    async with async_session() as db:
+        result = await db.execute(
+            select(ContentPost.platform, ContentPost.topic, ContentPost.published_at, ContentPost.engagement_rate).where(
+                ContentPost.published_at.is_not(None),
+                ContentPost.engagement_rate > 0,
+                ContentPost.platform.in_(PLATFORM_NAMES),
+            )
+        )
+        return result.all()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default="engagement_model.npz")
+    parser.add_argument("--l2", type=float, default=1.0)
+    parser.add_argument("--smoothing", type=float, default=20.0, help="pseudo-count pulling topic priors to the mean")
+    args = parser.parse_args()
+
+    posts = asyncio.run(load_posts())
+    if len(posts) < 100:
+        sys.exit(f"Only {len(posts)} usable posts; keep using the prior model")
+
+    y = np.array([post.engagement_rate for post in posts])
+    overall = y.mean()
+    totals = defaultdict(lambda: [0.0, 0])
+    for post, value in zip(posts, y):
+        totals[post.topic][0] += value
+        totals[post.topic][1] += 1
+    prior = np.array([
+        (totals[post.topic][0] + args.smoothing * overall) / (totals[post.topic][1] + args.smoothing)
+        for post in posts
+    ])
+
+    X = build_features(
+        np.array([PLATFORM_NAMES.index(post.platform) for post in posts]),
+        np.zeros(len(posts), dtype=np.int64),
+        np.array([post.published_at.weekday() for post in posts]),
+        np.array([post.published_at.hour + post.published_at.minute / 60 for post in posts]),
+        prior,
+        np.zeros(len(posts), dtype=np.int64),
+    )
+    model = EngagementModel.fit(X, y, l2=args.l2)
+    residual = np.log(y) - X @ model.weights
+    print(f"fitted on {len(posts)} posts, RMSE in log space {np.sqrt(np.mean(residual ** 2)):.3f}")
+    model.save(args.out)
+    print(f"wrote {args.out}")
+
+if __name__ == "__main__":
+    main()
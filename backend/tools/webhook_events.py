@@ -0,0 +1,46 @@
+"""
+List or replay Stripe webhook events parked as failed in the local queue.
+
+    cd backend && python -m tools.webhook_events list
+    cd backend && python -m tools.webhook_events replay evt_123 evt_456
+    cd backend && python -m tools.webhook_events replay --all
+
+Replayed events go back to pending with fresh attempts; a running API's
+queue workers pick them up within their poll interval.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.services.webhook_queue import WebhookQueue
+
+async def run(args):
+    queue = WebhookQueue(settings.WEBHOOK_QUEUE_PATH)
+    try:
+        if args.command == "list":
+            return {"counts": await queue.counts(), "failed": await queue.failed_events(args.limit)}
+        if not args.all and not args.event_ids:
+            raise SystemExit("give event ids to replay, or --all")
+        return {"replayed": await queue.replay(None if args.all else args.event_ids)}
+    finally:
+        await queue.stop()
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    listing = commands.add_parser("list")
+    listing.add_argument("--limit", type=int, default=100)
+    replay = commands.add_parser("replay")
+    replay.add_argument("event_ids", nargs="*")
+    replay.add_argument("--all", action="store_true")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+if __name__ == "__main__":
+    main()